@@ -0,0 +1,320 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from catalog import category_of, open_db
+from rttm import read_rttm, merge_segments, MERGE_GAP, MIN_DURATION
+from rttm_analysis import speaker_turns
+from worker_pool import chunk_size, spawn_executor
+
+logger = logging.getLogger(__name__)
+
+# Processes scoring new or changed files
+DEFAULT_WORKERS = 4
+# Batches smaller than this are scored in the calling thread (not worth starting the pool)
+INLINE_BATCH = 32
+# Boundaries that moved by at most this many seconds count as unchanged (saved RTTMs keep milliseconds)
+BOUNDARY_TOLERANCE = 0.01
+# An edited segment is matched to an original one when their intersection-over-union is at least this
+MATCH_IOU = 0.5
+# IoU margin by which a same-speaker candidate beats a different-speaker one
+SAME_SPEAKER_BONUS = 0.05
+# Decimal places the disagreement times are rounded to, so the floating-point residue of the
+# sweep doesn't show up as error on unchanged files (RTTM times have millisecond precision)
+TIME_DECIMALS = 6
+
+# Per-file figures that are summed into category and corpus totals
+TOTAL_FIELDS = ('original_segments', 'edited_segments', 'unchanged', 'shifted', 'relabeled', 'added', 'deleted',
+                'shift_seconds', 'original_speech', 'edited_speech', 'missed', 'false_alarm', 'confusion')
+# Columns of the per-file CSV export
+CSV_FIELDS = ('rttm_file', 'category', 'der', 'changed_percent', 'mean_shift') + TOTAL_FIELDS
+
+# Bumped when the meaning of cached results changes (1: disagreement times are rounded)
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agreement (
+    path TEXT PRIMARY KEY,
+    original_size INTEGER NOT NULL,
+    original_mtime_ns INTEGER NOT NULL,
+    saved_size INTEGER NOT NULL,
+    saved_mtime_ns INTEGER NOT NULL,
+    result TEXT NOT NULL
+);
+"""
+
+
+def _common_codes(original, edited):
+    """Speaker codes of both column sets re-expressed over one shared speaker list"""
+    names = sorted(set(original['speakers']) | set(edited['speakers']))
+    index = {name: i for i, name in enumerate(names)}
+    remap = [np.array([index[name] for name in columns['speakers']], dtype=np.int64) for columns in (original, edited)]
+    return [remap[0][original['speaker']] if len(original['speaker']) else original['speaker'].astype(np.int64),
+            remap[1][edited['speaker']] if len(edited['speaker']) else edited['speaker'].astype(np.int64)]
+
+
+def match_segments(ref_start, ref_end, ref_speaker, hyp_start, hyp_end, hyp_speaker):
+    """
+    One-to-one matching of edited (hyp) to original (ref) segments. Each edited segment looks
+    at the originals starting nearest to it and takes the one it overlaps best (the same
+    speaker wins near-ties), if their IoU is at least MATCH_IOU; an original claimed by several
+    edited segments goes to the best of them. Returns (hyp indices, ref indices) of the matched pairs.
+    """
+    if not len(ref_start) or not len(hyp_start):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(ref_start, kind='stable')
+    position = np.searchsorted(ref_start[order], hyp_start)
+    # Candidate originals: the two starting before each edited segment and the two after
+    candidates = order[np.clip(position[:, None] + np.arange(-2, 2), 0, len(order) - 1)]
+    intersection = np.clip(np.minimum(ref_end[candidates], hyp_end[:, None]) -
+                           np.maximum(ref_start[candidates], hyp_start[:, None]), 0.0, None)
+    union = np.maximum(ref_end[candidates], hyp_end[:, None]) - np.minimum(ref_start[candidates], hyp_start[:, None])
+    iou = np.where(union > 0, intersection / np.where(union > 0, union, 1.0), 0.0)
+    same = ref_speaker[candidates] == hyp_speaker[:, None]
+    rank = iou + SAME_SPEAKER_BONUS * same
+    best = np.argmax(rank, axis=1)
+    hyp = np.arange(len(hyp_start))
+    ref = candidates[hyp, best]
+    matched = iou[hyp, best] >= MATCH_IOU
+    hyp, ref, rank = hyp[matched], ref[matched], rank[hyp, best][matched]
+
+    # Best-ranked pair first, so np.unique keeps it for each original
+    by_rank = np.argsort(-rank, kind='stable')
+    _, first = np.unique(ref[by_rank], return_index=True)
+    keep = by_rank[first]
+    return hyp[keep], ref[keep]
+
+
+def disagreement(ref_start, ref_end, ref_speaker, hyp_start, hyp_end, hyp_speaker):
+    """
+    DER-style comparison by an exact sweep over both label sets (no frame grid). Each
+    speaker's segments are first merged into turns, so a speaker is counted once at any
+    instant. Returns seconds of original speech, edited speech, missed speech, false alarm
+    and speaker confusion, with the original labels as the reference, rounded to TIME_DECIMALS.
+    """
+    empty = np.zeros(0)
+    ref_turns = speaker_turns(ref_start, ref_end, ref_speaker) if len(ref_start) else (empty, empty)
+    hyp_turns = speaker_turns(hyp_start, hyp_end, hyp_speaker) if len(hyp_start) else (empty, empty)
+    ref_speech = round(float((ref_turns[1] - ref_turns[0]).sum()), TIME_DECIMALS)
+    hyp_speech = round(float((hyp_turns[1] - hyp_turns[0]).sum()), TIME_DECIMALS)
+
+    # Speakers active at each instant in either set
+    times = np.concatenate((ref_turns[0], ref_turns[1], hyp_turns[0], hyp_turns[1]))
+    if not len(times):
+        return ref_speech, hyp_speech, 0.0, 0.0, 0.0
+    n_ref, n_hyp = len(ref_turns[0]), len(hyp_turns[0])
+    ref_delta = np.concatenate((np.ones(n_ref), -np.ones(n_ref), np.zeros(2 * n_hyp)))
+    hyp_delta = np.concatenate((np.zeros(2 * n_ref), np.ones(n_hyp), -np.ones(n_hyp)))
+    order = np.argsort(times, kind='stable')
+    lengths = np.diff(times[order])
+    ref_active = np.cumsum(ref_delta[order])[:-1]
+    hyp_active = np.cumsum(hyp_delta[order])[:-1]
+
+    # Time where a speaker is active in both sets: shifting each speaker's turns into a span
+    # of its own makes this the overlap of two sets of disjoint intervals
+    span = float(max(ref_end.max() if len(ref_end) else 0.0, hyp_end.max() if len(hyp_end) else 0.0) -
+                 min(ref_start.min() if len(ref_start) else 0.0, hyp_start.min() if len(hyp_start) else 0.0, 0.0)) + 1.0
+    ref_shifted = speaker_turns(ref_start + ref_speaker * span, ref_end + ref_speaker * span,
+                                np.zeros(len(ref_start), dtype=np.int64)) if len(ref_start) else (empty, empty)
+    hyp_shifted = speaker_turns(hyp_start + hyp_speaker * span, hyp_end + hyp_speaker * span,
+                                np.zeros(len(hyp_start), dtype=np.int64)) if len(hyp_start) else (empty, empty)
+    shifted_times = np.concatenate((ref_shifted[0], ref_shifted[1], hyp_shifted[0], hyp_shifted[1]))
+    shifted_delta = np.concatenate((np.ones(len(ref_shifted[0])), -np.ones(len(ref_shifted[0])),
+                                    np.ones(len(hyp_shifted[0])), -np.ones(len(hyp_shifted[0]))))
+    shifted_order = np.argsort(shifted_times, kind='stable')
+    shifted_active = np.cumsum(shifted_delta[shifted_order])[:-1]
+    correct = float(np.diff(shifted_times[shifted_order])[shifted_active >= 2].sum()) if len(shifted_times) else 0.0
+
+    missed = round(float((lengths * np.clip(ref_active - hyp_active, 0, None)).sum()), TIME_DECIMALS)
+    false_alarm = round(float((lengths * np.clip(hyp_active - ref_active, 0, None)).sum()), TIME_DECIMALS)
+    # Difference of two sums of the same time: rounded, so identical labels give exactly 0
+    confusion = round(float((lengths * np.minimum(ref_active, hyp_active)).sum()) - correct, TIME_DECIMALS)
+    return ref_speech, hyp_speech, missed, false_alarm, max(confusion, 0.0)
+
+
+def compare_columns(original, edited):
+    """
+    Compare edited labels against the original ones (both as read_rttm()/merge_segments()
+    columns): segments unchanged, with shifted boundaries, relabeled, added and deleted,
+    plus the DER-style time breakdown of disagreement().
+    """
+    ref_speaker, hyp_speaker = _common_codes(original, edited)
+    ref_start = np.asarray(original['start'], dtype=np.float64)
+    ref_end = ref_start + np.asarray(original['duration'], dtype=np.float64)
+    hyp_start = np.asarray(edited['start'], dtype=np.float64)
+    hyp_end = hyp_start + np.asarray(edited['duration'], dtype=np.float64)
+
+    hyp, ref = match_segments(ref_start, ref_end, ref_speaker, hyp_start, hyp_end, hyp_speaker)
+    same = ref_speaker[ref] == hyp_speaker[hyp]
+    shift = np.abs(ref_start[ref] - hyp_start[hyp]) + np.abs(ref_end[ref] - hyp_end[hyp])
+    moved = (np.abs(ref_start[ref] - hyp_start[hyp]) > BOUNDARY_TOLERANCE) | (np.abs(ref_end[ref] - hyp_end[hyp]) > BOUNDARY_TOLERANCE)
+
+    ref_speech, hyp_speech, missed, false_alarm, confusion = disagreement(
+        ref_start, ref_end, ref_speaker, hyp_start, hyp_end, hyp_speaker)
+    return {
+        'original_segments': len(ref_start),
+        'edited_segments': len(hyp_start),
+        'unchanged': int((same & ~moved).sum()),
+        'shifted': int((same & moved).sum()),
+        'relabeled': int((~same).sum()),
+        'added': len(hyp_start) - len(hyp),
+        'deleted': len(ref_start) - len(ref),
+        'shift_seconds': float(shift[same & moved].sum()),
+        'original_speech': ref_speech,
+        'edited_speech': hyp_speech,
+        'missed': missed,
+        'false_alarm': false_alarm,
+        'confusion': confusion,
+    }
+
+
+def finish_totals(totals):
+    """Add the derived rates to summed TOTAL_FIELDS (works for single files and aggregates alike)"""
+    error = totals['missed'] + totals['false_alarm'] + totals['confusion']
+    reference = totals['original_speech']
+    totals['der'] = 100.0 * error / reference if reference > 0 else (100.0 if error > 0 else 0.0)
+    matched = totals['unchanged'] + totals['shifted'] + totals['relabeled']
+    totals['changed_percent'] = (100.0 * (totals['edited_segments'] - totals['unchanged']) / totals['edited_segments']
+                                 if totals['edited_segments'] else 0.0)
+    totals['mean_shift'] = totals['shift_seconds'] / totals['shifted'] if totals['shifted'] else 0.0
+    totals['matched'] = matched
+    return totals
+
+
+def score_file(task):
+    """Worker: compare one file's saved labels with its original RTTM, merged the way the editor loaded it"""
+    original_path, saved_path, merge_gap, min_duration = task
+    original = merge_segments(read_rttm(original_path), merge_gap, min_duration)
+    return compare_columns(original, read_rttm(saved_path))
+
+
+def score_file_safely(task):
+    """score_file(), logging failures and returning None instead of raising"""
+    try:
+        return score_file(task)
+    except Exception as e:
+        logger.warning(f"Could not score agreement for {task[0]}: {str(e)}")
+        return None
+
+
+class AgreementStore:
+    """
+    Original-vs-edited agreement of every file with saved labels, cached in SQLite by the
+    size and mtime of both RTTMs, so a refresh only scores files whose original or saved
+    labels changed. Misses are scored in a process pool.
+    """
+
+    def __init__(self, db_path, workers=DEFAULT_WORKERS, merge_gap=MERGE_GAP, min_duration=MIN_DURATION):
+        self.db_path = db_path
+        self.workers = workers
+        self.merge_gap = merge_gap
+        self.min_duration = min_duration
+        self.lock = threading.Lock()
+        self._executor = None
+
+        self.conn = open_db(db_path, SCHEMA)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.conn.execute('DELETE FROM agreement')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.commit()
+
+        # original path -> ((original stat, saved stat), result dict)
+        self._cache = {}
+        for path, original_size, original_mtime_ns, saved_size, saved_mtime_ns, result in self.conn.execute(
+                'SELECT path, original_size, original_mtime_ns, saved_size, saved_mtime_ns, result FROM agreement'):
+            self._cache[path] = (((original_size, original_mtime_ns), (saved_size, saved_mtime_ns)), json.loads(result))
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = spawn_executor(self.workers)
+        return self._executor
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def lookup(self, pairs):
+        """
+        Comparison results for each (original path, original stat, saved path, saved stat)
+        in `pairs`, scoring entries missing from the cache. Unreadable files map to None.
+        """
+        results = {}
+        stale = []
+        with self.lock:
+            for original_path, original_stat, saved_path, saved_stat in pairs:
+                key = (tuple(original_stat), tuple(saved_stat))
+                cached = self._cache.get(original_path)
+                if cached is not None and cached[0] == key:
+                    results[original_path] = cached[1]
+                else:
+                    stale.append((original_path, saved_path, key))
+        if not stale:
+            return results
+
+        started = time.time()
+        tasks = [(original_path, saved_path, self.merge_gap, self.min_duration) for original_path, saved_path, _ in stale]
+        if len(tasks) < INLINE_BATCH:
+            computed = [score_file_safely(task) for task in tasks]
+        else:
+            computed = list(self._pool().map(score_file_safely, tasks, chunksize=chunk_size(len(tasks), self.workers)))
+
+        rows = []
+        with self.lock:
+            for (original_path, _, key), values in zip(stale, computed):
+                results[original_path] = values
+                if values is None:
+                    continue
+                self._cache[original_path] = (key, values)
+                rows.append((original_path, key[0][0], key[0][1], key[1][0], key[1][1], json.dumps(values)))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO agreement '
+                '(path, original_size, original_mtime_ns, saved_size, saved_mtime_ns, result) VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+            self.conn.commit()
+        logger.info(f"Agreement scored for {len(stale)} files in {time.time() - started:.3f}s")
+        return results
+
+    def summarize(self, catalog):
+        """
+        Agreement of every file with saved labels: per-file results (sorted by disagreement,
+        worst first) and totals per category and for the corpus.
+        """
+        pairs = []
+        for rttm_file in catalog.rttm_files():
+            saved_stat = catalog.saved_label_stat(rttm_file)
+            original_stat = catalog.rttm.stat(rttm_file)
+            if saved_stat is None or original_stat is None:
+                continue
+            pairs.append((rttm_file, os.path.join(catalog.rttm_dir, rttm_file), original_stat,
+                          os.path.join(catalog.labels_dir, catalog.saved_label_rel_path(rttm_file)), saved_stat))
+        results = self.lookup([pair[1:] for pair in pairs])
+
+        files = []
+        categories = {}
+        totals = dict.fromkeys(TOTAL_FIELDS, 0)
+        for rttm_file, original_path, _, _, _ in pairs:
+            values = results.get(original_path)
+            if values is None:
+                continue
+            category = category_of(rttm_file)
+            counts = categories.setdefault(category, dict.fromkeys(TOTAL_FIELDS, 0) | {'files': 0})
+            counts['files'] += 1
+            for field in TOTAL_FIELDS:
+                counts[field] += values[field]
+                totals[field] += values[field]
+            files.append(finish_totals(dict(values, rttm_file=rttm_file, category=category)))
+
+        for counts in categories.values():
+            finish_totals(counts)
+        files.sort(key=lambda item: (-item['der'], item['rttm_file']))
+        totals = finish_totals(totals)
+        totals['files'] = len(files)
+        totals['categories'] = dict(sorted(categories.items()))
+        return {'totals': totals, 'files': files}
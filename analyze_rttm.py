@@ -0,0 +1,164 @@
+"""
+Check a corpus of RTTM files for labeling problems and rank the files for review.
+
+Every file under RTTM_DIR (or every file in a list) is merged the way the editor
+loads it (saved labels are used where a file has them, unless --original) and
+checked for overlapping speakers, same-speaker overlaps, slivers, long unlabeled
+gaps and segments past the end of the audio, spread across a process pool. The
+files are then ranked by their attention score, worst first.
+
+Examples:
+    python analyze_rttm.py --top 50
+    python analyze_rttm.py --categories baodanang_audio --output worklist.tsv
+    python analyze_rttm.py --original --files todo.txt --output worklist.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import soundfile as sf
+
+from normalize_rttm import find_rttm_files, read_file_list, PROGRESS_INTERVAL
+from rttm import read_rttm, merge_segments, MERGE_GAP, MIN_DURATION
+from rttm_analysis import analyze_segments, ISSUE_TYPES, SLIVER_DURATION, LONG_GAP
+from worker_pool import chunk_size
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RTTM_DIR = os.path.join(BASE_DIR, "combined_dataset/rttm")
+DEFAULT_AUDIO_DIR = os.path.join(BASE_DIR, "combined_dataset/preprocessed")
+DEFAULT_LABELS_DIR = os.path.join(BASE_DIR, "combined_dataset/labels_diarization")
+
+# Issues kept per file in JSON output (the counts always cover everything)
+ISSUES_PER_FILE = 20
+
+
+def analyze_file(task):
+    """Worker: load one file's segments and analyze them. Returns a result dict."""
+    rel_path, rttm_dir, audio_dir, labels_dir, merge_gap, min_duration, sliver_duration, long_gap = task
+    file_id = os.path.basename(rel_path).replace('.rttm', '')
+    rel_dir = os.path.dirname(rel_path)
+    result = {'path': rel_path, 'source': 'original'}
+    try:
+        # Saved labels are analyzed as saved; originals are merged like the editor merges them
+        saved_path = os.path.join(labels_dir, rel_dir, file_id, f"{file_id}.rttm") if labels_dir else None
+        if saved_path and os.path.exists(saved_path):
+            columns = read_rttm(saved_path)
+            result['source'] = 'saved'
+        else:
+            columns = merge_segments(read_rttm(os.path.join(rttm_dir, rel_path)), merge_gap, min_duration)
+
+        audio_duration = None
+        for audio_path in (os.path.join(audio_dir, rel_dir, f"{file_id}.wav"), os.path.join(audio_dir, f"{file_id}.wav")):
+            if os.path.exists(audio_path):
+                audio_duration = sf.info(audio_path).duration
+                break
+        result['audio_found'] = audio_duration is not None
+
+        analysis = analyze_segments(columns['start'], columns['duration'], columns['speaker'], audio_duration,
+                                    sliver_duration=sliver_duration, long_gap=long_gap, max_issues=ISSUES_PER_FILE)
+        analysis['issues'] = analysis['issues'][:ISSUES_PER_FILE]
+        result.update(analysis)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        result['traceback'] = traceback.format_exc()
+    return result
+
+
+def write_worklist(results, output_path):
+    """Write ranked results as JSON (.json) or TSV (anything else; '-' for stdout)"""
+    if output_path.endswith('.json'):
+        with open(output_path, 'w') as f:
+            json.dump({'files': results}, f, indent=1)
+        return
+
+    lines = ['\t'.join(['rank', 'path', 'source', 'score', 'segments', 'speakers', 'overlap_percent', 'gap_percent'] +
+                       list(ISSUE_TYPES))]
+    for rank, result in enumerate(results, 1):
+        lines.append('\t'.join([str(rank), result['path'], result['source'], f"{result['score']:.3f}",
+                                str(result['segments']), str(result['speakers']),
+                                f"{result['overlap_percent']:.2f}", f"{result['gap_percent']:.2f}"] +
+                               [str(result['counts'][name]) for name in ISSUE_TYPES]))
+    text = '\n'.join(lines) + '\n'
+    if output_path == '-':
+        sys.stdout.write(text)
+    else:
+        with open(output_path, 'w') as f:
+            f.write(text)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Find labeling problems across an RTTM corpus and rank files for review")
+    parser.add_argument('--rttm-dir', default=DEFAULT_RTTM_DIR, help="Root of the RTTM corpus (default: %(default)s)")
+    parser.add_argument('--audio-dir', default=DEFAULT_AUDIO_DIR, help="Root of the audio files, for past-the-end checks (default: %(default)s)")
+    parser.add_argument('--labels-dir', default=DEFAULT_LABELS_DIR, help="Root of the saved labels (default: %(default)s)")
+    parser.add_argument('--original', action='store_true', help="Analyze the original RTTM files even where saved labels exist")
+    parser.add_argument('--files', help="Text file listing RTTM paths (relative to --rttm-dir or absolute) instead of walking it")
+    parser.add_argument('--categories', nargs='+', help="Only walk these top-level subdirectories of --rttm-dir")
+    parser.add_argument('--merge-gap', type=float, default=MERGE_GAP, help="Merge same-speaker segments separated by at most this many seconds (default: %(default)s)")
+    parser.add_argument('--min-duration', type=float, default=MIN_DURATION, help="Drop merged segments shorter than this (default: %(default)s)")
+    parser.add_argument('--sliver', type=float, default=SLIVER_DURATION, help="Report segments shorter than this many seconds (default: %(default)s)")
+    parser.add_argument('--long-gap', type=float, default=LONG_GAP, help="Report unlabeled stretches longer than this many seconds (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores, %(default)s)")
+    parser.add_argument('--chunksize', type=int, default=0, help="Files handed to a worker at a time (default: automatic)")
+    parser.add_argument('--top', type=int, default=0, help="Only list the N highest-scoring files (default: all)")
+    parser.add_argument('--output', default='-', help="Worklist path: .json for full results, otherwise TSV (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rttm_dir = os.path.abspath(args.rttm_dir)
+    audio_dir = os.path.abspath(args.audio_dir)
+    labels_dir = None if args.original else os.path.abspath(args.labels_dir)
+
+    if args.files:
+        rel_paths = read_file_list(args.files, rttm_dir)
+    else:
+        rel_paths = find_rttm_files(rttm_dir, args.categories)
+
+    tasks = [(rel_path, rttm_dir, audio_dir, labels_dir, args.merge_gap, args.min_duration, args.sliver, args.long_gap)
+             for rel_path in rel_paths]
+    print(f"{len(tasks)} RTTM files to analyze with {args.workers} workers", file=sys.stderr)
+    if not tasks:
+        return 0
+
+    chunksize = args.chunksize or chunk_size(len(tasks), args.workers)
+
+    results = []
+    processed = failed = segments = 0
+    started = last_report = time.time()
+    with multiprocessing.Pool(args.workers) as pool:
+        for result in pool.imap_unordered(analyze_file, tasks, chunksize=chunksize):
+            processed += 1
+            if 'error' in result:
+                failed += 1
+                print(f"ERROR {result['path']}: {result['error']}", file=sys.stderr)
+                continue
+            results.append(result)
+            segments += result['segments']
+
+            now = time.time()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                elapsed = now - started
+                print(f"[{processed}/{len(tasks)}] {processed / elapsed:.1f} files/s, "
+                      f"{segments / elapsed:.0f} segments/s", file=sys.stderr)
+
+    # Worst first; ties keep path order so reruns produce the same worklist
+    results.sort(key=lambda result: (-result['score'], result['path']))
+    if args.top:
+        results = results[:args.top]
+    write_worklist(results, args.output)
+
+    elapsed = max(time.time() - started, 1e-9)
+    print(f"Analyzed {processed - failed} files ({failed} failed) in {elapsed:.1f}s: "
+          f"{(processed - failed) / elapsed:.1f} files/s, {segments} segments", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,143 +1,294 @@
 import os
-import shutil
+import sys
 import time
 import traceback
-from flask import Flask, render_template, request, jsonify, send_from_directory, abort, url_for
+import struct
+import bisect
+import gzip
+import hashlib
+import csv
+import io
+from flask import Flask, render_template, request, jsonify, abort, url_for, Response, session, g
 import soundfile as sf
-import numpy as np
 import json
-import librosa
-import glob
-from datetime import datetime
+from datetime import datetime, timezone
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.security import safe_join
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from audio_io import (read_wav_header, read_wav_segment, read_wav_segments, segment_byte_range,
+                      make_wav_header, STREAM_CHUNK_SIZE)
+from segment_cache import SegmentCache
+from catalog import CatalogStore, Catalog, category_of
+from dir_listing import DirectoryLister
+from corpus_stats import CorpusStats
+from agreement import AgreementStore, CSV_FIELDS as AGREEMENT_CSV_FIELDS
+from segment_db import SegmentDB
+from rttm import parse_rttm, RttmParseError, MERGE_GAP, MIN_DURATION
+from segment_index import get_segment_index, columns_from_segments
+from rttm_analysis import analyze_segments, analyze_segment_dicts
+from label_store import LabelStore, VersionConflict, LabelLocked
+from waveform import get_peak_pyramid, peek_peak_pyramid, peak_cache_path, select_level, peaks_window
+from work_queue import WorkQueue, QueueFull
+from preview import PreviewStore
+from prefetch import WarmupScheduler, prime_page_cache
+import spectrogram
+from spectrogram import SpectrogramTiles
+import metrics
+from metrics import timed
 
 app = Flask(__name__)
 
 # Configuration
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Parent of the label_tool and combined_dataset directories (LABEL_TOOL_BASE_DIR overrides it,
+# e.g. to point the app at a synthetic corpus for benchmarks)
+BASE_DIR = os.environ.get('LABEL_TOOL_BASE_DIR') or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DEFAULT_RTTM_DIR = os.path.join(BASE_DIR, "combined_dataset/rttm")
 DEFAULT_AUDIO_DIR = os.path.join(BASE_DIR, "combined_dataset/preprocessed")
 LABELS_DIR = os.path.join(BASE_DIR, "combined_dataset/labels_diarization")
-TEMP_DIR = os.path.join(BASE_DIR, "label_tool/static/temp")
+CACHE_DIR = os.path.join(BASE_DIR, "label_tool/cache")
+# Outside static/, so cached clips are only reachable through the segment routes
+SEGMENT_CACHE_DIR = os.path.join(CACHE_DIR, "segments")
+PEAKS_CACHE_DIR = os.path.join(CACHE_DIR, "peaks")
 
-# Current paths that can be changed via the UI
-RTTM_DIR = DEFAULT_RTTM_DIR
-AUDIO_DIR = DEFAULT_AUDIO_DIR
+# Size bounds for the extracted segment cache: memory per worker process, disk shared by all of them
+SEGMENT_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+SEGMENT_CACHE_DISK_BYTES = 1024 * 1024 * 1024
+# A cache-warming batch extracts at most this many bytes of clips, this many segments per read pass
+BATCH_CACHE_BYTES = SEGMENT_CACHE_MEMORY_BYTES // 4
+BATCH_CHUNK_SEGMENTS = 64
+# A "packed" batch response holds all of its clips in memory; larger requests are refused with 413
+BATCH_PACKED_BYTES = 64 * 1024 * 1024
+# Heavy audio work (extraction, header probing, peak building) runs on a bounded queue:
+# at most AUDIO_WORKERS jobs at once and AUDIO_QUEUE_DEPTH queued or running per process
+AUDIO_WORKERS = 4
+AUDIO_QUEUE_DEPTH = 64
+# Seconds a request waits for its audio job before answering 503
+AUDIO_JOB_TIMEOUT = 60
+# Compressed previews for the full-audio player ('opus', or 'flac' for lossless)
+PREVIEW_FORMAT = 'opus'
+PREVIEW_SAMPLE_RATE = 16000
+PREVIEW_WORKERS = 2
+# JSON responses larger than this are gzip/brotli-compressed when the client accepts it
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Disk budget for cached spectrogram tiles
+SPECTROGRAM_CACHE_BYTES = 512 * 1024 * 1024
+# Add a Server-Timing header (per-stage durations) to every response
+SERVER_TIMING = True
+# Processes reading audio headers and RTTMs for /stats
+CORPUS_STATS_WORKERS = 4
+# Processes comparing saved labels with their originals for /stats and /agreement
+AGREEMENT_WORKERS = 4
+# Threads reading RTTMs into the corpus-wide segment search database, and results per /search page
+SEGMENT_DB_WORKERS = 8
+SEARCH_PAGE_SIZE = 100
+# Folder browser: subdirectories per page, seconds a listing is reused, and directories per hints request
+DIRECTORY_PAGE_SIZE = 200
+DIRECTORY_LISTING_TTL = 15.0
+MAX_HINT_PATHS = 200
+# Warm-up after a file is loaded: the next PREFETCH_FILES files of its category get their RTTMs
+# parsed, the first PREFETCH_AUDIO_BYTES of their audio read ahead and their first
+# PREFETCH_SEGMENTS segments extracted (PREFETCH_PREVIEWS also queues their full-audio previews)
+PREFETCH_FILES = 3
+PREFETCH_SEGMENTS = 8
+PREFETCH_AUDIO_BYTES = 32 * 1024 * 1024
+PREFETCH_PREVIEWS = False
 
 # Create directories if they don't exist
-os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(LABELS_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
-# Clean up temporary files
-def cleanup_temp_files(older_than_seconds=3600):
+def load_secret_key():
     """
-    Delete temporary files from TEMP_DIR.
-    If older_than_seconds is None, delete all files regardless of age.
-    If older_than_seconds is a number, only delete files older than that many seconds.
+    Key that signs the session cookie. Every worker process must use the same key, so it
+    comes from LABEL_TOOL_SECRET_KEY or from a key file created once in CACHE_DIR.
     """
+    if os.environ.get('LABEL_TOOL_SECRET_KEY'):
+        return os.environ['LABEL_TOOL_SECRET_KEY']
+    key_path = os.path.join(CACHE_DIR, 'secret_key')
     try:
-        file_count = 0
-        current_time = time.time()
-        
-        if not os.path.exists(TEMP_DIR):
-            app.logger.warning(f"Temp directory does not exist: {TEMP_DIR}")
-            return
-            
-        for file in os.listdir(TEMP_DIR):
-            file_path = os.path.join(TEMP_DIR, file)
-            if os.path.isfile(file_path):
-                # If older_than_seconds is None, delete all files
-                # Otherwise, only delete files older than the specified time
-                if older_than_seconds is None or (current_time - os.path.getmtime(file_path)) > older_than_seconds:
-                    try:
-                        os.remove(file_path)
-                        file_count += 1
-                        app.logger.debug(f"Deleted temp file: {file_path}")
-                    except Exception as e:
-                        app.logger.error(f"Error deleting temp file {file_path}: {str(e)}")
-        
-        app.logger.info(f"Cleaned up {file_count} temporary files from {TEMP_DIR}")
-    except Exception as e:
-        app.logger.error(f"Error during cleanup of temp files: {str(e)}")
-        app.logger.error(traceback.format_exc())
+        # O_EXCL: when several workers start at once only the first one writes the key
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.urandom(32).hex())
+    except FileExistsError:
+        pass
+    # Another worker may still be writing the key it just created
+    for _ in range(50):
+        with open(key_path, 'r') as f:
+            key = f.read().strip()
+        if key:
+            return key
+        time.sleep(0.1)
+    raise RuntimeError(f"Empty secret key file: {key_path}")
 
-# RTTM format: SPEAKER file_id channel start_time duration <NA> <NA> speaker_id <NA> <NA>
-def parse_rttm(rttm_path):
-    try:
-        raw_segments = []
-        with open(rttm_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) >= 8 and parts[0] == "SPEAKER":
-                    file_id = parts[1]
-                    start_time = float(parts[3])
-                    duration = float(parts[4])
-                    speaker_id = parts[7]
-                    raw_segments.append({
-                        'file_id': file_id,
-                        'start_time': start_time,
-                        'duration': duration,
-                        'end_time': start_time + duration,
-                        'speaker_id': speaker_id
-                    })
-        
-        # Sort segments by start time
-        raw_segments.sort(key=lambda x: x['start_time'])
-        
-        # Merge consecutive segments with the same speaker if gap <= 0.5s
-        merged_segments = []
-        if not raw_segments:
-            return merged_segments
-        
-        current_segment = raw_segments[0].copy()
-        for i in range(1, len(raw_segments)):
-            next_segment = raw_segments[i]
-            
-            # If same speaker and gap <= 0.5s, merge the segments
-            if (next_segment['speaker_id'] == current_segment['speaker_id'] and 
-                next_segment['start_time'] - current_segment['end_time'] <= 0.5):
-                # Update end time and duration of current segment
-                current_segment['end_time'] = next_segment['end_time']
-                current_segment['duration'] = current_segment['end_time'] - current_segment['start_time']
-            else:
-                # Add current segment to merged list and start a new current segment
-                merged_segments.append(current_segment)
-                current_segment = next_segment.copy()
-        
-        # Add the last segment
-        merged_segments.append(current_segment)
-        
-        return merged_segments
-    except Exception as e:
-        app.logger.error(f"Error parsing RTTM file: {str(e)}")
-        app.logger.error(traceback.format_exc())
-        return []
+# The workspace (RTTM and audio directories) is kept in each annotator's session,
+# so any worker process can serve any request
+app.secret_key = load_secret_key()
 
-def write_rttm(segments, output_path, file_id):
-    try:
-        with open(output_path, 'w') as f:
-            for segment in segments:
-                # Format: SPEAKER file_id channel start_time duration <NA> <NA> speaker_id <NA> <NA>
-                line = f"SPEAKER {file_id} 1 {segment['start_time']:.2f} {segment['duration']:.2f} <NA> <NA> {segment['speaker_id']} <NA> <NA>\n"
-                f.write(line)
-        return True
-    except Exception as e:
-        app.logger.error(f"Error writing RTTM file: {str(e)}")
-        app.logger.error(traceback.format_exc())
-        return False
+# Cache for extracted segment clips (memory tier + disk tier in SEGMENT_CACHE_DIR)
+segment_cache = SegmentCache(SEGMENT_CACHE_DIR, max_memory_bytes=SEGMENT_CACHE_MEMORY_BYTES,
+                             max_disk_bytes=SEGMENT_CACHE_DISK_BYTES)
 
-def extract_audio_segment(audio_path, start_time, duration, output_path):
-    try:
-        # Load the audio file
-        y, sr = librosa.load(audio_path, sr=None, offset=start_time, duration=duration)
-        
-        # Write the segment to the output path
-        sf.write(output_path, y, sr)
-        
-        return output_path
-    except Exception as e:
-        app.logger.error(f"Error extracting audio segment: {str(e)}")
-        app.logger.error(traceback.format_exc())
-        return None
+# Shared queue for audio work; identical in-flight jobs are coalesced
+audio_work = WorkQueue('audio', workers=AUDIO_WORKERS, max_pending=AUDIO_QUEUE_DEPTH)
+
+# Full-audio previews, transcoded in a background process pool
+preview_store = PreviewStore(os.path.join(CACHE_DIR, "previews"), format_name=PREVIEW_FORMAT,
+                             sample_rate=PREVIEW_SAMPLE_RATE, workers=PREVIEW_WORKERS)
+
+# Spectrogram tiles, computed on demand and kept on disk (LRU)
+spectrogram_tiles = SpectrogramTiles(os.path.join(CACHE_DIR, "spectrograms"), max_disk_bytes=SPECTROGRAM_CACHE_BYTES)
+
+# Persistent catalog of RTTM/audio/label files, refreshed incrementally
+catalog_store = CatalogStore(os.path.join(CACHE_DIR, "catalog.sqlite"))
+
+# Cached subdirectory listings for the folder browser
+directory_lister = DirectoryLister(ttl=DIRECTORY_LISTING_TTL)
+
+# Per-file durations and segment/speaker totals behind /stats
+corpus_stats = CorpusStats(os.path.join(CACHE_DIR, "corpus_stats.sqlite"), workers=CORPUS_STATS_WORKERS)
+
+# Original-vs-edited agreement of every file with saved labels
+agreement_store = AgreementStore(os.path.join(CACHE_DIR, "agreement.sqlite"), workers=AGREEMENT_WORKERS)
+
+# Indexed segments of every file for /search, updated incrementally
+segment_db = SegmentDB(os.path.join(CACHE_DIR, "segments.sqlite"), workers=SEGMENT_DB_WORKERS)
+
+def current_rttm_dir():
+    """RTTM directory of the current session's workspace"""
+    return session.get('rttm_dir') or DEFAULT_RTTM_DIR
+
+def current_audio_dir():
+    """Audio directory of the current session's workspace"""
+    return session.get('audio_dir') or DEFAULT_AUDIO_DIR
+
+# Request-level metrics; stage timings come from metrics.timed() around the hot paths
+request_seconds = metrics.registry.histogram(
+    'labeltool_request_seconds', 'Time to produce a response (excluding streamed bodies)',
+    ('endpoint', 'method', 'status'))
+metrics.registry.counter_callback(
+    'labeltool_segment_cache_lookups_total', 'Segment cache lookups by result',
+    lambda: {result: segment_cache.stats()[result] for result in ('memory_hits', 'disk_hits', 'misses')},
+    ('result',))
+metrics.registry.gauge_callback(
+    'labeltool_segment_cache_hit_ratio', 'Fraction of segment cache lookups served from memory or disk',
+    lambda: segment_cache.stats()['hit_ratio'])
+metrics.registry.gauge_callback(
+    'labeltool_segment_cache_bytes', 'Bytes held by each segment cache tier (disk is shared by all workers)',
+    lambda: {'memory': segment_cache.stats()['memory_bytes'], 'disk': segment_cache.stats()['disk_bytes']},
+    ('tier',))
+metrics.registry.counter_callback(
+    'labeltool_spectrogram_tile_lookups_total', 'Spectrogram tile cache lookups by result',
+    lambda: {result: spectrogram_tiles.stats()[result] for result in ('hits', 'misses')},
+    ('result',))
+metrics.registry.gauge_callback(
+    'labeltool_audio_queue_pending', 'Audio jobs queued or running', lambda: audio_work.stats()['pending'])
+metrics.registry.counter_callback(
+    'labeltool_audio_queue_jobs_total', 'Audio jobs by outcome',
+    lambda: {outcome: audio_work.stats()[outcome] for outcome in ('submitted', 'coalesced', 'rejected', 'failed')},
+    ('outcome',))
+
+@app.before_request
+def hold_warmup():
+    # Warm-up work waits while interactive requests are running
+    warmup.begin_request()
+
+@app.teardown_request
+def release_warmup(error=None):
+    warmup.end_request()
+
+@app.before_request
+def start_request_timing():
+    g.metrics_token = metrics.start_request()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_timing(response):
+    token = g.pop('metrics_token', None)
+    if token is None:
+        return response
+    elapsed = time.perf_counter() - g.pop('request_started')
+    stages = metrics.finish_request(token)
+    endpoint = request.endpoint or 'unknown'
+    request_seconds.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    if response.content_length:
+        metrics.bytes_served.inc(response.content_length, endpoint=endpoint)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing_header(stages, elapsed)
+    return response
+
+def busy_response(error):
+    """503 with Retry-After for requests turned away by a saturated work queue"""
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def compress_response(response):
+    """Compress a buffered response body with brotli or gzip, whichever the client accepts (brotli preferred)"""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    
+    accepted = request.accept_encodings
+    with timed('compress'):
+        if brotli is not None and accepted['br']:
+            encoding, data = 'br', brotli.compress(data, quality=BROTLI_QUALITY)
+        elif accepted['gzip']:
+            encoding, data = 'gzip', gzip.compress(data, compresslevel=GZIP_LEVEL)
+        else:
+            return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def get_catalog(rttm_dir=None, audio_dir=None):
+    """Catalog for the given (or the session's) RTTM and audio directories"""
+    return Catalog(catalog_store, rttm_dir or current_rttm_dir(), audio_dir or current_audio_dir(), LABELS_DIR)
+
+def resolve_audio_path(file_id, rttm_path=None):
+    """Find the audio file for an RTTM file, preferring the matching subdirectory"""
+    # Catalog lookup first; fall back to probing the filesystem for files added since the last refresh
+    audio_path = get_catalog().audio_path(rttm_path or f"{file_id}.rttm")
+    if audio_path and os.path.basename(audio_path) == f"{file_id}.wav":
+        return audio_path
+    if rttm_path:
+        rttm_dir = os.path.dirname(rttm_path)
+        # Try to find audio file in the same subdirectory structure
+        audio_path = os.path.join(current_audio_dir(), rttm_dir, f"{file_id}.wav")
+        if os.path.exists(audio_path):
+            return audio_path
+    # Fall back to the root of the audio directory
+    return os.path.join(current_audio_dir(), f"{file_id}.wav")
+
+def label_output_dir(file_id, rttm_path=None):
+    """Directory under LABELS_DIR that holds the saved labels (and caches) for a file"""
+    rel_dir = os.path.dirname(rttm_path) if rttm_path else ''
+    return os.path.join(LABELS_DIR, rel_dir, file_id)
+
+def rttm_source_path(rttm_file, use_saved=False):
+    """
+    Path of the RTTM to load for `rttm_file` (relative to the RTTM directory): the saved edits
+    if `use_saved`, otherwise the original. Returns (path, source_type) or (None, error message).
+    """
+    original_rttm_path = os.path.join(current_rttm_dir(), rttm_file)
+    if not os.path.exists(original_rttm_path):
+        return None, 'Original RTTM file not found'
+    if not use_saved:
+        return original_rttm_path, 'original'
+    
+    file_id = os.path.basename(rttm_file).replace('.rttm', '')
+    saved_rttm_path = os.path.join(label_output_dir(file_id, rttm_file), f"{file_id}.rttm")
+    if not os.path.exists(saved_rttm_path):
+        return None, 'Saved RTTM file not found'
+    return saved_rttm_path, 'saved'
 
 @app.route('/check_saved_edits', methods=['POST'])
 def check_saved_edits():
@@ -178,35 +329,13 @@ def check_saved_edits():
 @app.route('/')
 def index():
     try:
-        # Clean up old temporary files (older than 1 hour)
-        cleanup_temp_files(3600)
-        
-        # Get list of RTTM files from all subdirectories
-        rttm_files = []
-        for root, dirs, files in os.walk(RTTM_DIR):
-            for file in files:
-                if file.endswith('.rttm'):
-                    # Get relative path from RTTM_DIR
-                    rel_path = os.path.relpath(os.path.join(root, file), RTTM_DIR)
-                    rttm_files.append(rel_path)
-        
-        # Sort files for better display
-        rttm_files.sort()
-        
-        # Get the categories (subdirectories)
-        categories = set()
-        for file_path in rttm_files:
-            # Extract the top-level directory
-            parts = file_path.split(os.sep)
-            if len(parts) > 1:
-                categories.add(parts[0])
-            else:
-                categories.add("root")
-        
-        categories = sorted(list(categories))
+        # Get list of RTTM files and categories from the catalog
+        catalog = get_catalog()
+        rttm_files = catalog.rttm_files()
+        categories = catalog.categories()
         
         return render_template('index.html', rttm_files=rttm_files, categories=categories, 
-                              rttm_dir=RTTM_DIR, audio_dir=AUDIO_DIR)
+                              rttm_dir=current_rttm_dir(), audio_dir=current_audio_dir())
     except Exception as e:
         app.logger.error(f"Error in index route: {str(e)}")
         app.logger.error(traceback.format_exc())
@@ -224,32 +353,14 @@ def get_segment():
         if not all([file_id, start_time is not None, duration is not None]):
             return jsonify({'error': 'Missing required parameters'}), 400
             
-        # Parse RTTM path to determine audio file location
-        if rttm_path:
-            rttm_dir = os.path.dirname(rttm_path)
-            # Try to find audio file in the same subdirectory structure
-            audio_path = os.path.join(AUDIO_DIR, rttm_dir, f"{file_id}.wav")
-            
-            # If not found, try the root of AUDIO_DIR
-            if not os.path.exists(audio_path):
-                audio_path = os.path.join(AUDIO_DIR, f"{file_id}.wav")
-        else:
-            # Fall back to directly using file_id
-            audio_path = os.path.join(AUDIO_DIR, f"{file_id}.wav")
-        
         # Check if audio file exists
+        audio_path = resolve_audio_path(file_id, rttm_path)
         if not os.path.exists(audio_path):
             return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
-            
-        # Create a temporary file for the segment
-        temp_filename = f"segment_{file_id}_{start_time:.2f}_{duration:.2f}_{int(time.time())}.wav"
-        temp_path = os.path.join(TEMP_DIR, temp_filename)
-        
-        # Extract the segment
-        extract_audio_segment(audio_path, float(start_time), float(duration), temp_path)
         
-        # Generate a URL for the segment
-        segment_url = url_for('static', filename=f"temp/{temp_filename}")
+        # Point the client at the streaming endpoint instead of writing a temp file
+        segment_url = url_for('stream_segment', file_id=file_id, rttm_path=rttm_path or '',
+                              start=f"{float(start_time):.3f}", duration=f"{float(duration):.3f}")
         
         return jsonify({'segment_url': segment_url})
     except Exception as e:
@@ -257,10 +368,255 @@ def get_segment():
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/stream_segment', methods=['GET'])
+def stream_segment():
+    """Stream a segment as a WAV file sliced directly from the source audio"""
+    try:
+        file_id = request.args.get('file_id')
+        rttm_path = request.args.get('rttm_path')
+        start_time = request.args.get('start', type=float)
+        duration = request.args.get('duration', type=float)
+        
+        if not file_id or start_time is None or duration is None:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        
+        audio_path = resolve_audio_path(file_id, rttm_path)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        
+        # Repeat plays of the same clip are served from the segment cache
+        key = segment_cache.make_key(audio_path, start_time, duration)
+        data = segment_cache.get(key)
+        if data is None:
+            # Extract on the audio queue; concurrent requests for the same clip share one job
+            with timed('segment_queue'):
+                data, info = audio_work.run(('segment', key), load_segment_clip, key, audio_path, start_time, duration,
+                                            timeout=AUDIO_JOB_TIMEOUT)
+            if data is None:
+                # Too large to cache - serve the header and the sample slice straight from the file
+                offset, length = segment_byte_range(info, start_time, duration)
+                return send_file_range(audio_path, 'audio/wav', prefix=make_wav_header(info, length),
+                                       offset=offset, length=length, etag_extra=f"-{offset:x}-{length:x}")
+        # Audio elements fetch with Range requests, so answer them with partial content
+        return Response(data, mimetype='audio/wav').make_conditional(request, accept_ranges=True,
+                                                                      complete_length=len(data))
+    except QueueFull as e:
+        return busy_response(e)
+    except RequestedRangeNotSatisfiable:
+        # Flask answers it with 416 and the clip's length in Content-Range
+        raise
+    except Exception as e:
+        app.logger.error(f"Error streaming segment: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+def load_segment_clip(key, audio_path, start_time, duration):
+    """
+    Audio queue job: extract one clip into the segment cache.
+    Returns (clip bytes, None), or (None, WavInfo) if the clip is too large to cache and should be streamed.
+    """
+    info = read_wav_header(audio_path)
+    if info is not None:
+        _, length = segment_byte_range(info, start_time, duration)
+        if length + 44 > segment_cache.max_item_bytes:
+            return None, info
+    with timed('segment_extract'):
+        data = read_wav_segment(audio_path, start_time, duration)
+    metrics.bytes_read.inc(len(data), source='segment')
+    segment_cache.put(key, data)
+    return data, None
+
+def extract_segments_batch(audio_path, windows, keep_clips=True):
+    """
+    Make sure every (start_time, duration) window of one audio file is in the segment cache.
+    Missing clips are extracted together in one sequential pass over the file.
+    Returns (clips in the order of `windows`, number of clips extracted).
+
+    With keep_clips=False the batch only warms the cache: no clips are returned (None),
+    clips too large to cache are skipped, extraction runs in chunks of BATCH_CHUNK_SEGMENTS
+    and stops after BATCH_CACHE_BYTES, so one batch can't flush everyone else's entries.
+    """
+    keys = [segment_cache.make_key(audio_path, start_time, duration) for start_time, duration in windows]
+    missing = [i for i, key in enumerate(keys) if not segment_cache.contains(key)]
+    
+    if not keep_clips:
+        info = read_wav_header(audio_path)
+        if info is not None:
+            missing = [i for i in missing
+                       if segment_byte_range(info, *windows[i])[1] + 44 <= segment_cache.max_item_bytes]
+        extracted = budget = 0
+        with timed('segment_batch_extract'):
+            for chunk_start in range(0, len(missing), BATCH_CHUNK_SEGMENTS):
+                if budget >= BATCH_CACHE_BYTES:
+                    break
+                chunk = missing[chunk_start:chunk_start + BATCH_CHUNK_SEGMENTS]
+                for i, data in zip(chunk, read_wav_segments(audio_path, [windows[i] for i in chunk])):
+                    segment_cache.put(keys[i], data)
+                    budget += len(data)
+                    extracted += 1
+        metrics.bytes_read.inc(budget, source='segment')
+        return None, extracted
+    
+    with timed('segment_batch_extract'):
+        extracted = read_wav_segments(audio_path, [windows[i] for i in missing]) if missing else []
+    metrics.bytes_read.inc(sum(len(data) for data in extracted), source='segment')
+    clips = {}
+    for i, data in zip(missing, extracted):
+        segment_cache.put(keys[i], data)
+        clips[i] = data
+    for i, key in enumerate(keys):
+        if i not in clips:
+            clips[i] = segment_cache.get(key) or read_wav_segment(audio_path, *windows[i])
+    return [clips[i] for i in range(len(windows))], len(missing)
+
+def packed_clip_bytes(audio_path, windows):
+    """Audio queue job: total size of the WAV clips read_wav_segments would return for `windows`"""
+    info = read_wav_header(audio_path)
+    if info is not None:
+        return sum(44 + segment_byte_range(info, start_time, duration)[1] for start_time, duration in windows)
+    # Formats sliced through soundfile come back as 16-bit PCM
+    file_info = sf.info(audio_path)
+    frame_bytes = 2 * file_info.channels
+    total = 0
+    for start_time, duration in windows:
+        start_frame = min(max(int(start_time * file_info.samplerate), 0), file_info.frames)
+        frames = min(max(int(duration * file_info.samplerate), 0), file_info.frames - start_frame)
+        total += 44 + frames * frame_bytes
+    return total
+
+@app.route('/get_segments_batch', methods=['POST'])
+def get_segments_batch():
+    """
+    Extract many segments at once.
+    
+    Body: {"files": [{"file_id", "rttm_path", "segments": [[start, duration], ...]}], "format": "cache"|"packed"}
+    If "segments" is omitted, all segments of the file's RTTM are used ("use_saved" picks the saved edits).
+    "cache" (default) warms the segment cache (up to BATCH_CACHE_BYTES of clips) and returns stream
+    URLs; "packed" returns one binary blob:
+    a 4-byte little-endian index length, a JSON index of {file_id, start, duration, offset, length},
+    then the WAV clips back to back. A packed response is built in memory, so requests for more than
+    BATCH_PACKED_BYTES of clips get 413 and should be split.
+    """
+    try:
+        data = request.json or {}
+        files = data.get('files') or []
+        output_format = data.get('format', 'cache')
+        if not files:
+            return jsonify({'error': 'No files specified'}), 400
+        
+        jobs = []
+        for entry in files:
+            file_id = entry.get('file_id')
+            rttm_path = entry.get('rttm_path')
+            if not file_id:
+                return jsonify({'error': 'Missing file_id'}), 400
+            
+            audio_path = resolve_audio_path(file_id, rttm_path)
+            if not os.path.exists(audio_path):
+                return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+            
+            windows = entry.get('segments')
+            if windows is None:
+                # Use the whole segment list of the RTTM
+                if entry.get('use_saved'):
+                    source_path = os.path.join(label_output_dir(file_id, rttm_path), f"{file_id}.rttm")
+                else:
+                    source_path = os.path.join(current_rttm_dir(), rttm_path or f"{file_id}.rttm")
+                if not os.path.exists(source_path):
+                    return jsonify({'error': f'RTTM file not found at {source_path}'}), 404
+                windows = [(s['start_time'], s['duration']) for s in parse_rttm(source_path)]
+            windows = [(round(float(start), 3), round(float(duration), 3)) for start, duration in windows]
+            jobs.append((file_id, rttm_path, audio_path, windows))
+        
+        # Only "packed" needs the clip bodies; "cache" just warms the cache
+        keep_clips = output_format == 'packed'
+        if keep_clips:
+            size_futures = [audio_work.submit(('packed_size', audio_path, tuple(windows)), packed_clip_bytes,
+                                              audio_path, windows)
+                            for _, _, audio_path, windows in jobs]
+            packed_bytes = sum(audio_work.wait(future, AUDIO_JOB_TIMEOUT) for future in size_futures)
+            if packed_bytes > BATCH_PACKED_BYTES:
+                return jsonify({'error': f'Packed response would be {packed_bytes} bytes, over the limit of '
+                                         f'{BATCH_PACKED_BYTES}; split the request',
+                                'bytes': packed_bytes, 'limit': BATCH_PACKED_BYTES}), 413
+        
+        # One sequential pass per file on the audio queue; files are processed in parallel
+        futures = [audio_work.submit(('batch', audio_path, tuple(windows), keep_clips), extract_segments_batch,
+                                     audio_path, windows, keep_clips)
+                   for _, _, audio_path, windows in jobs]
+        with timed('segment_batch_queue'):
+            results = [audio_work.wait(future, AUDIO_JOB_TIMEOUT) for future in futures]
+        
+        if output_format == 'packed':
+            index = []
+            blobs = []
+            offset = 0
+            for (file_id, _, _, windows), (clips, _) in zip(jobs, results):
+                for (start, duration), clip in zip(windows, clips):
+                    index.append({'file_id': file_id, 'start': start, 'duration': duration,
+                                  'offset': offset, 'length': len(clip)})
+                    blobs.append(clip)
+                    offset += len(clip)
+            index_bytes = json.dumps(index).encode('utf-8')
+            return Response([struct.pack('<I', len(index_bytes)), index_bytes] + blobs,
+                            mimetype='application/octet-stream')
+        
+        response_files = []
+        total_extracted = 0
+        for (file_id, rttm_path, _, windows), (_, extracted) in zip(jobs, results):
+            total_extracted += extracted
+            response_files.append({
+                'file_id': file_id,
+                'segments': [{
+                    'start': start,
+                    'duration': duration,
+                    'url': url_for('stream_segment', file_id=file_id, rttm_path=rttm_path or '',
+                                   start=f"{start:.3f}", duration=f"{duration:.3f}")
+                } for start, duration in windows]
+            })
+        
+        return jsonify({
+            'files': response_files,
+            'extracted': total_extracted,
+            # Windows now in the cache, including those extracted by this batch
+            'cached': sum(segment_cache.contains(segment_cache.make_key(audio_path, start, duration))
+                          for _, _, audio_path, windows in jobs for start, duration in windows)
+        })
+    except QueueFull as e:
+        return busy_response(e)
+    except Exception as e:
+        app.logger.error(f"Error extracting segment batch: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and sizes of the segment cache"""
+    return jsonify(segment_cache.stats())
+
+@app.route('/queue_stats', methods=['GET'])
+def queue_stats():
+    """Depth and counters of the audio work queue"""
+    return jsonify(audio_work.stats())
+
+@app.route('/catalog', methods=['GET'])
+def catalog_entries():
+    """RTTM files with their audio/label pairing, category and missing-audio flag"""
+    try:
+        return jsonify({'files': get_catalog().entries()})
+    except Exception as e:
+        app.logger.error(f"Error listing catalog: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/update_paths', methods=['POST'])
 def update_paths():
-    global RTTM_DIR, AUDIO_DIR
-    
+    """Switch the RTTM and audio directories of this session's workspace"""
     try:
         rttm_dir = request.form.get('rttm_dir')
         audio_dir = request.form.get('audio_dir')
@@ -273,45 +629,16 @@ def update_paths():
             return jsonify({'error': f'Audio directory not found: {audio_dir}'}), 400
             
         # Validate RTTM files exist in the directory
-        has_rttm_files = False
-        for root, dirs, files in os.walk(rttm_dir):
-            for file in files:
-                if file.endswith('.rttm'):
-                    has_rttm_files = True
-                    break
-            if has_rttm_files:
-                break
-        
-        if not has_rttm_files:
+        catalog = get_catalog(rttm_dir, audio_dir)
+        rttm_files = catalog.rttm_files()
+        if not rttm_files:
             return jsonify({'error': f'No RTTM files found in {rttm_dir}'}), 400
         
-        # Update global paths
-        RTTM_DIR = rttm_dir
-        AUDIO_DIR = audio_dir
-        
-        # Get list of RTTM files from all subdirectories
-        rttm_files = []
-        for root, dirs, files in os.walk(RTTM_DIR):
-            for file in files:
-                if file.endswith('.rttm'):
-                    # Get relative path from RTTM_DIR
-                    rel_path = os.path.relpath(os.path.join(root, file), RTTM_DIR)
-                    rttm_files.append(rel_path)
-        
-        # Sort files for better display
-        rttm_files.sort()
-        
-        # Get the categories (subdirectories)
-        categories = set()
-        for file_path in rttm_files:
-            # Extract the top-level directory
-            parts = file_path.split(os.sep)
-            if len(parts) > 1:
-                categories.add(parts[0])
-            else:
-                categories.add("root")
+        # Update this annotator's workspace only
+        session['rttm_dir'] = os.path.abspath(rttm_dir)
+        session['audio_dir'] = os.path.abspath(audio_dir)
         
-        categories = sorted(list(categories))
+        categories = catalog.categories()
         
         return jsonify({
             'success': True,
@@ -323,122 +650,588 @@ def update_paths():
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
-@app.route('/load_rttm', methods=['POST'])
+def warm_rttm_file(item, cancelled):
+    """
+    Warm-up job for a file the annotator is likely to open next: parse its RTTMs into the
+    segment index cache, read ahead the start of its audio and extract its first segments.
+    """
+    with timed('warmup_file'):
+        index = None
+        # Saved labels last, so their segments are the ones extracted
+        for rttm_path in item['rttm_paths']:
+            if cancelled():
+                return
+            index = get_segment_index(rttm_path, merge_gap=item['merge_gap'], min_duration=item['min_duration'])
+        
+        audio_path = item['audio_path']
+        if audio_path is None or cancelled():
+            return
+        prime_page_cache(audio_path, PREFETCH_AUDIO_BYTES, cancelled)
+        if PREFETCH_PREVIEWS:
+            preview_store.status(audio_path)
+        
+        if index is not None and PREFETCH_SEGMENTS and not cancelled():
+            windows = list(zip(index.start[:PREFETCH_SEGMENTS].tolist(), index.duration[:PREFETCH_SEGMENTS].tolist()))
+            extract_segments_batch(audio_path, windows, keep_clips=False)
+
+# Low-priority warm-up of the files after the one just loaded
+warmup = WarmupScheduler(warm_rttm_file)
+
+metrics.registry.gauge_callback(
+    'labeltool_warmup_pending', 'Files waiting to be warmed up', lambda: warmup.stats()['pending'])
+metrics.registry.counter_callback(
+    'labeltool_warmup_files_total', 'Warm-up files by outcome',
+    lambda: {outcome: warmup.stats()[outcome] for outcome in ('scheduled', 'warmed', 'cancelled', 'failed')},
+    ('outcome',))
+
+def warmup_owner():
+    """Key of the current session's warm-up plan"""
+    return session.setdefault('warmup_owner', os.urandom(8).hex())
+
+def schedule_warmup(rttm_file, merge_gap, min_duration):
+    """Plan warm-up of the PREFETCH_FILES files after `rttm_file` in its category, in list order"""
+    catalog = get_catalog()
+    rttm_files = catalog.rttm_files()
+    category = category_of(rttm_file)
+    items = []
+    # The list is sorted, so a category's files are contiguous
+    for next_file in rttm_files[bisect.bisect_right(rttm_files, rttm_file):]:
+        if len(items) >= PREFETCH_FILES or category_of(next_file) != category:
+            break
+        rttm_paths = [os.path.join(catalog.rttm_dir, next_file)]
+        if catalog.saved_label_stat(next_file) is not None:
+            rttm_paths.append(os.path.join(LABELS_DIR, catalog.saved_label_rel_path(next_file)))
+        items.append({
+            'rttm_file': next_file,
+            'rttm_paths': rttm_paths,
+            'audio_path': catalog.audio_path(next_file),
+            'merge_gap': merge_gap,
+            'min_duration': min_duration,
+        })
+    warmup.schedule(warmup_owner(), items)
+
+def load_rttm_etag(rttm_path, source_type, label_version, output_format, merge_gap, min_duration):
+    """
+    Validator for a /load_rttm response: changes whenever the loaded RTTM (size or mtime), the
+    saved label version, the requested format or merge policy, or the session's folders change.
+    """
+    stat = os.stat(rttm_path)
+    raw = '|'.join(str(part) for part in (
+        os.path.abspath(rttm_path), stat.st_mtime_ns, stat.st_size, source_type, label_version,
+        output_format, merge_gap, min_duration, current_rttm_dir(), current_audio_dir()))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+@app.route('/load_rttm', methods=['GET', 'POST'])
 def load_rttm():
+    """
+    Segments and file information for the editor (form fields on POST, query arguments on GET).
+    `format=columnar` returns the segments as parallel arrays (see columns_from_segments) instead
+    of one dict per segment. Responses carry an ETag, so repeat loads of an unchanged file get a 304,
+    and are compressed when the client accepts gzip or brotli.
+    """
     try:
-        # Clean up all temporary files when loading a new RTTM file
-        app.logger.info("Cleaning up temporary files before loading new RTTM file")
-        cleanup_temp_files(None)  # None means delete all files regardless of age
+        rttm_file = request.values.get('rttm_file')
+        if not rttm_file:
+            return jsonify({'error': 'No RTTM file specified'}), 400
+        # Whatever was being warmed up for this annotator gives way to the file they actually opened
+        warmup.cancel(warmup_owner())
+        use_saved = request.values.get('use_saved', 'false').lower() == 'true'
+        # Merge policy (defaults match the classic behaviour: 0.5s gap, no minimum duration)
+        merge_gap = request.values.get('merge_gap', MERGE_GAP, type=float)
+        min_duration = request.values.get('min_duration', MIN_DURATION, type=float)
+        output_format = request.values.get('format', 'segments')
+        if output_format not in ('segments', 'columnar'):
+            return jsonify({'error': f'Unknown format: {output_format}'}), 400
         
-        rttm_file = request.form.get('rttm_file')
-        use_saved = request.form.get('use_saved', 'false').lower() == 'true'
+        # Determine which RTTM file to load based on user choice
+        rttm_path_to_load, source_type = rttm_source_path(rttm_file, use_saved)
+        if rttm_path_to_load is None:
+            return jsonify({'error': source_type}), 404
+        
+        file_id = os.path.basename(rttm_file).replace('.rttm', '')
+        rttm_dir = os.path.dirname(rttm_file)
+        
+        # Find the audio file (same subdirectory first, then the root of the audio directory)
+        audio_path = resolve_audio_path(file_id, rttm_file)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
         
-        # Path to the original RTTM file
-        original_rttm_path = os.path.join(RTTM_DIR, rttm_file)
+        # Start building the compressed preview while the annotator works with the raw WAV
+        preview_state, _ = preview_store.status(audio_path)
+        
+        store = LabelStore(label_output_dir(file_id, rttm_file), file_id)
+        label_version = store.current_version()
+        
+        # The client's copy is still current: skip parsing and encoding altogether
+        etag = load_rttm_etag(rttm_path_to_load, source_type, label_version, output_format, merge_gap, min_duration)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            # Saved edits with a journal are returned exactly as stored, so patches can refer to them by index
+            if source_type == 'saved' and label_version > 0:
+                segments = store.current_segments()
+                speaker_counts = {}
+                for segment in segments:
+                    counts = speaker_counts.setdefault(segment['speaker_id'], {'count': 0, 'duration': 0.0})
+                    counts['count'] += 1
+                    counts['duration'] += segment['duration']
+                if output_format == 'columnar':
+                    segments = columns_from_segments(segments)
+            else:
+                # Parse the RTTM file (through the interval index, which is cached for later queries)
+                index = get_segment_index(rttm_path_to_load, merge_gap=merge_gap, min_duration=min_duration)
+                segments = index.columns() if output_format == 'columnar' else index.segments(with_index=False)
+                speaker_counts = index.speaker_counts()
+            total_segments = len(segments['start_time']) if output_format == 'columnar' else len(segments)
+            if not total_segments:
+                return jsonify({'error': 'No segments found in RTTM file'}), 400
+            
+            # Return the segments and file information
+            with timed('json_encode'):
+                response = jsonify({
+                    'format': output_format,
+                    'segments': segments,
+                    'file_id': file_id,
+                    'rttm_path': rttm_file,
+                    'audio_path': f"/audio/{rttm_dir}/{file_id}.wav" if rttm_dir else f"/audio/{file_id}.wav",
+                    'source_type': source_type,
+                    'preview_status': preview_state,
+                    'label_version': label_version,
+                    'total_segments': total_segments,
+                    'speaker_counts': speaker_counts,
+                    'rttm_dir': current_rttm_dir(),
+                    'audio_dir': current_audio_dir()
+                })
+            response = compress_response(response)
         
-        # Check if the original RTTM file exists
-        if not os.path.exists(original_rttm_path):
-            return jsonify({'error': 'Original RTTM file not found'}), 404
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
         
+        # Warm up the files the annotator is likely to open next
+        if PREFETCH_FILES:
+            schedule_warmup(rttm_file, merge_gap, min_duration)
+        return response
+    except RttmParseError as e:
+        # Malformed input, not a server fault
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error loading RTTM file: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analyze_rttm', methods=['GET', 'POST'])
+def analyze_rttm():
+    """
+    Overlaps, slivers, long gaps and segments past the end of the audio for a file.
+    GET analyzes the file as /load_rttm would return it; POST analyzes the segments in the
+    request body (the editor's current, possibly unsaved, segments).
+    """
+    try:
+        data = request.json if request.method == 'POST' else request.args
+        rttm_file = data.get('rttm_file')
+        if not rttm_file:
+            return jsonify({'error': 'Missing rttm_file'}), 400
         file_id = os.path.basename(rttm_file).replace('.rttm', '')
-        rttm_dir = os.path.dirname(rttm_file)
         
-        # Determine which RTTM file to load based on user choice
-        if use_saved:
-            # Construct path to saved RTTM file
-            if rttm_dir:
-                saved_rttm_path = os.path.join(LABELS_DIR, rttm_dir, file_id, f"{file_id}.rttm")
+        # Audio length from the header, so segments running past the end can be caught
+        audio_path = resolve_audio_path(file_id, rttm_file)
+        audio_duration = None
+        if os.path.exists(audio_path):
+            try:
+                audio_duration = audio_work.run(('info', audio_path), sf.info, audio_path,
+                                                timeout=AUDIO_JOB_TIMEOUT).duration
+            except QueueFull as e:
+                return busy_response(e)
+        
+        with timed('rttm_analysis'):
+            if request.method == 'POST':
+                segments = data.get('segments')
+                if not isinstance(segments, list):
+                    return jsonify({'error': 'segments must be a list'}), 400
+                analysis = analyze_segment_dicts(segments, audio_duration)
             else:
-                saved_rttm_path = os.path.join(LABELS_DIR, file_id, f"{file_id}.rttm")
-                
-            # Check if saved file exists
-            if not os.path.exists(saved_rttm_path):
-                return jsonify({'error': 'Saved RTTM file not found'}), 404
-                
-            # Use the saved RTTM file
-            rttm_path_to_load = saved_rttm_path
-            source_type = "saved"
-        else:
-            # Use the original RTTM file
-            rttm_path_to_load = original_rttm_path
-            source_type = "original"
+                use_saved = str(data.get('use_saved', 'false')).lower() == 'true'
+                rttm_path, source_type = rttm_source_path(rttm_file, use_saved)
+                if rttm_path is None:
+                    return jsonify({'error': source_type}), 404
+                # Same segments, in the same order, as /load_rttm returns, so issue indices match the editor
+                store = LabelStore(label_output_dir(file_id, rttm_file), file_id)
+                if source_type == 'saved' and store.current_version() > 0:
+                    analysis = analyze_segment_dicts(store.current_segments(), audio_duration)
+                else:
+                    index = get_segment_index(rttm_path, merge_gap=request.args.get('merge_gap', MERGE_GAP, type=float),
+                                              min_duration=request.args.get('min_duration', MIN_DURATION, type=float))
+                    analysis = analyze_segments(index.start, index.duration, index.speaker, audio_duration)
+        
+        analysis['rttm_file'] = rttm_file
+        return jsonify(analysis)
+    except RttmParseError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error analyzing RTTM file: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+def iter_file_range(file_path, prefix, offset, start, stop, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield bytes [start, stop) of a virtual file made of `prefix` followed by
+    the contents of `file_path` beginning at byte `offset`.
+    """
+    if start < len(prefix):
+        yield prefix[start:min(stop, len(prefix))]
+        start = len(prefix)
+    if start >= stop:
+        return
+    with open(file_path, 'rb') as f:
+        f.seek(offset + start - len(prefix))
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            metrics.bytes_read.inc(len(chunk), source='file_range')
+            yield chunk
+
+def send_file_range(file_path, mimetype, prefix=b'', offset=0, length=None, etag_extra=''):
+    """
+    Serve (part of) a file with byte-range, ETag and Last-Modified support.
+    The response body is `prefix` followed by `length` bytes of the file starting at `offset`.
+    """
+    stat = os.stat(file_path)
+    if length is None:
+        length = stat.st_size - offset
+    total_length = len(prefix) + length
+    
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}{etag_extra}"
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+    
+    # Conditional GET/HEAD: answer 304 when the client copy is still valid
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (request.if_modified_since is not None and
+                        request.if_modified_since >= last_modified)
+    
+    status = 200
+    start, stop = 0, total_length
+    if not_modified:
+        status = 304
+    elif request.range is not None:
+        # Only honour the range if If-Range (when present) still matches this file
+        if_range = request.if_range
+        range_valid = ('If-Range' not in request.headers or
+                       (if_range.etag is not None and if_range.etag == etag) or
+                       (if_range.date is not None and if_range.date >= last_modified))
+        if range_valid:
+            byte_range = request.range.range_for_length(total_length)
+            if byte_range is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f"bytes */{total_length}"
+                return response
+            start, stop = byte_range
+            status = 206
+    
+    if status == 304:
+        response = Response(status=304)
+    else:
+        response = Response(iter_file_range(file_path, prefix, offset, start, stop),
+                            status=status, mimetype=mimetype, direct_passthrough=True)
+        response.headers['Content-Length'] = str(stop - start)
+        if status == 206:
+            response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{total_length}"
+    
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+@app.route('/segments', methods=['GET'])
+def query_segments():
+    """
+    Query the merged segments of an RTTM file through its interval index.
+    
+    Either `t0`/`t1` (seconds) for the segments overlapping that window, or `offset`/`limit`
+    for a page by position. `counts=true` adds per-speaker counts. Meant for tools and scripts:
+    the editor still loads the whole segment list through /load_rttm, because editing, label
+    checks and saving work on the full list, and only pages the rows it renders.
+    """
+    try:
+        rttm_file = request.args.get('rttm_file')
+        if not rttm_file:
+            return jsonify({'error': 'No RTTM file specified'}), 400
+        use_saved = request.args.get('use_saved', 'false').lower() == 'true'
+        merge_gap = request.args.get('merge_gap', MERGE_GAP, type=float)
+        min_duration = request.args.get('min_duration', MIN_DURATION, type=float)
         
-        # Parse the RTTM file
-        segments = parse_rttm(rttm_path_to_load)
-        if not segments:
-            return jsonify({'error': 'No segments found in RTTM file'}), 400
+        rttm_path, source_type = rttm_source_path(rttm_file, use_saved)
+        if rttm_path is None:
+            return jsonify({'error': source_type}), 404
         
-        # Try to find audio file in the same subdirectory structure
-        audio_path = os.path.join(AUDIO_DIR, rttm_dir, f"{file_id}.wav")
+        index = get_segment_index(rttm_path, merge_gap=merge_gap, min_duration=min_duration)
         
-        # If not found, try the root of AUDIO_DIR (for backward compatibility)
-        if not os.path.exists(audio_path):
-            audio_path = os.path.join(AUDIO_DIR, f"{file_id}.wav")
-            
-            # If still not found, return error
-            if not os.path.exists(audio_path):
-                return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        t0 = request.args.get('t0', type=float)
+        t1 = request.args.get('t1', type=float)
+        if t0 is not None or t1 is not None:
+            indices = index.overlapping(t0 if t0 is not None else 0.0, t1 if t1 is not None else float('inf'))
+        else:
+            indices = index.page(request.args.get('offset', 0, type=int), request.args.get('limit', 100, type=int))
         
-        # Return the segments and file information
-        return jsonify({
-            'segments': segments,
-            'file_id': file_id,
-            'rttm_path': rttm_file,
-            'audio_path': f"/audio/{rttm_dir}/{file_id}.wav" if rttm_dir else f"/audio/{file_id}.wav",
+        result = {
+            'total': len(index),
             'source_type': source_type,
-            'rttm_dir': RTTM_DIR,
-            'audio_dir': AUDIO_DIR
-        })
+            'segments': index.segments(indices)
+        }
+        if request.args.get('counts', 'false').lower() == 'true':
+            result['speaker_counts'] = index.speaker_counts()
+        return jsonify(result)
+    except RttmParseError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        app.logger.error(f"Error loading RTTM file: {str(e)}")
+        app.logger.error(f"Error querying segments: {str(e)}")
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
-@app.route('/audio/<path:filepath>')
+@app.route('/audio/<path:filepath>', methods=['GET', 'HEAD'])
 def serve_audio(filepath):
+    """
+    Serve an audio file with HTTP range support.
+    Optional ?t0=&t1= (seconds) serves only that time window as a standalone WAV.
+    """
     try:
-        # Split the path into directory and filename
-        directory, filename = os.path.split(filepath)
-        return send_from_directory(os.path.join(AUDIO_DIR, directory), filename)
+        audio_path = safe_join(current_audio_dir(), filepath)
+        if audio_path is None or not os.path.isfile(audio_path):
+            abort(404)
+        
+        t0 = request.args.get('t0', type=float)
+        t1 = request.args.get('t1', type=float)
+        if t0 is None and t1 is None:
+            return send_file_range(audio_path, 'audio/wav')
+        
+        # Time-based mode: map seconds to byte offsets using the WAV header
+        try:
+            info = audio_work.run(('header', audio_path), read_wav_header, audio_path, timeout=AUDIO_JOB_TIMEOUT)
+        except QueueFull as e:
+            return busy_response(e)
+        if info is None:
+            return jsonify({'error': 'Time-based seeking is only supported for PCM WAV files'}), 400
+        
+        t0 = max(t0 or 0.0, 0.0)
+        duration = None if t1 is None else max(t1 - t0, 0.0)
+        offset, length = segment_byte_range(info, t0, duration)
+        return send_file_range(audio_path, 'audio/wav', prefix=make_wav_header(info, length),
+                               offset=offset, length=length, etag_extra=f"-{offset:x}-{length:x}")
     except Exception as e:
+        if getattr(e, 'code', None) == 404:
+            raise
         app.logger.error(f"Error serving audio file: {str(e)}")
         app.logger.error(traceback.format_exc())
         abort(404)
 
+@app.route('/preview_status', methods=['GET'])
+def preview_status():
+    """State of the compressed preview of a file's full audio; queues it for building if missing"""
+    try:
+        file_id = request.args.get('file_id')
+        rttm_path = request.args.get('rttm_path')
+        if not file_id:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        
+        audio_path = resolve_audio_path(file_id, rttm_path)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        
+        status, _ = preview_store.status(audio_path)
+        return jsonify({
+            'status': status,
+            'url': url_for('serve_preview', file_id=file_id, rttm_path=rttm_path or '') if status == 'ready' else None,
+            'mimetype': preview_store.mimetype
+        })
+    except Exception as e:
+        app.logger.error(f"Error getting preview status: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/preview', methods=['GET', 'HEAD'])
+def serve_preview():
+    """Serve the compressed preview of a file's full audio (with HTTP range support)"""
+    try:
+        file_id = request.args.get('file_id')
+        rttm_path = request.args.get('rttm_path')
+        if not file_id:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        
+        audio_path = resolve_audio_path(file_id, rttm_path)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        
+        status, preview_path = preview_store.status(audio_path)
+        if status != 'ready':
+            return jsonify({'error': f'Preview is {status}', 'status': status}), 404
+        return send_file_range(preview_path, preview_store.mimetype)
+    except Exception as e:
+        app.logger.error(f"Error serving preview: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/waveform', methods=['GET'])
+def waveform():
+    """
+    Min/max peak envelope of an audio file for a time window.
+    Pass `level` to pick a pyramid level directly, or `width` (in pixels) to pick one automatically.
+    """
+    try:
+        file_id = request.args.get('file_id')
+        rttm_path = request.args.get('rttm_path')
+        if not file_id:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        
+        audio_path = resolve_audio_path(file_id, rttm_path)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        
+        # The pyramid is cached under CACHE_DIR and rebuilt (on the audio queue) when the audio changes
+        pyramid = peek_peak_pyramid(audio_path)
+        if pyramid is None:
+            cache_path = peak_cache_path(PEAKS_CACHE_DIR, audio_path)
+            with timed('peaks_queue'):
+                pyramid = audio_work.run(('peaks', audio_path), get_peak_pyramid, audio_path, cache_path,
+                                         timeout=AUDIO_JOB_TIMEOUT)
+        
+        duration = pyramid['frames'] / float(pyramid['sample_rate'])
+        t0 = max(request.args.get('t0', 0.0, type=float), 0.0)
+        t1 = min(request.args.get('t1', duration, type=float), duration)
+        level = request.args.get('level', type=int)
+        if level is None:
+            level = select_level(pyramid, t0, t1, request.args.get('width', 1000, type=int))
+        
+        return jsonify(peaks_window(pyramid, level, t0, t1))
+    except QueueFull as e:
+        return busy_response(e)
+    except Exception as e:
+        app.logger.error(f"Error getting waveform: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/spectrogram', methods=['GET'])
+def spectrogram_info():
+    """Tile geometry of the spectrogram of an audio file, for picking zoom levels and tile indices"""
+    try:
+        file_id = request.args.get('file_id')
+        rttm_path = request.args.get('rttm_path')
+        if not file_id:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        
+        audio_path = resolve_audio_path(file_id, rttm_path)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        
+        try:
+            info = audio_work.run(('info', audio_path), sf.info, audio_path, timeout=AUDIO_JOB_TIMEOUT)
+        except QueueFull as e:
+            return busy_response(e)
+        return jsonify({
+            'duration': info.duration,
+            'sample_rate': info.samplerate,
+            'tile_columns': spectrogram.TILE_COLUMNS,
+            'mel_bands': spectrogram.N_MELS,
+            'base_column_seconds': spectrogram.BASE_COLUMN_SECONDS,
+            'max_zoom': spectrogram.MAX_ZOOM,
+            'tile_url': url_for('spectrogram_tile', file_id=file_id, rttm_path=rttm_path or '')
+        })
+    except Exception as e:
+        app.logger.error(f"Error getting spectrogram info: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/spectrogram_tile', methods=['GET'])
+def spectrogram_tile():
+    """
+    One spectrogram tile as a palette PNG: TILE_COLUMNS columns of BASE_COLUMN_SECONDS * 2**zoom
+    seconds each, starting at tile * the tile's span. Tiles are computed on the audio queue and cached on disk.
+    """
+    try:
+        file_id = request.args.get('file_id')
+        rttm_path = request.args.get('rttm_path')
+        zoom = request.args.get('zoom', type=int)
+        tile = request.args.get('tile', type=int)
+        if not file_id or zoom is None or tile is None:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        if not 0 <= zoom <= spectrogram.MAX_ZOOM or tile < 0:
+            return jsonify({'error': 'Invalid zoom or tile'}), 400
+        
+        audio_path = resolve_audio_path(file_id, rttm_path)
+        if not os.path.exists(audio_path):
+            return jsonify({'error': f'Audio file not found at {audio_path}'}), 404
+        
+        # The key covers the audio mtime, so it doubles as the ETag
+        key = spectrogram_tiles.make_key(audio_path, zoom, tile)
+        if request.if_none_match.contains(key):
+            response = Response(status=304)
+        else:
+            with timed('spectrogram_queue'):
+                data = audio_work.run(('spectrogram', key), spectrogram_tiles.render, key, audio_path, zoom, tile,
+                                      timeout=AUDIO_JOB_TIMEOUT)
+            response = Response(data, mimetype='image/png')
+        response.set_etag(key)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except QueueFull as e:
+        return busy_response(e)
+    except Exception as e:
+        app.logger.error(f"Error getting spectrogram tile: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/get_directories', methods=['POST'])
 def get_directories():
+    """One page of the subdirectories of base_path, optionally filtered by name prefix"""
     try:
         base_path = request.form.get('base_path', '/')
+        prefix = request.form.get('prefix', '')
+        cursor = request.form.get('cursor') or None
+        limit = request.form.get('limit', DIRECTORY_PAGE_SIZE, type=int)
         
         # Validate base path exists
         if not os.path.isdir(base_path):
             return jsonify({'error': f'Directory not found: {base_path}'}), 400
+        
+        if request.form.get('refresh', 'false').lower() == 'true':
+            directory_lister.invalidate(base_path)
             
-        # Get list of subdirectories
-        directories = []
+        # Get a page of subdirectories (the full listing is cached briefly, so paging is cheap)
         try:
-            for entry in os.listdir(base_path):
-                full_path = os.path.join(base_path, entry)
-                if os.path.isdir(full_path):
-                    directories.append({
-                        'name': entry,
-                        'path': full_path
-                    })
+            names, next_cursor, total = directory_lister.page(base_path, prefix, cursor, limit)
         except PermissionError:
             return jsonify({'error': f'Permission denied for: {base_path}'}), 403
-            
-        # Sort directories by name
-        directories.sort(key=lambda x: x['name'])
         
         return jsonify({
             'base_path': base_path,
-            'directories': directories
+            'directories': [{'name': name, 'path': os.path.join(base_path, name)} for name in names],
+            'next_cursor': next_cursor,
+            'total': total
         })
     except Exception as e:
         app.logger.error(f"Error getting directories: {str(e)}")
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/directory_hints', methods=['POST'])
+def directory_hints():
+    """Whether each of the given directories contains RTTM / WAV files"""
+    try:
+        paths = (request.json or {}).get('paths') or []
+        if not isinstance(paths, list):
+            return jsonify({'error': 'paths must be a list'}), 400
+        
+        return jsonify({'hints': directory_lister.hints_many(paths[:MAX_HINT_PATHS])})
+    except Exception as e:
+        app.logger.error(f"Error getting directory hints: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/browse_dialog', methods=['GET'])
 def browse_dialog():
     """Render a file browser dialog"""
@@ -492,117 +1285,174 @@ def get_root_directories():
 
 @app.route('/save_labels', methods=['POST'])
 def save_labels():
+    """Save labels as a new journal version (a patch against base_version, or a full segment list)"""
     try:
         data = request.json
         file_id = data.get('file_id')
-        segments = data.get('segments')
         rttm_path = data.get('rttm_path', '')
+        if not file_id:
+            return jsonify({'error': 'No file_id specified'}), 400
         
-        # Determine the appropriate output directory based on the input file's structure
-        if rttm_path:
-            # Get the relative directory structure from the original RTTM path
-            rel_dir = os.path.dirname(rttm_path)
-            output_dir = os.path.join(LABELS_DIR, rel_dir, file_id)
-        else:
-            output_dir = os.path.join(LABELS_DIR, file_id)
+        # A patch is a list of insert/update/delete operations; a plain segment list replaces everything
+        ops = data.get('ops')
+        if ops is None:
+            segments = data.get('segments')
+            if segments is None:
+                return jsonify({'error': 'No segments or ops specified'}), 400
+            ops = [{'op': 'replace', 'segments': segments}]
         
-        # Create the output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+        output_dir = label_output_dir(file_id, rttm_path)
+        store = LabelStore(output_dir, file_id)
+        try:
+            with timed('label_save'):
+                version, segments = store.save(ops, data.get('base_version'))
+        except VersionConflict as e:
+            return jsonify({'error': str(e), 'current_version': e.current_version}), 409
+        except LabelLocked as e:
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '1'
+            return response, 423
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid patch: {str(e)}'}), 400
         
-        # Add timestamp for versioning
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Make the new label file visible to the catalog right away
+        catalog_store.tree(LABELS_DIR, '.rttm').invalidate()
         
-        # Save the RTTM file
-        output_rttm_path = os.path.join(output_dir, f"{file_id}.rttm")
-        # Also create a backup with timestamp
-        output_rttm_backup = os.path.join(output_dir, f"{file_id}_{timestamp}.rttm")
+        return jsonify({
+            'success': True, 
+            'message': f'Labels saved to {output_dir} (version {version})',
+            'version': version,
+            'total_segments': len(segments),
+            'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S")
+        })
+    except Exception as e:
+        app.logger.error(f"Error saving labels: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/label_versions')
+def label_versions():
+    """List the saved versions of a file's labels, or return the segments of one version"""
+    try:
+        rttm_file = request.args.get('rttm_file')
+        if not rttm_file:
+            return jsonify({'error': 'No RTTM file specified'}), 400
         
-        # Save to both files
-        if not write_rttm(segments, output_rttm_path, file_id) or not write_rttm(segments, output_rttm_backup, file_id):
-            return jsonify({'error': 'Failed to save RTTM file'}), 500
+        file_id = os.path.basename(rttm_file).replace('.rttm', '')
+        store = LabelStore(label_output_dir(file_id, rttm_file), file_id)
         
-        # Save the segments as JSON for easier parsing later if needed
-        output_json_path = os.path.join(output_dir, f"{file_id}.json")
-        output_json_backup = os.path.join(output_dir, f"{file_id}_{timestamp}.json")
+        version = request.args.get('version', type=int)
+        if version is None:
+            return jsonify({
+                'file_id': file_id,
+                'current_version': store.current_version(),
+                'versions': store.versions()
+            })
         
         try:
-            with open(output_json_path, 'w') as f:
-                json.dump(segments, f, indent=2)
-            with open(output_json_backup, 'w') as f:
-                json.dump(segments, f, indent=2)
-        except Exception as e:
-            app.logger.error(f"Error saving JSON: {str(e)}")
-            app.logger.error(traceback.format_exc())
-            return jsonify({'error': f'Failed to save JSON file: {str(e)}'}), 500
-        
+            segments = store.load_version(version)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 404
         return jsonify({
-            'success': True, 
-            'message': f'Labels saved to {output_dir}',
-            'timestamp': timestamp
+            'file_id': file_id,
+            'version': version,
+            'segments': segments
         })
     except Exception as e:
-        app.logger.error(f"Error saving labels: {str(e)}")
+        app.logger.error(f"Error listing label versions: {str(e)}")
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
 @app.route('/stats')
 def stats():
+    """Corpus statistics page (or JSON with ?format=json)"""
     try:
-        stats = {
-            'rttm_count': 0,
-            'audio_count': 0,
-            'label_count': 0,
-            'categories': {}
-        }
-        
-        # Count RTTM files
-        for root, dirs, files in os.walk(RTTM_DIR):
-            for file in files:
-                if file.endswith('.rttm'):
-                    stats['rttm_count'] += 1
-                    # Get category (top-level directory)
-                    rel_path = os.path.relpath(root, RTTM_DIR)
-                    category = rel_path.split(os.sep)[0] if rel_path != '.' else 'root'
-                    
-                    if category not in stats['categories']:
-                        stats['categories'][category] = {'rttm': 0, 'audio': 0, 'labels': 0}
-                    
-                    stats['categories'][category]['rttm'] += 1
-        
-        # Count audio files
-        for root, dirs, files in os.walk(AUDIO_DIR):
-            for file in files:
-                if file.endswith('.wav'):
-                    stats['audio_count'] += 1
-                    # Get category (top-level directory)
-                    rel_path = os.path.relpath(root, AUDIO_DIR)
-                    category = rel_path.split(os.sep)[0] if rel_path != '.' else 'root'
-                    
-                    if category not in stats['categories']:
-                        stats['categories'][category] = {'rttm': 0, 'audio': 0, 'labels': 0}
-                    
-                    stats['categories'][category]['audio'] += 1
-        
-        # Count label files
-        for root, dirs, files in os.walk(LABELS_DIR):
-            for file in files:
-                if file.endswith('.rttm'):
-                    stats['label_count'] += 1
-                    # Get category (top-level directory)
-                    rel_path = os.path.relpath(root, LABELS_DIR)
-                    category = rel_path.split(os.sep)[0] if rel_path != '.' else 'root'
-                    
-                    if category not in stats['categories']:
-                        stats['categories'][category] = {'rttm': 0, 'audio': 0, 'labels': 0}
-                    
-                    stats['categories'][category]['labels'] += 1
+        # Durations and segment/speaker totals, recomputed only for files that changed
+        catalog = get_catalog()
+        with timed('corpus_stats'):
+            stats = corpus_stats.summarize(catalog)
+        # How much annotators changed, per category (per-file results are under /agreement)
+        with timed('agreement'):
+            stats['agreement'] = agreement_store.summarize(catalog)['totals']
         
+        if request.args.get('format') == 'json':
+            return jsonify(stats)
         return render_template('stats.html', stats=stats)
     except Exception as e:
         app.logger.error(f"Error in stats route: {str(e)}")
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/agreement')
+def agreement():
+    """Per-file original-vs-edited agreement as JSON, or CSV with ?format=csv; ?category= narrows it"""
+    try:
+        with timed('agreement'):
+            results = agreement_store.summarize(get_catalog())
+        category = request.args.get('category')
+        files = [item for item in results['files'] if not category or item['category'] == category]
+        
+        if request.args.get('format') == 'csv':
+            output = io.StringIO()
+            writer = csv.DictWriter(output, fieldnames=AGREEMENT_CSV_FIELDS, extrasaction='ignore', lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(files)
+            return Response(output.getvalue(), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=agreement.csv'})
+        return jsonify({'totals': results['totals'], 'files': files})
+    except Exception as e:
+        app.logger.error(f"Error in agreement route: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search')
+def search():
+    """Search segments (or files, with mode=files) across the corpus; JSON with ?format=json"""
+    try:
+        args = request.args
+        mode = args.get('mode', 'segments')
+        catalog = get_catalog()
+        
+        # Both searches first pick up new, edited and removed label files
+        if mode == 'files':
+            results = segment_db.search_files(
+                catalog,
+                min_speakers=args.get('min_speakers', type=int),
+                max_speakers=args.get('max_speakers', type=int),
+                min_segments=args.get('min_segments', type=int),
+                max_segments=args.get('max_segments', type=int),
+                category=args.get('category') or None,
+                file=args.get('file') or None,
+                offset=args.get('offset', 0, type=int),
+                limit=args.get('limit', SEARCH_PAGE_SIZE, type=int))
+            for item in results['files']:
+                item['editor_url'] = url_for('index', file=item['rttm_file'])
+        else:
+            cursor = args.get('cursor', type=int)
+            results = segment_db.search_segments(
+                catalog,
+                speaker=args.get('speaker') or None,
+                min_duration=args.get('min_duration', type=float),
+                max_duration=args.get('max_duration', type=float),
+                t0=args.get('t0', type=float),
+                t1=args.get('t1', type=float),
+                category=args.get('category') or None,
+                file=args.get('file') or None,
+                cursor=cursor,
+                limit=args.get('limit', SEARCH_PAGE_SIZE, type=int))
+            for item in results['segments']:
+                item['editor_url'] = url_for('index', file=item['rttm_file'], t=f"{item['start_time']:.3f}",
+                                             source=item['source'])
+        
+        if args.get('format') == 'json':
+            return jsonify(results)
+        return render_template('search.html', mode=mode, query=args, results=results,
+                               categories=catalog.categories())
+    except Exception as e:
+        app.logger.error(f"Error in search route: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('error.html', error='Page not found'), 404
@@ -612,4 +1462,6 @@ def server_error(error):
     return render_template('error.html', error='Server error'), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Serve through serve.py, so spawned pool workers don't re-import this module as __mp_main__
+    os.execv(sys.executable, [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')]
+             + sys.argv[1:])
\ No newline at end of file
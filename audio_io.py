@@ -0,0 +1,179 @@
+import io
+import os
+import struct
+from collections import namedtuple
+
+import soundfile as sf
+
+# WAV format tags we can slice without decoding
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Size of the chunks used when streaming sample data to a response
+STREAM_CHUNK_SIZE = 256 * 1024
+# Upper bound on a single coalesced read in batch extraction
+MAX_SPAN_BYTES = 16 * 1024 * 1024
+
+WavInfo = namedtuple('WavInfo', [
+    'format_tag',
+    'channels',
+    'sample_rate',
+    'bits_per_sample',
+    'block_align',
+    'data_offset',
+    'data_size',
+])
+
+
+def read_wav_header(audio_path):
+    """
+    Parse the RIFF header of a WAV file and locate its sample data.
+    Returns a WavInfo, or None if the file is not a PCM/float WAV we can slice directly.
+    """
+    file_size = os.path.getsize(audio_path)
+    with open(audio_path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[0:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            return None
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+            if chunk_id == b'fmt ':
+                fmt_data = f.read(chunk_size)
+                if len(fmt_data) < 16:
+                    return None
+                format_tag, channels, sample_rate, _, block_align, bits_per_sample = \
+                    struct.unpack('<HHIIHH', fmt_data[:16])
+                # WAVE_FORMAT_EXTENSIBLE stores the real format in the sub-format GUID
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt_data) >= 26:
+                    format_tag = struct.unpack('<H', fmt_data[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits_per_sample, block_align)
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    return None
+                format_tag, channels, sample_rate, bits_per_sample, block_align = fmt
+                if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) or block_align == 0:
+                    return None
+                data_offset = f.tell()
+                # Some writers leave the data size unset (0 or 0xFFFFFFFF) when streaming
+                data_size = min(chunk_size, file_size - data_offset) if chunk_size else file_size - data_offset
+                data_size -= data_size % block_align
+                return WavInfo(format_tag, channels, sample_rate, bits_per_sample,
+                               block_align, data_offset, data_size)
+            else:
+                f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+
+def wav_duration(info):
+    """Duration in seconds of the sample data described by a WavInfo"""
+    return (info.data_size // info.block_align) / float(info.sample_rate)
+
+
+def make_wav_header(info, data_size):
+    """Build a canonical 44-byte WAV header for `data_size` bytes of samples in the format of `info`"""
+    byte_rate = info.sample_rate * info.block_align
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, info.format_tag, info.channels, info.sample_rate,
+        byte_rate, info.block_align, info.bits_per_sample,
+        b'data', data_size,
+    )
+
+
+def segment_byte_range(info, start_time, duration):
+    """
+    Map a time window onto the sample data of a WAV file.
+    Returns (absolute byte offset, byte length), clamped to the available data.
+    Frame rounding matches librosa.load(offset=..., duration=...).
+    """
+    total_frames = info.data_size // info.block_align
+    start_frame = min(max(int(start_time * info.sample_rate), 0), total_frames)
+    if duration is None:
+        end_frame = total_frames
+    else:
+        end_frame = min(start_frame + max(int(duration * info.sample_rate), 0), total_frames)
+    return (info.data_offset + start_frame * info.block_align,
+            (end_frame - start_frame) * info.block_align)
+
+
+def stream_wav_segment(audio_path, info, start_time, duration, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield a WAV header followed by the raw sample bytes of the requested window"""
+    offset, length = segment_byte_range(info, start_time, duration)
+    yield make_wav_header(info, length)
+    with open(audio_path, 'rb') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def read_wav_segment(audio_path, start_time, duration):
+    """
+    Return a complete WAV file (header + samples) for the requested window as bytes.
+    PCM/float WAVs are sliced byte-for-byte; anything else goes through soundfile.
+    """
+    info = read_wav_header(audio_path)
+    if info is not None:
+        return b''.join(stream_wav_segment(audio_path, info, start_time, duration))
+
+    # Fallback for formats we cannot slice directly (compressed WAV, FLAC, ...)
+    with sf.SoundFile(audio_path) as src:
+        start_frame = min(max(int(start_time * src.samplerate), 0), src.frames)
+        frames = -1 if duration is None else max(int(duration * src.samplerate), 0)
+        src.seek(start_frame)
+        data = src.read(frames, dtype='int16', always_2d=True)
+        buffer = io.BytesIO()
+        sf.write(buffer, data, src.samplerate, format='WAV', subtype='PCM_16')
+        return buffer.getvalue()
+
+
+def read_wav_segments(audio_path, windows, max_gap_bytes=STREAM_CHUNK_SIZE, max_span_bytes=MAX_SPAN_BYTES):
+    """
+    Extract many (start_time, duration) windows from one file in a single sequential pass.
+
+    Windows are sorted by byte offset and coalesced into spans (overlapping windows, or
+    windows separated by at most `max_gap_bytes`, are read together, up to `max_span_bytes`
+    per read), each span is read once, and the clips are sliced out of it. Returns a list of complete WAV files (bytes)
+    in the order of `windows`.
+    """
+    info = read_wav_header(audio_path)
+    if info is None:
+        return [read_wav_segment(audio_path, start_time, duration) for start_time, duration in windows]
+
+    byte_ranges = [segment_byte_range(info, start_time, duration) for start_time, duration in windows]
+    order = sorted(range(len(byte_ranges)), key=lambda i: byte_ranges[i][0])
+
+    # Group the sorted windows into contiguous spans
+    spans = []
+    for i in order:
+        offset, length = byte_ranges[i]
+        if (spans and offset <= spans[-1][1] + max_gap_bytes and
+                max(spans[-1][1], offset + length) - spans[-1][0] <= max_span_bytes):
+            spans[-1][1] = max(spans[-1][1], offset + length)
+            spans[-1][2].append(i)
+        else:
+            spans.append([offset, offset + length, [i]])
+
+    results = [None] * len(windows)
+    with open(audio_path, 'rb') as f:
+        for span_start, span_end, members in spans:
+            f.seek(span_start)
+            span = f.read(span_end - span_start)
+            for i in members:
+                offset, length = byte_ranges[i]
+                data = span[offset - span_start:offset - span_start + length]
+                results[i] = make_wav_header(info, len(data)) + data
+    return results
@@ -0,0 +1,112 @@
+"""
+Generate a synthetic combined_dataset tree for benchmarks.
+
+Layout (same as the real corpus):
+    <base>/combined_dataset/rttm/<category>/<file_id>.rttm
+    <base>/combined_dataset/preprocessed/<category>/<file_id>.wav
+    <base>/combined_dataset/labels_diarization/
+
+Output is fully determined by the parameters and the seed.
+
+Example:
+    python benchmarks/generate_corpus.py /tmp/bench --categories 3 --files 10 --duration 600 --segments 400
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rttm import format_rttm  # noqa: E402
+
+DEFAULTS = {
+    'categories': 3,
+    'files': 5,
+    'duration': 120.0,
+    'segments': 100,
+    'speakers': 3,
+    'sample_rate': 16000,
+    'seed': 0,
+}
+
+
+def make_segments(rng, duration, n_segments, n_speakers):
+    """Random, mostly back-to-back speaker turns covering roughly the whole file"""
+    starts = np.sort(rng.uniform(0, duration, n_segments))
+    ends = np.append(starts[1:], duration)
+    # Leave small gaps and overlaps, as real diarization output does
+    ends = np.clip(ends + rng.normal(0, 0.2, n_segments), starts + 0.1, duration)
+    speakers = [f"S{code:02d}" for code in rng.integers(0, n_speakers, n_segments)]
+    return starts, ends - starts, speakers
+
+
+def make_audio(rng, duration, sample_rate):
+    """Low-level noise with some louder bursts, as 16-bit PCM"""
+    frames = int(duration * sample_rate)
+    samples = rng.normal(0, 600, frames)
+    envelope = np.repeat(rng.uniform(0.2, 3.0, frames // sample_rate + 1), sample_rate)[:frames]
+    return np.clip(samples * envelope, -32768, 32767).astype(np.int16)
+
+
+def generate_corpus(base_dir, categories=DEFAULTS['categories'], files=DEFAULTS['files'],
+                    duration=DEFAULTS['duration'], segments=DEFAULTS['segments'],
+                    speakers=DEFAULTS['speakers'], sample_rate=DEFAULTS['sample_rate'], seed=DEFAULTS['seed']):
+    """Write the corpus under base_dir and return a summary dict of what was generated"""
+    rng = np.random.default_rng(seed)
+    dataset = os.path.join(base_dir, 'combined_dataset')
+    rttm_root = os.path.join(dataset, 'rttm')
+    audio_root = os.path.join(dataset, 'preprocessed')
+    os.makedirs(os.path.join(dataset, 'labels_diarization'), exist_ok=True)
+
+    rttm_files = []
+    for c in range(categories):
+        category = f"category_{c:02d}"
+        os.makedirs(os.path.join(rttm_root, category), exist_ok=True)
+        os.makedirs(os.path.join(audio_root, category), exist_ok=True)
+        for f in range(files):
+            file_id = f"{category}_file_{f:04d}"
+            starts, durations, speaker_ids = make_segments(rng, duration, segments, speakers)
+            with open(os.path.join(rttm_root, category, f"{file_id}.rttm"), 'w') as out:
+                out.write(format_rttm(file_id, starts, durations, speaker_ids))
+            sf.write(os.path.join(audio_root, category, f"{file_id}.wav"),
+                     make_audio(rng, duration, sample_rate), sample_rate, subtype='PCM_16')
+            rttm_files.append(os.path.join(category, f"{file_id}.rttm"))
+
+    return {
+        'base_dir': base_dir,
+        'categories': categories,
+        'files': files,
+        'duration': duration,
+        'segments': segments,
+        'speakers': speakers,
+        'sample_rate': sample_rate,
+        'seed': seed,
+        'rttm_files': rttm_files,
+    }
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--categories', type=int, default=DEFAULTS['categories'], help="Number of categories (default: %(default)s)")
+    parser.add_argument('--files', type=int, default=DEFAULTS['files'], help="WAV/RTTM pairs per category (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=DEFAULTS['duration'], help="Seconds of audio per file (default: %(default)s)")
+    parser.add_argument('--segments', type=int, default=DEFAULTS['segments'], help="Segments per RTTM (default: %(default)s)")
+    parser.add_argument('--speakers', type=int, default=DEFAULTS['speakers'], help="Speakers per file (default: %(default)s)")
+    parser.add_argument('--sample-rate', type=int, default=DEFAULTS['sample_rate'], help="Audio sample rate (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'], help="Random seed (default: %(default)s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic combined_dataset tree")
+    parser.add_argument('base_dir', help="Directory that will contain combined_dataset/")
+    add_corpus_arguments(parser)
+    args = parser.parse_args(argv)
+    summary = generate_corpus(args.base_dir, args.categories, args.files, args.duration,
+                              args.segments, args.speakers, args.sample_rate, args.seed)
+    print(f"Generated {len(summary['rttm_files'])} files in {os.path.join(args.base_dir, 'combined_dataset')}")
+
+
+if __name__ == '__main__':
+    main()
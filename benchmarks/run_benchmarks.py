@@ -0,0 +1,254 @@
+"""
+Run the benchmark suite against a synthetic corpus and write the results as JSON.
+
+The corpus is generated (deterministically) into --base-dir, or into a temporary
+directory, and the app is pointed at it through LABEL_TOOL_BASE_DIR. Each benchmark is
+run --repeat times; results carry min/median/mean/p95 in milliseconds.
+
+Regressions are flagged when a median exceeds its limit in the thresholds file, or
+exceeds --tolerance times the median of the same benchmark in a --baseline results file.
+The exit status is 1 if anything regressed.
+
+Examples:
+    python benchmarks/run_benchmarks.py --output bench_output.json
+    python benchmarks/run_benchmarks.py --baseline bench_output.json --tolerance 1.3
+    python benchmarks/run_benchmarks.py --files 50 --duration 1800 --segments 1000 --only load_rttm save_labels
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from generate_corpus import generate_corpus, add_corpus_arguments  # noqa: E402
+
+DEFAULT_THRESHOLDS = os.path.join(BENCHMARK_DIR, 'thresholds.json')
+
+
+def summarize(times):
+    """Summary statistics in milliseconds"""
+    ms = np.array(times) * 1000.0
+    return {
+        'repeat': len(ms),
+        'min_ms': float(ms.min()),
+        'median_ms': float(np.median(ms)),
+        'mean_ms': float(ms.mean()),
+        'p95_ms': float(np.percentile(ms, 95)),
+    }
+
+
+def measure(fn, repeat, setup=None):
+    """Time fn() `repeat` times; setup(i) runs untimed before each call"""
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup(i)
+        started = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def define_benchmarks(app_module, corpus, work_dir):
+    """Name -> (fn(i), setup(i) or None). Everything goes through the same code paths as the web UI."""
+    from audio_io import read_wav_segment
+    from catalog import CatalogStore
+    from corpus_stats import CorpusStats
+    from segment_cache import SegmentCache
+    from rttm import parse_rttm, write_rttm
+
+    app = app_module.app
+    client = app.test_client()
+    rttm_dir = app_module.DEFAULT_RTTM_DIR
+    audio_dir = app_module.DEFAULT_AUDIO_DIR
+    rttm_files = corpus['rttm_files']
+    rng = np.random.default_rng(corpus['seed'])
+
+    def rttm_file(i):
+        return rttm_files[i % len(rttm_files)]
+
+    def file_id(i):
+        return os.path.basename(rttm_file(i))[:-len('.rttm')]
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+
+    parsed = [parse_rttm(os.path.join(rttm_dir, path)) for path in rttm_files]
+    windows = [(float(rng.uniform(0, corpus['duration'] - 5)), float(rng.uniform(0.5, 5))) for _ in range(1000)]
+
+    def extract_audio_segment(audio_path, start_time, duration, output_path):
+        # The slice-and-write path segments took before they were streamed from the source WAV
+        with open(output_path, 'wb') as f:
+            f.write(read_wav_segment(audio_path, start_time, duration))
+
+    def fresh_catalog(i):
+        app_module.catalog_store = CatalogStore(os.path.join(work_dir, f"catalog_{time.perf_counter_ns()}.sqlite"))
+
+    def fresh_stats(i):
+        fresh_catalog(i)
+        app_module.corpus_stats.shutdown()
+        app_module.corpus_stats = CorpusStats(os.path.join(work_dir, f"stats_{time.perf_counter_ns()}.sqlite"))
+
+    def invalidate_trees(i):
+        for tree in app_module.catalog_store._trees.values():
+            tree.invalidate()
+
+    def fresh_segment_cache(i):
+        app_module.segment_cache = SegmentCache(os.path.join(work_dir, f"segments_{time.perf_counter_ns()}"))
+
+    return {
+        'parse_rttm': (lambda i: parse_rttm(os.path.join(rttm_dir, rttm_file(i))), None),
+        'write_rttm': (lambda i: write_rttm(parsed[i % len(parsed)], os.path.join(work_dir, 'out.rttm'), file_id(i)), None),
+        'extract_audio_segment': (
+            lambda i: extract_audio_segment(
+                os.path.join(audio_dir, rttm_file(i)[:-len('.rttm')] + '.wav'),
+                windows[i % len(windows)][0], windows[i % len(windows)][1], os.path.join(work_dir, 'segment.wav')),
+            None),
+        'index_scan_cold': (lambda i: check(client.get('/')), fresh_catalog),
+        'index_scan_warm': (lambda i: check(client.get('/')), invalidate_trees),
+        'stats_cold': (lambda i: check(client.get('/stats')), fresh_stats),
+        'stats_warm': (lambda i: check(client.get('/stats')), invalidate_trees),
+        'load_rttm': (lambda i: check(client.post('/load_rttm', data={'rttm_file': rttm_file(i)})), None),
+        'get_segment': (
+            lambda i: check(client.get(check(client.post('/get_segment', json={
+                'file_id': file_id(i), 'rttm_path': rttm_file(i),
+                'start_time': windows[i % len(windows)][0], 'duration': windows[i % len(windows)][1],
+            })).get_json()['segment_url'])),
+            fresh_segment_cache),
+        'get_segment_cached': (
+            lambda i: check(client.get('/stream_segment', query_string={
+                'file_id': file_id(0), 'rttm_path': rttm_file(0),
+                'start': f"{windows[0][0]:.3f}", 'duration': f"{windows[0][1]:.3f}",
+            })),
+            None),
+        'save_labels': (
+            lambda i: check(client.post('/save_labels', json={
+                'file_id': file_id(i), 'rttm_path': rttm_file(i), 'segments': parsed[i % len(parsed)],
+            })),
+            None),
+    }
+
+
+def find_regressions(results, thresholds, baseline, tolerance):
+    """List of human-readable regression messages"""
+    regressions = []
+    for name, result in results.items():
+        limit = thresholds.get(name, {}).get('max_median_ms')
+        if limit is not None and result['median_ms'] > limit:
+            regressions.append(f"{name}: median {result['median_ms']:.2f} ms exceeds threshold {limit:.2f} ms")
+        previous = (baseline or {}).get('results', {}).get(name)
+        if previous and result['median_ms'] > previous['median_ms'] * tolerance:
+            regressions.append(f"{name}: median {result['median_ms']:.2f} ms is more than {tolerance:.2f}x "
+                               f"the baseline {previous['median_ms']:.2f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the label tool on a synthetic corpus")
+    parser.add_argument('--base-dir', help="Where to generate the corpus (default: a temporary directory, removed afterwards)")
+    add_corpus_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per benchmark (default: %(default)s)")
+    parser.add_argument('--only', nargs='+', help="Run only these benchmarks")
+    parser.add_argument('--output', help="Write the results JSON here (default: stdout)")
+    parser.add_argument('--baseline', help="Results JSON of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="Allowed median slowdown vs. the baseline (default: %(default)s)")
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help="JSON of per-benchmark max_median_ms limits (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    base_dir = args.base_dir or tempfile.mkdtemp(prefix='label_tool_bench_')
+    app_module = None
+    try:
+        print(f"Generating corpus in {base_dir}", file=sys.stderr)
+        corpus = generate_corpus(base_dir, args.categories, args.files, args.duration,
+                                 args.segments, args.speakers, args.sample_rate, args.seed)
+
+        # The app reads its directories at import time
+        os.environ['LABEL_TOOL_BASE_DIR'] = base_dir
+        import app as app_module
+        # Background warm-up would let one timed run prepare the next and compete with the timings
+        app_module.PREFETCH_FILES = 0
+
+        work_dir = os.path.join(base_dir, 'bench_work')
+        os.makedirs(work_dir, exist_ok=True)
+        benchmarks = define_benchmarks(app_module, corpus, work_dir)
+        names = args.only or list(benchmarks)
+        unknown = [name for name in names if name not in benchmarks]
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(unknown)} (available: {', '.join(benchmarks)})")
+
+        results = {}
+        for name in names:
+            fn, setup = benchmarks[name]
+            # One untimed warm-up run so imports and first-use costs don't skew the numbers
+            if setup is not None:
+                setup(0)
+            fn(0)
+            results[name] = summarize(measure(fn, args.repeat, setup))
+            print(f"{name:24s} median {results[name]['median_ms']:9.2f} ms   p95 {results[name]['p95_ms']:9.2f} ms",
+                  file=sys.stderr)
+    finally:
+        if app_module is not None:
+            # Previews scheduled by /load_rttm must not outlive the corpus
+            app_module.preview_store.shutdown()
+            app_module.warmup.shutdown()
+            app_module.agreement_store.shutdown()
+            app_module.corpus_stats.shutdown()
+        if not args.base_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, 'r') as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    regressions = find_regressions(results, thresholds, baseline, args.tolerance)
+
+    output = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'corpus': {key: value for key, value in corpus.items() if key not in ('rttm_files', 'base_dir')},
+        },
+        'results': results,
+        'regressions': regressions,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
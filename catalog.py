@@ -0,0 +1,325 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of seconds between two refreshes of the same tree
+DEFAULT_REFRESH_INTERVAL = 10.0
+# Seconds between background re-stats of the files in unchanged directories, which catch
+# files rewritten in place (that leaves the directory's mtime alone)
+RESTAT_INTERVAL = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    root TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    rel_dir TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (root, extension, rel_dir)
+);
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    rel_dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (root, extension, rel_dir, name)
+);
+"""
+
+
+def open_db(db_path, schema):
+    """SQLite connection shared by a process's threads, in WAL mode, with `schema` applied"""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(schema)
+    conn.commit()
+    return conn
+
+
+def category_of(rel_path):
+    """Top-level directory of a relative path, or 'root' for files directly under the root"""
+    parts = rel_path.split(os.sep)
+    return parts[0] if len(parts) > 1 else 'root'
+
+
+class CatalogStore:
+    """SQLite file that persists directory listings between restarts"""
+
+    def __init__(self, db_path, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self._trees = {}
+        self.conn = open_db(db_path, SCHEMA)
+
+    def tree(self, root, extension):
+        """Shared FileTree for (root, extension)"""
+        key = (os.path.realpath(root), extension)
+        with self.lock:
+            tree = self._trees.get(key)
+            if tree is None:
+                tree = FileTree(self, key[0], extension)
+                self._trees[key] = tree
+            return tree
+
+
+class FileTree:
+    """
+    Listing of all files with one extension below a root directory.
+
+    A refresh stats every known directory but only re-lists the ones whose mtime
+    changed since the last refresh, so unchanged trees cost one stat per directory.
+    Refreshes are throttled to one per `refresh_interval` seconds. A file rewritten in
+    place does not change its directory's mtime; those are caught by a background re-stat
+    of every listed file every RESTAT_INTERVAL seconds, which holds the store lock only to
+    record what changed.
+    """
+
+    def __init__(self, store, root, extension):
+        self.store = store
+        self.root = root
+        self.extension = extension
+        self.last_refresh = 0.0
+        # rel_dir -> mtime_ns
+        self.dirs = {}
+        # rel_dir -> {name: (size, mtime_ns)}
+        self.files = {}
+        # Bumped whenever a refresh finds changes, so callers can cheaply tell whether to rescan
+        self.generation = 0
+        self._sorted = None
+        self._last_restat = time.time()
+        self._restating = False
+        self._load()
+
+    def _load(self):
+        conn = self.store.conn
+        with self.store.lock:
+            for rel_dir, mtime_ns in conn.execute(
+                    'SELECT rel_dir, mtime_ns FROM dirs WHERE root = ? AND extension = ?',
+                    (self.root, self.extension)):
+                self.dirs[rel_dir] = mtime_ns
+            for rel_dir, name, size, mtime_ns in conn.execute(
+                    'SELECT rel_dir, name, size, mtime_ns FROM files WHERE root = ? AND extension = ?',
+                    (self.root, self.extension)):
+                self.files.setdefault(rel_dir, {})[name] = (size, mtime_ns)
+
+    def invalidate(self):
+        """Force the next access to refresh"""
+        self.last_refresh = 0.0
+
+    def refresh(self, force=False):
+        """Bring the listing up to date; cheap when nothing changed"""
+        with self.store.lock:
+            if not force and time.time() - self.last_refresh < self.store.refresh_interval:
+                return
+            with timed('catalog_scan'):
+                self._refresh()
+            if self._restating or time.time() - self._last_restat < RESTAT_INTERVAL:
+                return
+            self._restating = True
+        threading.Thread(target=self._restat, name='catalog-restat', daemon=True).start()
+
+    def _restat(self):
+        """Re-stat every listed file without holding the store lock, then record the ones that changed"""
+        try:
+            started = time.time()
+            with self.store.lock:
+                listing = [(rel_dir, name, stat) for rel_dir, names in self.files.items() for name, stat in names.items()]
+            changed = []
+            for rel_dir, name, stat in listing:
+                try:
+                    st = os.stat(os.path.join(self.root, rel_dir, name))
+                except OSError:
+                    # Gone: the directory's mtime changed, so the next refresh re-lists it
+                    continue
+                if (st.st_size, st.st_mtime_ns) != stat:
+                    changed.append((rel_dir, name, stat, (st.st_size, st.st_mtime_ns)))
+            if not changed:
+                return
+            with self.store.lock:
+                rows = []
+                for rel_dir, name, old, new in changed:
+                    listed = self.files.get(rel_dir)
+                    # Skip entries a refresh replaced in the meantime
+                    if listed is not None and listed.get(name) == old:
+                        listed[name] = new
+                        rows.append((new[0], new[1], self.root, self.extension, rel_dir, name))
+                if rows:
+                    self.store.conn.executemany(
+                        'UPDATE files SET size = ?, mtime_ns = ? WHERE root = ? AND extension = ? AND rel_dir = ? AND name = ?',
+                        rows)
+                    self.store.conn.commit()
+                    self.generation += 1
+            logger.info(f"Catalog re-stat of {self.root} (*{self.extension}) found {len(rows)} rewritten files "
+                        f"in {time.time() - started:.3f}s")
+        except Exception as e:
+            logger.error(f"Error re-stating catalog files under {self.root}: {str(e)}")
+        finally:
+            with self.store.lock:
+                self._restating = False
+                self._last_restat = time.time()
+
+    def _refresh(self):
+        """Re-list changed directories (caller holds the store lock)"""
+        started = time.time()
+        changed_dirs = 0
+        seen = set()
+        conn = self.store.conn
+
+        # Known subdirectories of each directory, so unchanged directories need no listing
+        children = {}
+        for rel_dir in self.dirs:
+            if rel_dir:
+                children.setdefault(os.path.dirname(rel_dir), []).append(rel_dir)
+
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            abs_dir = os.path.join(self.root, rel_dir) if rel_dir else self.root
+            try:
+                mtime_ns = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(rel_dir)
+
+            if self.dirs.get(rel_dir) == mtime_ns:
+                pending.extend(children.get(rel_dir, []))
+                continue
+
+            # Directory is new or changed: re-list it
+            changed_dirs += 1
+            subdirs = []
+            listed = {}
+            try:
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        try:
+                            # Symlinked directories are not followed (os.walk semantics), so links can't loop
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(os.path.join(rel_dir, entry.name) if rel_dir else entry.name)
+                            elif entry.name.endswith(self.extension) and entry.is_file():
+                                st = entry.stat()
+                                listed[entry.name] = (st.st_size, st.st_mtime_ns)
+                        except OSError:
+                            continue
+            except PermissionError:
+                logger.warning(f"Permission denied while scanning {abs_dir}")
+
+            self.files[rel_dir] = listed
+            self.dirs[rel_dir] = mtime_ns
+
+            conn.execute('DELETE FROM files WHERE root = ? AND extension = ? AND rel_dir = ?',
+                         (self.root, self.extension, rel_dir))
+            conn.executemany(
+                'INSERT INTO files (root, extension, rel_dir, name, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)',
+                [(self.root, self.extension, rel_dir, name, size, m) for name, (size, m) in listed.items()])
+            conn.execute('INSERT OR REPLACE INTO dirs (root, extension, rel_dir, mtime_ns) VALUES (?, ?, ?, ?)',
+                         (self.root, self.extension, rel_dir, mtime_ns))
+            pending.extend(subdirs)
+
+        # Forget directories that no longer exist
+        removed = [d for d in self.dirs if d not in seen]
+        for rel_dir in removed:
+            del self.dirs[rel_dir]
+            self.files.pop(rel_dir, None)
+            conn.execute('DELETE FROM dirs WHERE root = ? AND extension = ? AND rel_dir = ?',
+                         (self.root, self.extension, rel_dir))
+            conn.execute('DELETE FROM files WHERE root = ? AND extension = ? AND rel_dir = ?',
+                         (self.root, self.extension, rel_dir))
+
+        if changed_dirs or removed:
+            conn.commit()
+            self._sorted = None
+            self.generation += 1
+            logger.info(f"Catalog refreshed {self.root} (*{self.extension}): {changed_dirs} changed, "
+                        f"{len(removed)} removed directories in {time.time() - started:.3f}s")
+        self.last_refresh = time.time()
+
+    def sorted_files(self):
+        """All relative file paths, sorted"""
+        self.refresh()
+        with self.store.lock:
+            if self._sorted is None:
+                self._sorted = sorted(os.path.join(rel_dir, name) if rel_dir else name
+                                      for rel_dir, names in self.files.items() for name in names)
+            return self._sorted
+
+    def stat(self, rel_path):
+        """(size, mtime_ns) for a relative path as of the last listing of its directory, or None"""
+        self.refresh()
+        return self.files.get(os.path.dirname(rel_path), {}).get(os.path.basename(rel_path))
+
+
+class Catalog:
+    """
+    Pairing of RTTM files with their audio and saved labels.
+
+    RTTM `cat/name.rttm` pairs with audio `cat/name.wav` (falling back to `name.wav`
+    at the audio root) and with saved labels `cat/name/name.rttm` under the labels root.
+    """
+
+    def __init__(self, store, rttm_dir, audio_dir, labels_dir):
+        self.rttm_dir = rttm_dir
+        self.audio_dir = audio_dir
+        self.labels_dir = labels_dir
+        self.rttm = store.tree(rttm_dir, '.rttm')
+        self.audio = store.tree(audio_dir, '.wav')
+        self.labels = store.tree(labels_dir, '.rttm')
+
+    def rttm_files(self):
+        return self.rttm.sorted_files()
+
+    def generation(self):
+        """Changes whenever the RTTM or label listings change"""
+        self.rttm.refresh()
+        self.labels.refresh()
+        return (id(self.rttm), self.rttm.generation, id(self.labels), self.labels.generation)
+
+    def categories(self):
+        return sorted({category_of(p) for p in self.rttm_files()})
+
+    def audio_rel_path(self, rttm_file):
+        """Relative audio path for an RTTM file, or None if the audio is missing"""
+        file_id = os.path.basename(rttm_file).replace('.rttm', '')
+        rel_dir = os.path.dirname(rttm_file)
+        candidates = [os.path.join(rel_dir, f"{file_id}.wav")] if rel_dir else []
+        candidates.append(f"{file_id}.wav")
+        for candidate in candidates:
+            if self.audio.stat(candidate) is not None:
+                return candidate
+        return None
+
+    def audio_path(self, rttm_file):
+        rel_path = self.audio_rel_path(rttm_file)
+        return os.path.join(self.audio_dir, rel_path) if rel_path else None
+
+    @staticmethod
+    def saved_label_rel_path(rttm_file):
+        file_id = os.path.basename(rttm_file).replace('.rttm', '')
+        return os.path.join(os.path.dirname(rttm_file), file_id, f"{file_id}.rttm")
+
+    def saved_label_stat(self, rttm_file):
+        """(size, mtime_ns) of the saved labels for an RTTM file, or None"""
+        return self.labels.stat(self.saved_label_rel_path(rttm_file))
+
+    def entries(self):
+        """One dict per RTTM file with its pairing and flags"""
+        result = []
+        for rttm_file in self.rttm_files():
+            audio_rel = self.audio_rel_path(rttm_file)
+            result.append({
+                'rttm_file': rttm_file,
+                'category': category_of(rttm_file),
+                'audio_file': audio_rel,
+                'missing_audio': audio_rel is None,
+                'has_saved_labels': self.saved_label_stat(rttm_file) is not None,
+            })
+        return result
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import soundfile as sf
+
+from catalog import category_of, open_db
+from rttm import read_rttm, merge_segments
+from worker_pool import chunk_size, spawn_executor
+
+logger = logging.getLogger(__name__)
+
+# Processes used to read headers/RTTMs of new or changed files
+DEFAULT_WORKERS = 4
+
+# Fewer stale files than this are read inline instead of paying for the pool's startup
+INLINE_BATCH = 32
+
+# Bumped when the meaning of cached rows changes (2: original RTTMs are counted merged)
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_stats (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    segments INTEGER,
+    speech REAL,
+    speakers TEXT
+);
+"""
+
+
+def audio_file_stats(path):
+    """Duration of an audio file from its header only (no decoding)"""
+    return {'duration': sf.info(path).duration}
+
+
+def rttm_file_stats(path):
+    """Segment count, total speech seconds and speaker ids of an RTTM file as stored"""
+    return columns_stats(read_rttm(path))
+
+
+def merged_rttm_file_stats(path):
+    """rttm_file_stats() of an original RTTM merged the way /load_rttm presents it to the editor"""
+    return columns_stats(merge_segments(read_rttm(path)))
+
+
+def columns_stats(columns):
+    speakers = columns['speakers']
+    return {
+        'segments': len(columns['start']),
+        'speech': float(columns['duration'].sum()),
+        'speakers': sorted({speakers[code] for code in columns['speaker'].tolist()}),
+    }
+
+
+def compute_safely(task):
+    """Worker: compute(path), logging failures and returning None instead of raising"""
+    compute, path = task
+    try:
+        return compute(path)
+    except Exception as e:
+        logger.warning(f"Could not read stats for {path}: {str(e)}")
+        return None
+
+
+class CorpusStats:
+    """
+    Per-file statistics (audio duration, RTTM segment/speaker totals) cached by size and
+    mtime in SQLite, so a refresh only reads files that are new or changed since the last one.
+    Misses are computed in a process pool, since parsing RTTMs holds the GIL.
+    """
+
+    def __init__(self, db_path, workers=DEFAULT_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self.lock = threading.Lock()
+        self._executor = None
+
+        self.conn = open_db(db_path, SCHEMA)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.conn.execute('DELETE FROM file_stats')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.commit()
+
+        # path -> ((size, mtime_ns), stats dict)
+        self._cache = {}
+        for path, size, mtime_ns, duration, segments, speech, speakers in self.conn.execute(
+                'SELECT path, size, mtime_ns, duration, segments, speech, speakers FROM file_stats'):
+            self._cache[path] = ((size, mtime_ns), {
+                'duration': duration,
+                'segments': segments,
+                'speech': speech,
+                'speakers': json.loads(speakers) if speakers is not None else None,
+            })
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = spawn_executor(self.workers)
+        return self._executor
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def lookup(self, files, compute):
+        """
+        Stats for each (path, (size, mtime_ns)) in `files`, calling compute(path) in the
+        pool for entries missing from the cache. `compute` must be a module-level function
+        so it can be sent to the workers. Unreadable files map to None.
+        """
+        results = {}
+        stale = []
+        with self.lock:
+            for path, stat in files:
+                cached = self._cache.get(path)
+                if cached is not None and cached[0] == stat:
+                    results[path] = cached[1]
+                else:
+                    stale.append((path, stat))
+        if not stale:
+            return results
+
+        started = time.time()
+        tasks = [(compute, path) for path, _ in stale]
+        if len(tasks) < INLINE_BATCH:
+            computed = [compute_safely(task) for task in tasks]
+        else:
+            computed = list(self._pool().map(compute_safely, tasks, chunksize=chunk_size(len(tasks), self.workers)))
+
+        rows = []
+        with self.lock:
+            for (path, stat), values in zip(stale, computed):
+                results[path] = values
+                if values is None:
+                    continue
+                self._cache[path] = (stat, values)
+                speakers = values.get('speakers')
+                rows.append((path, stat[0], stat[1], values.get('duration'), values.get('segments'),
+                             values.get('speech'), json.dumps(speakers) if speakers is not None else None))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO file_stats (path, size, mtime_ns, duration, segments, speech, speakers) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+        logger.info(f"Corpus stats computed for {len(stale)} files in {time.time() - started:.3f}s")
+        return results
+
+    def prune(self, live_paths):
+        """Drop cached stats of files not in `live_paths` (deleted or renamed since they were read)"""
+        with self.lock:
+            gone = [path for path in self._cache if path not in live_paths]
+            if not gone:
+                return
+            for path in gone:
+                del self._cache[path]
+            self.conn.executemany('DELETE FROM file_stats WHERE path = ?', [(path,) for path in gone])
+            self.conn.commit()
+        logger.info(f"Corpus stats dropped for {len(gone)} removed files")
+
+    def summarize(self, catalog):
+        """
+        Corpus totals and per-category file counts, audio hours, labeled hours, segments and
+        speakers. Segment and speaker figures come from the saved labels where a file has them
+        and from the original RTTM, merged as the editor loads it, otherwise. Speaker labels
+        are only meaningful within a file, so speakers are counted per file and summed.
+        """
+        categories = {}
+
+        def category(name):
+            return categories.setdefault(name, {
+                'rttm': 0, 'audio': 0, 'labels': 0,
+                'audio_hours': 0.0, 'labeled_hours': 0.0, 'speech_hours': 0.0,
+                'segments': 0, 'speakers': 0,
+            })
+
+        # Audio durations, from headers
+        audio_files = [(rel_path, catalog.audio.stat(rel_path)) for rel_path in catalog.audio.sorted_files()]
+        audio_stats = self.lookup(
+            [(os.path.join(catalog.audio_dir, rel_path), stat) for rel_path, stat in audio_files if stat],
+            audio_file_stats)
+        durations = {}
+        for rel_path, stat in audio_files:
+            counts = category(category_of(rel_path))
+            counts['audio'] += 1
+            values = audio_stats.get(os.path.join(catalog.audio_dir, rel_path))
+            if values is not None:
+                durations[rel_path] = values['duration']
+                counts['audio_hours'] += values['duration'] / 3600.0
+
+        # Current labels of each RTTM file: the saved edits if any, else the original
+        rttm_files = catalog.rttm_files()
+        label_files = []
+        for rttm_file in rttm_files:
+            saved_stat = catalog.saved_label_stat(rttm_file)
+            if saved_stat is not None:
+                label_path = os.path.join(catalog.labels_dir, catalog.saved_label_rel_path(rttm_file))
+                label_files.append((rttm_file, label_path, saved_stat, True))
+            else:
+                label_files.append((rttm_file, os.path.join(catalog.rttm_dir, rttm_file), catalog.rttm.stat(rttm_file), False))
+        rttm_stats = self.lookup([(path, stat) for _, path, stat, is_saved in label_files if stat and is_saved],
+                                 rttm_file_stats)
+        rttm_stats.update(self.lookup([(path, stat) for _, path, stat, is_saved in label_files if stat and not is_saved],
+                                      merged_rttm_file_stats))
+        # Forget files the catalog no longer lists; originals of saved files stay cached for when
+        # their saved labels go away
+        live_paths = {os.path.join(catalog.audio_dir, rel_path) for rel_path, _ in audio_files}
+        live_paths.update(os.path.join(catalog.rttm_dir, rttm_file) for rttm_file in rttm_files)
+        live_paths.update(path for _, path, _, is_saved in label_files if is_saved)
+        self.prune(live_paths)
+
+        for rttm_file, path, stat, is_saved in label_files:
+            counts = category(category_of(rttm_file))
+            counts['rttm'] += 1
+            if is_saved:
+                counts['labels'] += 1
+                audio_rel = catalog.audio_rel_path(rttm_file)
+                if audio_rel in durations:
+                    counts['labeled_hours'] += durations[audio_rel] / 3600.0
+            values = rttm_stats.get(path)
+            if values is not None:
+                counts['segments'] += values['segments']
+                counts['speech_hours'] += values['speech'] / 3600.0
+                counts['speakers'] += len(values['speakers'])
+
+        totals = {
+            'rttm_count': 0, 'audio_count': 0, 'label_count': 0,
+            'audio_hours': 0.0, 'labeled_hours': 0.0, 'speech_hours': 0.0,
+            'segments': 0, 'speakers': 0,
+        }
+        for counts in categories.values():
+            totals['rttm_count'] += counts['rttm']
+            totals['audio_count'] += counts['audio']
+            totals['label_count'] += counts['labels']
+            for field in ('audio_hours', 'labeled_hours', 'speech_hours', 'segments', 'speakers'):
+                totals[field] += counts[field]
+        totals['categories'] = dict(sorted(categories.items()))
+        return totals
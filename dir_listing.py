@@ -0,0 +1,152 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Seconds a directory listing (or hint) is reused before the directory is read again
+DEFAULT_TTL = 15.0
+# Number of directories whose listings are kept
+DEFAULT_MAX_DIRS = 256
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+# File extensions reported by hints(), as hint name -> extension
+HINT_EXTENSIONS = {'rttm': '.rttm', 'wav': '.wav'}
+# Upper bound on directory entries looked at for one directory's hints; keeps
+# hints cheap on huge directories at the cost of occasional false negatives
+HINT_SCAN_LIMIT = 2000
+# Directories whose hints are computed concurrently
+DEFAULT_HINT_WORKERS = 8
+# Subdirectories looked into when a directory has no matching files itself
+# (e.g. a dataset root whose files live in per-category folders)
+HINT_SUBDIR_LIMIT = 5
+
+
+class DirectoryLister:
+    """
+    Cached, paginated listings of subdirectories for the folder browser.
+
+    A directory is read once with os.scandir (which gets the entry type from the
+    directory read itself, without a stat per entry) and the sorted names are reused
+    for `ttl` seconds, so paging and prefix filtering over a 50k-entry directory on a
+    network mount only pays for the directory read once.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_dirs=DEFAULT_MAX_DIRS, hint_workers=DEFAULT_HINT_WORKERS):
+        self.ttl = ttl
+        self.max_dirs = max_dirs
+        self._executor = ThreadPoolExecutor(max_workers=hint_workers, thread_name_prefix='dir-hints')
+        self._lock = threading.Lock()
+        # path -> (listed at, sorted subdirectory names)
+        self._listings = OrderedDict()
+        # path -> (computed at, hints dict)
+        self._hints = OrderedDict()
+
+    def _cached(self, cache, path):
+        with self._lock:
+            item = cache.get(path)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                return None
+            cache.move_to_end(path)
+            return item[1]
+
+    def _store(self, cache, path, value):
+        with self._lock:
+            cache[path] = (time.monotonic(), value)
+            cache.move_to_end(path)
+            while len(cache) > self.max_dirs:
+                cache.popitem(last=False)
+
+    def subdirectories(self, path):
+        """Sorted names of the subdirectories of `path` (raises OSError like os.scandir)"""
+        names = self._cached(self._listings, path)
+        if names is None:
+            with timed('dir_scan'):
+                names = []
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir():
+                                names.append(entry.name)
+                        except OSError:
+                            continue
+                names.sort()
+            self._store(self._listings, path, names)
+        return names
+
+    def page(self, path, prefix='', cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        One page of subdirectory names after `cursor` (the last name of the previous page)
+        whose names start with `prefix` (case-insensitive).
+        Returns (names, next cursor or None, number of matching names).
+        """
+        names = self.subdirectories(path)
+        if prefix:
+            folded = prefix.casefold()
+            names = [name for name in names if name.casefold().startswith(folded)]
+        start = bisect.bisect_right(names, cursor) if cursor else 0
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        selected = names[start:start + limit]
+        next_cursor = selected[-1] if start + limit < len(names) else None
+        return selected, next_cursor, len(names)
+
+    def hints(self, path):
+        """
+        Cheap content hints for a directory, e.g. {'rttm': True, 'wav': False}: whether it
+        (or one of its first few subdirectories) contains files with that extension.
+        """
+        hints = self._cached(self._hints, path)
+        if hints is not None:
+            return hints
+
+        found = {name: False for name in HINT_EXTENSIONS}
+        budget = HINT_SCAN_LIMIT
+        pending = [path]
+        subdirs_checked = 0
+        while pending and budget > 0 and not all(found.values()):
+            directory = pending.pop(0)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        budget -= 1
+                        if budget <= 0:
+                            break
+                        lower = entry.name.lower()
+                        for name, extension in HINT_EXTENSIONS.items():
+                            if not found[name] and lower.endswith(extension):
+                                found[name] = True
+                        if directory == path and subdirs_checked < HINT_SUBDIR_LIMIT:
+                            try:
+                                if entry.is_dir():
+                                    pending.append(entry.path)
+                                    subdirs_checked += 1
+                            except OSError:
+                                pass
+                        if all(found.values()):
+                            break
+            except OSError:
+                continue
+
+        self._store(self._hints, path, found)
+        return found
+
+    def hints_many(self, paths):
+        """hints() for several directories, read concurrently; path -> hints"""
+        return dict(zip(paths, self._executor.map(self.hints, paths)))
+
+    def invalidate(self, path=None):
+        """Drop cached listings and hints for `path`, or for everything"""
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+                self._hints.clear()
+            else:
+                self._listings.pop(path, None)
+                self._hints.pop(path, None)
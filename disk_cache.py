@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Other files in the cache directory are removed once they are this old; younger ones may be
+# another worker's file being written
+STALE_TEMP_SECONDS = 3600
+# Seconds between rescans of the cache directory, which pick up files written by other worker
+# processes so the size bound holds for all of them together
+DISK_RESCAN_INTERVAL = 60
+
+
+class DiskLRU:
+    """
+    Directory of cache files named `<key><suffix>`, bounded in bytes with least-recently-used
+    eviction. Files are written under a temp name and renamed, so readers never see a partial
+    file, and what is already on disk is adopted at startup without holding it up.
+
+    Worker processes sharing `cache_dir` each keep their own index; the directory is
+    rescanned every DISK_RESCAN_INTERVAL seconds, so files written by other workers count
+    against the bound (which can be overshot by what they wrote since the last rescan).
+    """
+
+    def __init__(self, cache_dir, suffix, max_bytes, name='disk-cache'):
+        self.cache_dir = cache_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._last_scan = time.monotonic()
+        self._scanning = True
+        threading.Thread(target=self._scan, name=f'{name}-scan', daemon=True).start()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _scan(self):
+        """
+        Index the cache files on disk and remove stale leftovers. Files this process already
+        knows keep their recency; files found for the first time (from an earlier run or
+        another worker) are treated as older, by access time.
+        """
+        try:
+            found = []
+            now = time.time()
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    if not entry.name.endswith(self.suffix):
+                        # Temp files of crashed writers and leftovers of older versions of the tool
+                        if now - st.st_mtime > STALE_TEMP_SECONDS:
+                            try:
+                                os.remove(entry.path)
+                            except OSError:
+                                pass
+                        continue
+                    found.append((st.st_atime, entry.name[:-len(self.suffix)], st.st_size))
+            found.sort()
+            with self._lock:
+                on_disk = {key: size for _, key, size in found}
+                entries = OrderedDict((key, size) for _, key, size in found if key not in self._entries)
+                entries.update((key, on_disk[key]) for key in self._entries if key in on_disk)
+                self._entries = entries
+                self._bytes = sum(entries.values())
+                self._evict()
+            logger.debug(f"{self.name} indexed {len(found)} files from {self.cache_dir}")
+        except Exception as e:
+            logger.error(f"Error indexing {self.name} in {self.cache_dir}: {str(e)}")
+        finally:
+            with self._lock:
+                self._scanning = False
+
+    def _maybe_rescan(self):
+        """Start a background rescan if the last one is older than DISK_RESCAN_INTERVAL (call with the lock held)"""
+        now = time.monotonic()
+        if self._scanning or now - self._last_scan < DISK_RESCAN_INTERVAL:
+            return
+        self._last_scan = now
+        self._scanning = True
+        threading.Thread(target=self._scan, name=f'{self.name}-scan', daemon=True).start()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """Bytes of the cached file, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            # File was removed behind our back; treat as a miss
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._bytes -= size
+            return None
+
+    def put(self, key, data):
+        """Store bytes under `key` (only marks it as used if it is already cached)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing {self.name} file {path}: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._bytes += len(data)
+            self._evict()
+            self._maybe_rescan()
+
+    def stats(self):
+        """Entry count, size and evictions"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'evictions': self.evictions}
@@ -0,0 +1,405 @@
+"""
+Export labeled segments as packed training shards from the command line.
+
+Every file with saved labels under LABELS_DIR is paired with its audio, and its
+segments are packed, in a fixed order, into shards of about --shard-size MB. Each
+shard is a 1-D NumPy array of mono samples (`shard-NNNNN.npy`, memory-mappable)
+plus an index (`shard-NNNNN.json`) with each segment's offset and length in
+samples, speaker, category, source file and source time. Shards are written by a
+process pool; every source file is read once per shard it contributes to, and
+optional resampling is done once per file and shard rather than per segment.
+
+The plan depends only on the inputs and options, so reruns produce identical
+shards. A shard whose index already matches the plan is skipped, so an
+interrupted export resumes where it stopped.
+
+Examples:
+    python export_shards.py --output-dir ../combined_dataset/shards
+    python export_shards.py --output-dir shards_16k --sample-rate 16000 --dtype float32
+    python export_shards.py --output-dir shards --categories ThongTinChinhPhu --shard-size 512
+"""
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import numpy as np
+import soundfile as sf
+
+from audio_io import read_wav_header
+from catalog import category_of
+from normalize_rttm import PROGRESS_INTERVAL
+from rttm import read_rttm
+from waveform import pcm_dtype
+from worker_pool import chunk_size
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_AUDIO_DIR = os.path.join(BASE_DIR, "combined_dataset/preprocessed")
+DEFAULT_LABELS_DIR = os.path.join(BASE_DIR, "combined_dataset/labels_diarization")
+
+SHARD_PREFIX = 'shard-'
+SUMMARY_NAME = 'export.json'
+DEFAULT_SHARD_MB = 256
+OUTPUT_DTYPES = ('int16', 'float32')
+# Extra audio resampled on each side of a span, so filter edge effects stay outside the segments
+RESAMPLE_PAD_SECONDS = 0.05
+# Longest stretch of a file read (and resampled) at once; consecutive segments are grouped
+# up to this span, so memory stays bounded however long the recording is
+READ_CHUNK_SECONDS = 60.0
+
+
+def find_labeled_files(labels_dir, categories=None):
+    """
+    RTTM paths (relative, as in the RTTM directory) of every file with saved labels, sorted.
+    Saved labels for `cat/name.rttm` live at `cat/name/name.rttm` under the labels root.
+    """
+    roots = [os.path.join(labels_dir, category) for category in categories] if categories else [labels_dir]
+    rttm_files = []
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            file_id = os.path.basename(dirpath)
+            if f"{file_id}.rttm" in filenames:
+                rel_dir = os.path.dirname(os.path.relpath(dirpath, labels_dir))
+                rttm_files.append(os.path.join(rel_dir, f"{file_id}.rttm") if rel_dir else f"{file_id}.rttm")
+    return sorted(rttm_files)
+
+
+def audio_format(audio_path):
+    """(sample rate, frames, channels) from the WAV header, or from soundfile for other formats"""
+    info = read_wav_header(audio_path)
+    if info is not None:
+        return info.sample_rate, info.data_size // info.block_align, info.channels
+    info = sf.info(audio_path)
+    return info.samplerate, info.frames, info.channels
+
+
+def resample_ratio(sample_rate, target_rate):
+    """(up, down) with target_rate / sample_rate == up / down in lowest terms"""
+    divisor = math.gcd(target_rate, sample_rate)
+    return target_rate // divisor, sample_rate // divisor
+
+
+def plan_file(task):
+    """Worker: read one file's saved segments and audio header. Returns a file dict."""
+    rttm_file, labels_dir, audio_dir, target_rate, min_duration = task
+    file_id = os.path.basename(rttm_file).replace('.rttm', '')
+    rel_dir = os.path.dirname(rttm_file)
+    result = {'rttm_file': rttm_file, 'file_id': file_id, 'category': category_of(rttm_file)}
+    try:
+        label_path = os.path.join(labels_dir, rel_dir, file_id, f"{file_id}.rttm")
+        audio_path = None
+        for candidate in (os.path.join(audio_dir, rel_dir, f"{file_id}.wav"), os.path.join(audio_dir, f"{file_id}.wav")):
+            if os.path.exists(candidate):
+                audio_path = candidate
+                break
+        if audio_path is None:
+            result['error'] = 'Audio file not found'
+            return result
+
+        sample_rate, frames, channels = audio_format(audio_path)
+        output_rate = target_rate or sample_rate
+        if target_rate:
+            up, down = resample_ratio(sample_rate, target_rate)
+            output_frames = -(-frames * up // down)
+        else:
+            output_frames = frames
+
+        # Sample ranges at the output rate; segments past the end of the audio are clipped
+        columns = read_rttm(label_path)
+        segments = []
+        for start, duration, code in sorted(zip(columns['start'].tolist(), columns['duration'].tolist(),
+                                                columns['speaker'].tolist())):
+            if duration <= 0 or duration < min_duration:
+                continue
+            first = max(int(round(start * output_rate)), 0)
+            last = min(int(round((start + duration) * output_rate)), output_frames)
+            if last > first:
+                segments.append([start, duration, columns['speakers'][code], first, last - first])
+
+        label_stat = os.stat(label_path)
+        audio_stat = os.stat(audio_path)
+        result.update({
+            'audio_path': audio_path,
+            'sample_rate': sample_rate,
+            'output_rate': output_rate,
+            'frames': frames,
+            'channels': channels,
+            # Part of every shard's plan key, so changed inputs invalidate the shards they went into
+            'source': [label_stat.st_size, label_stat.st_mtime_ns, audio_stat.st_size, audio_stat.st_mtime_ns],
+            'segments': segments,
+        })
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+    return result
+
+
+def plan_shards(files, shard_bytes, itemsize):
+    """
+    Pack the segments of `files` (in order) into shards of at most `shard_bytes` (a single
+    longer segment gets a shard of its own). Each shard is a list of pieces: a file and the
+    consecutive run of its segments that went into the shard.
+    """
+    shards = []
+    pieces, size = [], 0
+    for file in files:
+        piece = None
+        for segment in file['segments']:
+            segment_bytes = segment[4] * itemsize
+            if pieces and size + segment_bytes > shard_bytes:
+                shards.append(pieces)
+                pieces, size, piece = [], 0, None
+            if piece is None:
+                piece = {key: value for key, value in file.items() if key != 'segments'}
+                piece['segments'] = []
+                pieces.append(piece)
+            piece['segments'].append(segment)
+            size += segment_bytes
+    if pieces:
+        shards.append(pieces)
+    return shards
+
+
+def plan_key(pieces, options):
+    """Digest of everything that determines a shard's contents"""
+    raw = json.dumps({'pieces': pieces, 'options': options}, sort_keys=True)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def shard_done(output_dir, name, key):
+    """True if the shard's index exists and was written for the same plan"""
+    try:
+        with open(os.path.join(output_dir, f"{name}.json"), 'r') as f:
+            return json.load(f).get('plan_key') == key and os.path.exists(os.path.join(output_dir, f"{name}.npy"))
+    except (OSError, ValueError):
+        return False
+
+
+def read_span(piece, first_frame, last_frame):
+    """Mono float32 samples [first_frame, last_frame) of a piece's audio, memory-mapped when possible"""
+    audio_path = piece['audio_path']
+    info = read_wav_header(audio_path)
+    dtype, full_scale = pcm_dtype(info) if info is not None else (None, None)
+    if dtype is not None:
+        data = np.memmap(audio_path, dtype=dtype, mode='r', offset=info.data_offset,
+                         shape=(info.data_size // info.block_align, info.channels))
+        samples = np.asarray(data[first_frame:last_frame], dtype=np.float32)
+        del data
+        if dtype == np.dtype('u1'):
+            samples -= 128.0
+        samples /= full_scale
+    else:
+        with sf.SoundFile(audio_path) as src:
+            src.seek(first_frame)
+            samples = src.read(last_frame - first_frame, dtype='float32', always_2d=True)
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+
+def segment_groups(segments, max_samples):
+    """Runs of consecutive segments whose span (in output samples) fits in `max_samples`; longer segments stand alone"""
+    groups = []
+    group = []
+    for segment in segments:
+        if group and segment[3] + segment[4] - min(s[3] for s in group) > max_samples:
+            groups.append(group)
+            group = []
+        group.append(segment)
+    if group:
+        groups.append(group)
+    return groups
+
+
+def piece_audio(piece, segments, target_rate):
+    """
+    Audio covering `segments` of a piece at the output rate, read in one pass (and resampled in
+    one call when `target_rate` differs). Returns (samples, output-rate index of samples[0]).
+    """
+    sample_rate = piece['sample_rate']
+    first_out = min(segment[3] for segment in segments)
+    last_out = max(segment[3] + segment[4] for segment in segments)
+    if not target_rate or target_rate == sample_rate:
+        return read_span(piece, first_out, last_out), first_out
+
+    from scipy.signal import resample_poly
+    up, down = resample_ratio(sample_rate, target_rate)
+    pad = int(RESAMPLE_PAD_SECONDS * sample_rate)
+    # Start on a multiple of `down`, so output sample k of the span is exactly output sample
+    # first * up / down + k of the whole file, whichever span the segments fall in
+    first = max(first_out * down // up - pad, 0) // down * down
+    last = min(-(-last_out * down // up) + pad, piece['frames'])
+    resampled = resample_poly(read_span(piece, first, last), up, down).astype(np.float32)
+    return resampled, first * up // down
+
+
+def write_shard(task):
+    """Worker: cut, convert and pack one shard's segments, then write its index. Returns a result dict."""
+    output_dir, name, key, pieces, options = task
+    result = {'name': name, 'segments': 0, 'samples': 0, 'seconds': 0.0}
+    npy_path = os.path.join(output_dir, f"{name}.npy")
+    index_path = os.path.join(output_dir, f"{name}.json")
+    tmp_npy_path = f"{npy_path}.tmp"
+    try:
+        dtype = np.dtype(options['dtype'])
+        total = sum(segment[4] for piece in pieces for segment in piece['segments'])
+        output = np.lib.format.open_memmap(tmp_npy_path, mode='w+', dtype=dtype, shape=(total,))
+        index = []
+        offset = 0
+        for piece in pieces:
+            for group in segment_groups(piece['segments'], int(READ_CHUNK_SECONDS * piece['output_rate'])):
+                samples, base = piece_audio(piece, group, options['sample_rate'])
+                for start, duration, speaker, first, length in group:
+                    clip = samples[first - base:first - base + length]
+                    if len(clip) < length:
+                        clip = np.concatenate([clip, np.zeros(length - len(clip), dtype=np.float32)])
+                    if dtype == np.int16:
+                        clip = np.clip(np.round(clip * 32768.0), -32768, 32767)
+                    output[offset:offset + length] = clip
+                    index.append({
+                        'offset': offset,
+                        'length': length,
+                        'sample_rate': piece['output_rate'],
+                        'speaker': speaker,
+                        'category': piece['category'],
+                        'rttm_file': piece['rttm_file'],
+                        'file_id': piece['file_id'],
+                        'start_time': start,
+                        'duration': duration,
+                    })
+                    offset += length
+                    result['seconds'] += length / piece['output_rate']
+        output.flush()
+        del output
+        os.replace(tmp_npy_path, npy_path)
+
+        # The index goes last: its presence (with the plan key) marks the shard as complete
+        tmp_index_path = f"{index_path}.tmp"
+        with open(tmp_index_path, 'w') as f:
+            json.dump({'plan_key': key, 'dtype': dtype.name, 'samples': total, 'segments': index}, f, sort_keys=True)
+        os.replace(tmp_index_path, index_path)
+        result['segments'] = len(index)
+        result['samples'] = total
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        result['traceback'] = traceback.format_exc()
+        try:
+            os.remove(tmp_npy_path)
+        except OSError:
+            pass
+    return result
+
+
+def load_shard(output_dir, name, mmap=True):
+    """(samples array, index entries) of an exported shard; `samples[e['offset']:e['offset'] + e['length']]` is one segment"""
+    with open(os.path.join(output_dir, f"{name}.json"), 'r') as f:
+        index = json.load(f)
+    samples = np.load(os.path.join(output_dir, f"{name}.npy"), mmap_mode='r' if mmap else None)
+    return samples, index['segments']
+
+
+def remove_stale_shards(output_dir, names):
+    """Delete shard files from earlier runs that are not part of the current plan"""
+    keep = set(names)
+    for entry in os.listdir(output_dir):
+        if not entry.startswith(SHARD_PREFIX):
+            continue
+        name = entry.split('.', 1)[0]
+        if name not in keep:
+            os.remove(os.path.join(output_dir, entry))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pack labeled segments into training shards")
+    parser.add_argument('--labels-dir', default=DEFAULT_LABELS_DIR, help="Root of the saved labels (default: %(default)s)")
+    parser.add_argument('--audio-dir', default=DEFAULT_AUDIO_DIR, help="Root of the audio files (default: %(default)s)")
+    parser.add_argument('--output-dir', required=True, help="Directory for the shards")
+    parser.add_argument('--categories', nargs='+', help="Only export these top-level categories")
+    parser.add_argument('--shard-size', type=float, default=DEFAULT_SHARD_MB, help="Target shard size in MB (default: %(default)s)")
+    parser.add_argument('--sample-rate', type=int, default=0, help="Resample every file to this rate (default: keep each file's rate)")
+    parser.add_argument('--dtype', choices=OUTPUT_DTYPES, default='int16', help="Sample type of the shards (default: %(default)s)")
+    parser.add_argument('--min-duration', type=float, default=0.0, help="Skip segments shorter than this many seconds (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores, %(default)s)")
+    parser.add_argument('--restart', action='store_true', help="Rewrite every shard, even those that are already complete")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    labels_dir = os.path.abspath(args.labels_dir)
+    audio_dir = os.path.abspath(args.audio_dir)
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    options = {'sample_rate': args.sample_rate or None, 'dtype': args.dtype, 'min_duration': args.min_duration}
+
+    rttm_files = find_labeled_files(labels_dir, args.categories)
+    print(f"{len(rttm_files)} labeled files, planning with {args.workers} workers", file=sys.stderr)
+    started = time.time()
+    failed_files = []
+    failed_shards = []
+    with multiprocessing.Pool(args.workers) as pool:
+        # Ordered results keep the plan (and so every shard) deterministic
+        files = []
+        tasks = [(rttm_file, labels_dir, audio_dir, args.sample_rate, args.min_duration) for rttm_file in rttm_files]
+        for file in pool.imap(plan_file, tasks, chunksize=chunk_size(len(tasks), args.workers)):
+            if 'error' in file:
+                failed_files.append({'rttm_file': file['rttm_file'], 'error': file['error']})
+                print(f"ERROR {file['rttm_file']}: {file['error']}", file=sys.stderr)
+                continue
+            files.append(file)
+
+        shards = plan_shards(files, int(args.shard_size * 1024 * 1024), np.dtype(args.dtype).itemsize)
+        names = [f"{SHARD_PREFIX}{i:05d}" for i in range(len(shards))]
+        keys = [plan_key(pieces, options) for pieces in shards]
+        shard_tasks = [(output_dir, name, key, pieces, options) for name, key, pieces in zip(names, keys, shards)
+                       if args.restart or not shard_done(output_dir, name, key)]
+        print(f"{len(shards)} shards, {len(shards) - len(shard_tasks)} already complete, {len(shard_tasks)} to write",
+              file=sys.stderr)
+
+        written = samples = 0
+        seconds = 0.0
+        last_report = time.time()
+        for result in pool.imap_unordered(write_shard, shard_tasks):
+            if 'error' in result:
+                failed_shards.append({'name': result['name'], 'error': result['error']})
+                print(f"ERROR {result['name']}: {result['error']}", file=sys.stderr)
+                continue
+            written += 1
+            samples += result['samples']
+            seconds += result['seconds']
+
+            now = time.time()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                elapsed = now - started
+                print(f"[{written}/{len(shard_tasks)}] {seconds / 3600:.2f} h of audio, "
+                      f"{samples * np.dtype(args.dtype).itemsize / elapsed / 1e6:.1f} MB/s", file=sys.stderr)
+
+    # Failures are listed rather than aborting: the shards that were written are still valid,
+    # and the files of a failed shard are retried by the next run
+    remove_stale_shards(output_dir, names)
+    failed_names = {failure['name'] for failure in failed_shards}
+    summary = {
+        'options': options,
+        'files': len(files),
+        'shards': [{'name': name, 'plan_key': key, 'segments': sum(len(piece['segments']) for piece in pieces),
+                    'complete': name not in failed_names}
+                   for name, key, pieces in zip(names, keys, shards)],
+        'failed_files': failed_files,
+        'failed_shards': failed_shards,
+    }
+    with open(os.path.join(output_dir, SUMMARY_NAME), 'w') as f:
+        json.dump(summary, f, indent=1, sort_keys=True)
+    failed = len(failed_files) + len(failed_shards)
+
+    elapsed = max(time.time() - started, 1e-9)
+    print(f"Wrote {written} shards ({failed} failures) in {elapsed:.1f}s: {seconds / 3600:.2f} h of audio, "
+          f"{samples * np.dtype(args.dtype).itemsize / elapsed / 1e6:.1f} MB/s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): saves are only serialized within one process
+    fcntl = None
+
+from rttm import read_rttm, format_rttm
+
+# Write a full snapshot every this many versions so replays stay short; the journal is
+# rotated at each snapshot, so the live journal never holds more than this many versions
+SNAPSHOT_INTERVAL = 50
+
+# Seconds a save waits for another process's save of the same file before giving up
+LOCK_TIMEOUT = 10.0
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+class VersionConflict(Exception):
+    """Raised when a patch is based on a version that is no longer current"""
+
+    def __init__(self, current_version):
+        super().__init__(f"Labels have changed since version was loaded (current version is {current_version})")
+        self.current_version = current_version
+
+
+class LabelLocked(Exception):
+    """Raised when another save of the same file holds the lock for longer than the timeout"""
+
+
+def _path_lock(output_dir):
+    with _path_locks_guard:
+        lock = _path_locks.get(output_dir)
+        if lock is None:
+            lock = _path_locks[output_dir] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def locked(output_dir, lock_path, timeout=LOCK_TIMEOUT):
+    """
+    Hold the in-process lock and an exclusive advisory lock on `lock_path`, so saves to the
+    same file from any thread or worker process run one at a time.
+    Raises LabelLocked if the locks cannot be taken within `timeout` seconds.
+    """
+    thread_lock = _path_lock(output_dir)
+    if not thread_lock.acquire(timeout=timeout):
+        raise LabelLocked(f"Labels in {output_dir} are being saved by another request")
+    try:
+        if fcntl is None:
+            yield
+            return
+        deadline = time.time() + timeout
+        with open(lock_path, 'a') as f:
+            while True:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.time() >= deadline:
+                        raise LabelLocked(f"Labels in {output_dir} are being saved by another process")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        thread_lock.release()
+
+
+def atomic_write(path, text):
+    """Write text to a temp file next to `path`, fsync it, and rename it into place"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def normalize_segment(segment, file_id):
+    """Keep only the stored fields of a segment and recompute its end time"""
+    start_time = float(segment['start_time'])
+    duration = float(segment['duration'])
+    return {
+        'file_id': segment.get('file_id') or file_id,
+        'start_time': start_time,
+        'duration': duration,
+        'end_time': start_time + duration,
+        'speaker_id': str(segment['speaker_id']),
+    }
+
+
+def sort_segments(segments):
+    """Canonical segment order (the client sorts with the same key so indices line up)"""
+    segments.sort(key=lambda s: (s['start_time'], s['end_time'], s['speaker_id']))
+    return segments
+
+
+def apply_ops(base_segments, ops, file_id):
+    """
+    Apply patch operations to a segment list and return the new list.
+    `update`/`delete` indices refer to positions in `base_segments` (or in the segments of
+    the last `replace`); inserts are appended and the result is put back into canonical order.
+    Raises ValueError for unknown operations and out-of-range indices.
+    """
+    segments = list(base_segments)
+    deleted = set()
+    inserted = []
+    for op in ops:
+        kind = op.get('op')
+        if kind == 'replace':
+            segments = [normalize_segment(s, file_id) for s in op['segments']]
+            deleted = set()
+            inserted = []
+        elif kind == 'insert':
+            inserted.append(normalize_segment(op['segment'], file_id))
+        elif kind in ('update', 'delete'):
+            index = int(op['index'])
+            # After a `replace`, indices refer to the replacing list
+            if not 0 <= index < len(segments):
+                raise ValueError(f"Segment index out of range: {index}")
+            if kind == 'update':
+                segments[index] = normalize_segment(op['segment'], file_id)
+            else:
+                deleted.add(index)
+        else:
+            raise ValueError(f"Unknown patch operation: {kind}")
+
+    segments = [s for i, s in enumerate(segments) if i not in deleted] + inserted
+    return sort_segments(segments)
+
+
+class LabelStore:
+    """
+    Versioned label storage for one file (a directory under LABELS_DIR).
+
+    Layout:
+      <id>.journal.jsonl           append-only list of the versions since the last snapshot,
+                                   each a list of patch ops
+      <id>.snapshot-<version>.json full segment list every SNAPSHOT_INTERVAL versions
+      <id>.journal-<version>.jsonl the journal rotated out when snapshot <version> was written
+      <id>.head.json               current version and journal size
+      <id>.rttm / <id>.json        current labels, materialized atomically after each save
+      <id>.lock                    advisory lock held while saving
+    """
+
+    def __init__(self, output_dir, file_id):
+        self.output_dir = output_dir
+        self.file_id = file_id
+        self.journal_path = os.path.join(output_dir, f"{file_id}.journal.jsonl")
+        self.head_path = os.path.join(output_dir, f"{file_id}.head.json")
+        self.rttm_path = os.path.join(output_dir, f"{file_id}.rttm")
+        self.json_path = os.path.join(output_dir, f"{file_id}.json")
+        self.lock_path = os.path.join(output_dir, f"{file_id}.lock")
+
+    def _snapshot_path(self, version):
+        return os.path.join(self.output_dir, f"{self.file_id}.snapshot-{version:06d}.json")
+
+    def _archive_path(self, version):
+        return os.path.join(self.output_dir, f"{self.file_id}.journal-{version:06d}.jsonl")
+
+    def _numbered_versions(self, prefix, suffix):
+        versions = []
+        if os.path.isdir(self.output_dir):
+            for name in os.listdir(self.output_dir):
+                if name.startswith(prefix) and name.endswith(suffix):
+                    try:
+                        versions.append(int(name[len(prefix):-len(suffix)]))
+                    except ValueError:
+                        continue
+        return sorted(versions)
+
+    def _snapshot_versions(self):
+        return self._numbered_versions(f"{self.file_id}.snapshot-", '.json')
+
+    def _archive_versions(self):
+        return self._numbered_versions(f"{self.file_id}.journal-", '.jsonl')
+
+    def _read_head(self):
+        try:
+            with open(self.head_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def _legacy_segments(self):
+        """Current labels saved before versioning existed (JSON preferred, RTTM otherwise)"""
+        if os.path.exists(self.json_path):
+            with open(self.json_path, 'r') as f:
+                return sort_segments([normalize_segment(s, self.file_id) for s in json.load(f)])
+        if os.path.exists(self.rttm_path):
+            columns = read_rttm(self.rttm_path)
+            return sort_segments([
+                normalize_segment({'file_id': fid, 'start_time': start, 'duration': duration,
+                                   'speaker_id': columns['speakers'][code]}, self.file_id)
+                for fid, start, duration, code in zip(
+                    columns['file_id'].tolist(), columns['start'].tolist(),
+                    columns['duration'].tolist(), columns['speaker'].tolist())
+            ])
+        return []
+
+    @staticmethod
+    def _read_journal(path):
+        """
+        Entries of one journal file, oldest first, and the byte size of its intact prefix.
+        Reading stops at the first line that is not a complete JSON line (a torn append).
+        """
+        entries = []
+        good_size = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    if line.strip():
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            break
+                    good_size += len(line)
+        return entries, good_size
+
+    def journal(self):
+        """Entries of the live journal (the versions since the last snapshot), oldest first"""
+        return self._read_journal(self.journal_path)[0]
+
+    def _latest_version(self, entries):
+        """Current version given the live journal's entries"""
+        if entries:
+            return entries[-1]['version']
+        snapshots = self._snapshot_versions()
+        return snapshots[-1] if snapshots else 0
+
+    def current_version(self):
+        """Current version number (0 if nothing has been saved through the journal)"""
+        head = self._read_head()
+        if head is not None and head.get('journal_size') == self._journal_size():
+            return head['version']
+        return self._latest_version(self.journal())
+
+    def _entries_after(self, snapshot):
+        """Journal entries following `snapshot`: the archive rotated out at the next snapshot, or the live journal"""
+        later = [v for v in self._archive_versions() if v > snapshot]
+        if later:
+            return self._read_journal(self._archive_path(later[0]))[0]
+        return self.journal()
+
+    def load_version(self, version=None):
+        """Segment list at `version` (current if None), replayed from the nearest snapshot"""
+        latest = self._latest_version(self.journal())
+        if version is None:
+            version = latest
+        if not 0 <= version <= latest:
+            raise ValueError(f"Unknown version: {version}")
+
+        snapshots = [v for v in self._snapshot_versions() if v <= version]
+        if snapshots:
+            with open(self._snapshot_path(snapshots[-1]), 'r') as f:
+                segments = json.load(f)['segments']
+            start = snapshots[-1]
+        else:
+            segments = []
+            start = 0
+        for entry in self._entries_after(start):
+            if start < entry['version'] <= version:
+                segments = apply_ops(segments, entry['ops'], self.file_id)
+        return segments
+
+    def current_segments(self):
+        """Current segment list, without replaying when the materialized files are up to date"""
+        head = self._read_head()
+        if head is not None and head.get('journal_size') == self._journal_size() and os.path.exists(self.json_path):
+            with open(self.json_path, 'r') as f:
+                return json.load(f)
+        return self.load_version()
+
+    def _materialize(self, version, segments):
+        atomic_write(self.rttm_path, format_rttm(
+            self.file_id,
+            [s['start_time'] for s in segments],
+            [s['duration'] for s in segments],
+            [s['speaker_id'] for s in segments]))
+        atomic_write(self.json_path, json.dumps(segments))
+        atomic_write(self.head_path, json.dumps({
+            'version': version,
+            'journal_size': self._journal_size(),
+            'updated': time.time(),
+        }))
+
+    def save(self, ops, base_version=None):
+        """
+        Append a new version made of `ops` and materialize the current labels.
+        Raises VersionConflict if `base_version` is given and is not the current version,
+        and LabelLocked if another save of the same file does not finish in time.
+        Returns (version, segments).
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        with locked(self.output_dir, self.lock_path):
+
+            entries, good_size = self._read_journal(self.journal_path)
+            if good_size < self._journal_size():
+                # Drop a torn line from a crash mid-append, or the next entry would be glued onto it
+                os.truncate(self.journal_path, good_size)
+            if not entries and not self._snapshot_versions():
+                # First versioned save: keep whatever was saved before as version 0
+                atomic_write(self._snapshot_path(0), json.dumps({'version': 0, 'segments': self._legacy_segments()}))
+
+            current = self._latest_version(entries)
+            if base_version is not None and int(base_version) != current:
+                raise VersionConflict(current)
+
+            head = self._read_head()
+            if head is None or head.get('journal_size') != self._journal_size():
+                # Materialized files are behind the journal (e.g. crash after append); rebuild them
+                base_segments = self.load_version(current)
+                self._materialize(current, base_segments)
+            else:
+                base_segments = self.current_segments()
+
+            if not ops:
+                return current, base_segments
+
+            segments = apply_ops(base_segments, ops, self.file_id)
+            version = current + 1
+            entry = {'version': version, 'base_version': current, 'timestamp': time.time(), 'ops': ops}
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            if version % SNAPSHOT_INTERVAL == 0:
+                atomic_write(self._snapshot_path(version), json.dumps({'version': version, 'segments': segments}))
+                # Start a fresh journal; the rotated one still serves load_version for older versions
+                os.replace(self.journal_path, self._archive_path(version))
+
+            self._materialize(version, segments)
+            return version, segments
+
+    def versions(self):
+        """Summary of every version in the rotated and live journals"""
+        entries = {}
+        paths = [self._archive_path(v) for v in self._archive_versions()] + [self.journal_path]
+        for path in paths:
+            for entry in self._read_journal(path)[0]:
+                entries[entry['version']] = entry
+        return [
+            {
+                'version': entry['version'],
+                'timestamp': entry['timestamp'],
+                'ops': len(entry['ops']),
+            }
+            for _, entry in sorted(entries.items())
+        ]
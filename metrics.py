@@ -0,0 +1,190 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of the request being handled on this thread, for the Server-Timing header
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), state[:-2]):
+                    cumulative += count
+                    result.append((f"{self.name}_bucket",
+                                   _format_labels(self.labelnames + ('le',), key + (_format_value(bound),)),
+                                   cumulative))
+                labels = _format_labels(self.labelnames, key)
+                result.append((f"{self.name}_sum", labels, state[-2]))
+                result.append((f"{self.name}_count", labels, state[-1]))
+        return result
+
+
+class CallbackMetric:
+    """Gauge or counter whose value(s) are read from a callback at scrape time"""
+
+    def __init__(self, kind, name, help_text, callback, labelnames=()):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            return [(self.name, _format_labels(self.labelnames, key if isinstance(key, tuple) else (key,)), v)
+                    for key, v in sorted(value.items())]
+        return [(self.name, '', value)]
+
+
+class Registry:
+    """Named collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_callback(self, name, help_text, callback, labelnames=()):
+        return self._register(CallbackMetric('gauge', name, help_text, callback, labelnames))
+
+    def counter_callback(self, name, help_text, callback, labelnames=()):
+        return self._register(CallbackMetric('counter', name, help_text, callback, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'labeltool_stage_seconds', 'Time spent in instrumented stages of request handling', ('stage',))
+bytes_read = registry.counter(
+    'labeltool_bytes_read_total', 'Bytes read from source files', ('source',))
+bytes_served = registry.counter(
+    'labeltool_bytes_served_total', 'Response body bytes sent', ('endpoint',))
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the enclosed block as `stage` (and in the current request's Server-Timing)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+
+def start_request():
+    """Begin collecting stage timings for the request handled on this thread"""
+    return _request_stages.set([])
+
+
+def finish_request(token):
+    """Stop collecting and return the (stage, seconds) pairs recorded for this request"""
+    stages = _request_stages.get() or []
+    _request_stages.reset(token)
+    return stages
+
+
+def server_timing_header(stages, total):
+    """Server-Timing header value for recorded stages plus the total handler time"""
+    entries = [f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in stages]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(entries)
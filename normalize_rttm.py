@@ -0,0 +1,217 @@
+"""
+Normalize a corpus of RTTM files from the command line.
+
+Every file under RTTM_DIR (or every file in a list) is parsed, its consecutive
+same-speaker segments are merged, and the result is written back in canonical form,
+spread across a process pool. Finished files are recorded in a manifest, so an
+interrupted run picks up where it stopped.
+
+Examples:
+    python normalize_rttm.py --output-dir ../combined_dataset/rttm_normalized
+    python normalize_rttm.py --in-place --categories ThongTinChinhPhu baodanang_audio
+    python normalize_rttm.py --dry-run --files todo.txt
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+from label_store import atomic_write
+from rttm import read_rttm, merge_segments, format_rttm, MERGE_GAP, MIN_DURATION
+from worker_pool import chunk_size
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RTTM_DIR = os.path.join(BASE_DIR, "combined_dataset/rttm")
+
+MANIFEST_NAME = '.normalize_done.jsonl'
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+
+
+def find_rttm_files(rttm_dir, categories=None):
+    """Paths (relative to rttm_dir) of every .rttm file, optionally limited to some top-level categories"""
+    roots = [os.path.join(rttm_dir, category) for category in categories] if categories else [rttm_dir]
+    rel_paths = []
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith('.rttm'):
+                    rel_paths.append(os.path.relpath(os.path.join(dirpath, name), rttm_dir))
+    return rel_paths
+
+
+def read_file_list(list_path, rttm_dir):
+    """Paths (relative to rttm_dir) listed one per line in `list_path`; blank lines and # comments are skipped"""
+    rel_paths = []
+    with open(list_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if os.path.isabs(line):
+                line = os.path.relpath(line, rttm_dir)
+            rel_paths.append(line)
+    return rel_paths
+
+
+def load_manifest(manifest_path):
+    """Manifest entries keyed by relative path (later entries win)"""
+    done = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry['path']] = entry
+    return done
+
+
+def is_done(entry, source_path, output_path, merge_gap, min_duration):
+    """True if the manifest entry covers the current source file and merge policy"""
+    if entry is None or entry.get('merge_gap') != merge_gap or entry.get('min_duration') != min_duration:
+        return False
+    try:
+        source = os.stat(source_path)
+        output = os.stat(output_path)
+    except OSError:
+        return False
+    return (entry.get('source_size') == source.st_size and entry.get('source_mtime_ns') == source.st_mtime_ns and
+            entry.get('output_size') == output.st_size and entry.get('output_mtime_ns') == output.st_mtime_ns)
+
+
+def normalize_file(task):
+    """Worker: merge one RTTM file and (unless dry_run) write it out. Returns a result dict."""
+    rel_path, source_path, output_path, merge_gap, min_duration, dry_run = task
+    result = {'path': rel_path, 'merge_gap': merge_gap, 'min_duration': min_duration}
+    try:
+        columns = read_rttm(source_path)
+        merged = merge_segments(columns, merge_gap, min_duration)
+        speakers = merged['speakers']
+        result['segments_in'] = len(columns['start'])
+        result['segments_out'] = len(merged['start'])
+        result['speakers'] = len(set(merged['speaker'].tolist()))
+        if dry_run:
+            return result
+
+        file_id = os.path.basename(rel_path).replace('.rttm', '')
+        text = format_rttm(file_id, merged['start'].tolist(), merged['duration'].tolist(),
+                           [speakers[code] for code in merged['speaker'].tolist()])
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        atomic_write(output_path, text)
+
+        # Record both stats so a rerun can tell whether either side changed since
+        source = os.stat(source_path)
+        output = os.stat(output_path)
+        result.update({
+            'source_size': source.st_size, 'source_mtime_ns': source.st_mtime_ns,
+            'output_size': output.st_size, 'output_mtime_ns': output.st_mtime_ns,
+        })
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        result['traceback'] = traceback.format_exc()
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Merge and rewrite RTTM files across a corpus")
+    parser.add_argument('--rttm-dir', default=DEFAULT_RTTM_DIR, help="Root of the RTTM corpus (default: %(default)s)")
+    parser.add_argument('--files', help="Text file listing RTTM paths (relative to --rttm-dir or absolute) instead of walking it")
+    parser.add_argument('--categories', nargs='+', help="Only walk these top-level subdirectories of --rttm-dir")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--output-dir', help="Write normalized files here, mirroring the input layout")
+    target.add_argument('--in-place', action='store_true', help="Replace the input files (atomically)")
+    parser.add_argument('--merge-gap', type=float, default=MERGE_GAP, help="Merge same-speaker segments separated by at most this many seconds (default: %(default)s)")
+    parser.add_argument('--min-duration', type=float, default=MIN_DURATION, help="Drop merged segments shorter than this (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores, %(default)s)")
+    parser.add_argument('--chunksize', type=int, default=0, help="Files handed to a worker at a time (default: automatic)")
+    parser.add_argument('--manifest', help=f"Done-manifest path (default: {MANIFEST_NAME} in the output root)")
+    parser.add_argument('--restart', action='store_true', help="Ignore the manifest and process every file")
+    parser.add_argument('--dry-run', action='store_true', help="Print per-file segment and speaker counts without writing anything")
+    args = parser.parse_args(argv)
+    if not args.dry_run and not args.output_dir and not args.in_place:
+        parser.error("one of --output-dir, --in-place or --dry-run is required")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rttm_dir = os.path.abspath(args.rttm_dir)
+    output_root = rttm_dir if args.in_place or args.dry_run else os.path.abspath(args.output_dir)
+
+    if args.files:
+        rel_paths = read_file_list(args.files, rttm_dir)
+    else:
+        rel_paths = find_rttm_files(rttm_dir, args.categories)
+
+    manifest_path = args.manifest or os.path.join(output_root, MANIFEST_NAME)
+    done = {} if args.restart or args.dry_run else load_manifest(manifest_path)
+
+    tasks = []
+    skipped = 0
+    for rel_path in rel_paths:
+        source_path = os.path.join(rttm_dir, rel_path)
+        output_path = os.path.join(output_root, rel_path)
+        if is_done(done.get(rel_path), source_path, output_path, args.merge_gap, args.min_duration):
+            skipped += 1
+            continue
+        tasks.append((rel_path, source_path, output_path, args.merge_gap, args.min_duration, args.dry_run))
+
+    print(f"{len(rel_paths)} RTTM files, {skipped} already done, {len(tasks)} to process "
+          f"with {args.workers} workers", file=sys.stderr)
+    if not tasks:
+        return 0
+
+    chunksize = args.chunksize or chunk_size(len(tasks), args.workers)
+
+    if args.dry_run:
+        print("path\tsegments_in\tsegments_out\tspeakers")
+
+    processed = failed = segments_in = segments_out = 0
+    started = last_report = time.time()
+    manifest = None
+    if not args.dry_run:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        manifest = open(manifest_path, 'a')
+    try:
+        with multiprocessing.Pool(args.workers) as pool:
+            for result in pool.imap_unordered(normalize_file, tasks, chunksize=chunksize):
+                processed += 1
+                if 'error' in result:
+                    failed += 1
+                    print(f"ERROR {result['path']}: {result['error']}", file=sys.stderr)
+                    continue
+
+                segments_in += result['segments_in']
+                segments_out += result['segments_out']
+                if args.dry_run:
+                    print(f"{result['path']}\t{result['segments_in']}\t{result['segments_out']}\t{result['speakers']}")
+                else:
+                    manifest.write(json.dumps(result) + '\n')
+                    manifest.flush()
+
+                now = time.time()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    elapsed = now - started
+                    print(f"[{processed}/{len(tasks)}] {processed / elapsed:.1f} files/s, "
+                          f"{segments_in / elapsed:.0f} segments/s", file=sys.stderr)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    elapsed = max(time.time() - started, 1e-9)
+    print(f"Processed {processed - failed} files ({failed} failed) in {elapsed:.1f}s: "
+          f"{(processed - failed) / elapsed:.1f} files/s, {segments_in} segments in, {segments_out} segments out",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Bytes from the start of an audio file pulled into the OS page cache per warmed file
+DEFAULT_AUDIO_BYTES = 32 * 1024 * 1024
+# Chunk size when the page cache has to be primed by reading (no posix_fadvise)
+READ_CHUNK_SIZE = 1024 * 1024
+# Nice increment for warm-up threads (Linux applies it per thread)
+DEFAULT_NICE = 10
+# Seconds between checks while interactive requests are running
+IDLE_POLL_INTERVAL = 0.05
+
+
+def prime_page_cache(path, max_bytes=DEFAULT_AUDIO_BYTES, cancelled=lambda: False):
+    """
+    Ask the OS to read the first `max_bytes` of a file into the page cache. With
+    posix_fadvise this only schedules readahead and returns at once; otherwise the bytes
+    are read (and dropped) chunk by chunk, stopping early if `cancelled()` turns true.
+    Returns the number of bytes requested.
+    """
+    size = min(os.path.getsize(path), max_bytes)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+            return size
+        offset = 0
+        while offset < size and not cancelled():
+            chunk = os.read(fd, min(READ_CHUNK_SIZE, size - offset))
+            if not chunk:
+                break
+            offset += len(chunk)
+        return offset
+    finally:
+        os.close(fd)
+
+
+class WarmupScheduler:
+    """
+    Background warm-up of the files an annotator is likely to open next.
+
+    Each owner (an annotator's session) has at most one plan: an ordered list of items
+    handed to `warm_fn(item, cancelled)` one at a time. Scheduling a new plan replaces
+    the owner's old one, and the item being warmed for that owner sees `cancelled()`
+    turn true, so warm_fn should check it between steps. Workers run at a lower OS
+    priority and only start an item while no interactive request is in progress
+    (requests are reported through begin_request()/end_request()).
+    """
+
+    def __init__(self, warm_fn, workers=1, nice=DEFAULT_NICE):
+        self.warm_fn = warm_fn
+        self.nice = nice
+        self._cond = threading.Condition()
+        # owner -> deque of pending items, in round-robin order
+        self._plans = OrderedDict()
+        # owner -> plan generation; an item belongs to the generation it was scheduled in
+        self._generations = {}
+        self._active_requests = 0
+        self._closed = False
+
+        self.scheduled = 0
+        self.warmed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+        self._threads = [threading.Thread(target=self._run, name=f'warmup-{i}', daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def schedule(self, owner, items):
+        """Replace `owner`'s plan with `items` (cancelling the item in progress, if any)"""
+        with self._cond:
+            generation = self._generations.get(owner, 0) + 1
+            self._generations[owner] = generation
+            dropped = self._plans.pop(owner, None)
+            if dropped:
+                self.cancelled += len(dropped)
+            if items:
+                self._plans[owner] = deque((generation, item) for item in items)
+                self.scheduled += len(items)
+            self._cond.notify_all()
+
+    def cancel(self, owner):
+        """Drop `owner`'s plan and stop the item in progress"""
+        self.schedule(owner, [])
+
+    def begin_request(self):
+        with self._cond:
+            self._active_requests += 1
+
+    def end_request(self):
+        with self._cond:
+            self._active_requests -= 1
+            if self._active_requests <= 0:
+                self._active_requests = 0
+                self._cond.notify_all()
+
+    def shutdown(self):
+        """Stop the workers after the items in progress"""
+        with self._cond:
+            self._closed = True
+            self._plans.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _lower_priority(self):
+        # On Linux each thread has its own nice value; elsewhere this would renice the whole process
+        if not sys.platform.startswith('linux') or not self.nice:
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Could not lower warm-up thread priority: {str(e)}")
+
+    def _next_item(self):
+        """Block until an item is pending and no request is running; returns (owner, generation, item) or None when closed"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if self._plans and self._active_requests == 0:
+                    owner, plan = next(iter(self._plans.items()))
+                    generation, item = plan.popleft()
+                    # Rotate owners so one annotator's plan doesn't starve another's
+                    del self._plans[owner]
+                    if plan:
+                        self._plans[owner] = plan
+                    return owner, generation, item
+                self._cond.wait(IDLE_POLL_INTERVAL if self._plans else None)
+
+    def _run(self):
+        self._lower_priority()
+        while True:
+            next_item = self._next_item()
+            if next_item is None:
+                return
+            owner, generation, item = next_item
+
+            def cancelled():
+                # A newer plan for the same owner, or shutdown, stops this item
+                return self._closed or self._generations.get(owner) != generation
+
+            started = time.perf_counter()
+            try:
+                self.warm_fn(item, cancelled)
+            except Exception as e:
+                with self._cond:
+                    self.failed += 1
+                logger.warning(f"Warm-up failed for {item}: {str(e)}")
+                continue
+            with self._cond:
+                if cancelled():
+                    self.cancelled += 1
+                else:
+                    self.warmed += 1
+            logger.debug(f"Warmed {item} in {time.perf_counter() - started:.3f}s")
+
+    def stats(self):
+        """Counters and current backlog for monitoring"""
+        with self._cond:
+            return {
+                'workers': len(self._threads),
+                'pending': sum(len(plan) for plan in self._plans.values()),
+                'owners': len(self._plans),
+                'active_requests': self._active_requests,
+                'scheduled': self.scheduled,
+                'warmed': self.warmed,
+                'cancelled': self.cancelled,
+                'failed': self.failed,
+            }
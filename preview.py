@@ -0,0 +1,168 @@
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from worker_pool import spawn_executor
+
+logger = logging.getLogger(__name__)
+
+# Opus is ~10x smaller than 16-bit PCM for speech; FLAC is the lossless fallback
+# when libsndfile was built without Opus
+PREVIEW_FORMATS = {
+    'opus': {'format': 'OGG', 'subtype': 'OPUS', 'extension': '.ogg', 'mimetype': 'audio/ogg; codecs=opus'},
+    'flac': {'format': 'FLAC', 'subtype': 'PCM_16', 'extension': '.flac', 'mimetype': 'audio/flac'},
+}
+# Opus only accepts these sample rates
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_WORKERS = 2
+# Frames read from the source per block
+BLOCK_FRAMES = 65536
+# Seconds a failed build is reported as 'failed' before the next request retries it
+FAILED_RETRY_SECONDS = 300
+
+
+def preview_format(name):
+    """Settings for a preview format, falling back to FLAC if libsndfile cannot write it"""
+    settings = PREVIEW_FORMATS.get(name, PREVIEW_FORMATS['flac'])
+    if settings['subtype'] not in sf.available_subtypes(settings['format']):
+        settings = PREVIEW_FORMATS['flac']
+    return settings
+
+
+def transcode_preview(audio_path, output_path, sample_rate, format_name):
+    """
+    Worker: downmix to mono, resample to `sample_rate` and encode `audio_path` into `output_path`.
+    Resampling is streamed in blocks, so the preview has exactly round(frames * sample_rate / source_rate)
+    frames and times map 1:1 onto the original.
+    """
+    settings = preview_format(format_name)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with sf.SoundFile(audio_path) as src:
+            source_rate = src.samplerate
+            out_rate = min(sample_rate, source_rate)
+            if settings['subtype'] == 'OPUS':
+                out_rate = min((r for r in OPUS_SAMPLE_RATES if r >= out_rate), default=48000)
+            resampler = soxr.ResampleStream(source_rate, out_rate, 1, dtype='float32') if out_rate != source_rate else None
+
+            with sf.SoundFile(tmp_path, 'w', samplerate=out_rate, channels=1,
+                              format=settings['format'], subtype=settings['subtype']) as dst:
+                for block in src.blocks(blocksize=BLOCK_FRAMES, dtype='float32', always_2d=True):
+                    mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+                    if resampler is not None:
+                        mono = resampler.resample_chunk(np.ascontiguousarray(mono))
+                    if len(mono):
+                        dst.write(mono)
+                if resampler is not None:
+                    tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+                    if len(tail):
+                        dst.write(tail)
+        os.replace(tmp_path, output_path)
+        return output_path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class PreviewStore:
+    """
+    Compressed previews of full audio files for playback over slow links.
+
+    Previews are built in a background process pool and stored in `cache_dir` under a
+    name derived from the source path and mtime, so an edited source gets a new preview.
+    """
+
+    def __init__(self, cache_dir, format_name='opus', sample_rate=DEFAULT_SAMPLE_RATE, workers=DEFAULT_WORKERS):
+        self.cache_dir = cache_dir
+        self.format_name = format_name
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.settings = preview_format(format_name)
+        self.mimetype = self.settings['mimetype']
+
+        self._lock = threading.Lock()
+        self._executor = None
+        # output path -> future of the running build
+        self._pending = {}
+        # output path -> (error message, time) of a failed build; expires after FAILED_RETRY_SECONDS
+        self._failed = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = spawn_executor(self.workers)
+        return self._executor
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool; with `wait`, let running builds finish first"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _source_key(self, audio_path):
+        return hashlib.sha1(os.path.abspath(audio_path).encode('utf-8')).hexdigest()
+
+    def preview_path(self, audio_path):
+        """Where the preview for the current version of `audio_path` lives"""
+        mtime_ns = os.stat(audio_path).st_mtime_ns
+        name = f"{self._source_key(audio_path)}-{mtime_ns}-{self.sample_rate}{self.settings['extension']}"
+        return os.path.join(self.cache_dir, name)
+
+    def status(self, audio_path, schedule=True):
+        """
+        Returns (status, preview path): 'ready', 'pending', 'failed' or 'missing'.
+        With `schedule`, a missing preview is queued for building (and reported as 'pending').
+        """
+        output_path = self.preview_path(audio_path)
+        if os.path.exists(output_path):
+            return 'ready', output_path
+        with self._lock:
+            if output_path in self._pending:
+                return 'pending', output_path
+            failure = self._failed.get(output_path)
+            if failure is not None:
+                if time.time() - failure[1] < FAILED_RETRY_SECONDS:
+                    return 'failed', output_path
+                del self._failed[output_path]
+            if not schedule:
+                return 'missing', output_path
+            future = self._pool().submit(transcode_preview, audio_path, output_path,
+                                         self.sample_rate, self.format_name)
+            self._pending[output_path] = future
+        future.add_done_callback(lambda f: self._finished(audio_path, output_path, f))
+        return 'pending', output_path
+
+    def _finished(self, audio_path, output_path, future):
+        with self._lock:
+            self._pending.pop(output_path, None)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                if isinstance(error, BrokenProcessPool):
+                    # A crashed worker breaks the pool for good; start a new one on the next request
+                    self._executor = None
+                now = time.time()
+                self._failed = {path: failure for path, failure in self._failed.items()
+                                if now - failure[1] < FAILED_RETRY_SECONDS}
+                self._failed[output_path] = (str(error), now)
+                logger.error(f"Error building preview for {audio_path}: {str(error)}")
+                return
+        # Previews of older versions of the same source are no longer reachable
+        for stale_path in glob.glob(os.path.join(self.cache_dir, f"{self._source_key(audio_path)}-*")):
+            if stale_path != output_path and not stale_path.endswith('.tmp'):
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+        logger.info(f"Preview ready for {audio_path}")
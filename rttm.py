@@ -0,0 +1,164 @@
+import logging
+import os
+import traceback
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default merge policy: consecutive segments of the same speaker separated by at most
+# MERGE_GAP seconds are merged; merged segments shorter than MIN_DURATION are dropped
+MERGE_GAP = 0.5
+MIN_DURATION = 0.0
+
+
+# RTTM format: SPEAKER file_id channel start_time duration <NA> <NA> speaker_id <NA> <NA>
+class RttmParseError(ValueError):
+    """An RTTM file that is not valid text or has a SPEAKER line with a non-numeric time"""
+
+
+def read_rttm(rttm_path):
+    """
+    Read the SPEAKER lines of an RTTM file into columns.
+    Returns a dict with NumPy arrays 'start', 'duration' (float64), 'speaker' (int codes)
+    and 'file_id' (object), plus the list 'speakers' mapping codes to speaker ids.
+    Raises RttmParseError for malformed files.
+    """
+    try:
+        with open(rttm_path, 'r') as f:
+            text = f.read()
+    except UnicodeDecodeError as e:
+        raise RttmParseError(f"Malformed RTTM file {os.path.basename(rttm_path)}: {str(e)}") from e
+    tokens = text.split()
+
+    # Fast path: every line is a well-formed 10-field SPEAKER line, so the columns are strided slices
+    n = len(tokens) // 10
+    line_count = text.count('\n') + (0 if text.endswith('\n') or not text else 1)
+    if (len(tokens) == n * 10 and line_count == n and
+            tokens[0::10].count("SPEAKER") == n):
+        file_ids = tokens[1::10]
+        starts = tokens[3::10]
+        durations = tokens[4::10]
+        speaker_ids = tokens[7::10]
+    else:
+        file_ids, starts, durations, speaker_ids = [], [], [], []
+        for line in text.splitlines():
+            parts = line.split()
+            if len(parts) >= 8 and parts[0] == "SPEAKER":
+                file_ids.append(parts[1])
+                starts.append(parts[3])
+                durations.append(parts[4])
+                speaker_ids.append(parts[7])
+
+    # Intern speaker ids as small integer codes
+    speaker_codes = {}
+    codes = [speaker_codes.setdefault(speaker_id, len(speaker_codes)) for speaker_id in speaker_ids]
+
+    n = len(starts)
+    try:
+        start = np.fromiter(map(float, starts), dtype=np.float64, count=n)
+        duration = np.fromiter(map(float, durations), dtype=np.float64, count=n)
+    except ValueError as e:
+        raise RttmParseError(f"Malformed RTTM file {os.path.basename(rttm_path)}: {str(e)}") from e
+    return {
+        'file_id': np.array(file_ids, dtype=object),
+        'start': start,
+        'duration': duration,
+        'speaker': np.array(codes, dtype=np.int64),
+        'speakers': list(speaker_codes),
+    }
+
+
+def merge_segments(columns, merge_gap=MERGE_GAP, min_duration=MIN_DURATION):
+    """
+    Sort segments by start time and merge consecutive segments of the same speaker
+    whose gap is <= merge_gap, as one vectorized pass. Returns new columns with an
+    added 'end' array.
+    """
+    order = np.argsort(columns['start'], kind='stable')
+    start = columns['start'][order]
+    duration = columns['duration'][order]
+    speaker = columns['speaker'][order]
+    end = start + duration
+    file_ids = columns['file_id'][order]
+
+    n = len(start)
+    if n == 0:
+        return {'file_id': file_ids, 'start': start, 'duration': duration, 'end': end,
+                'speaker': speaker, 'speakers': columns['speakers']}
+
+    # A segment continues the previous run if it has the same speaker and starts
+    # within merge_gap of the previous segment's end
+    continues = np.zeros(n, dtype=bool)
+    continues[1:] = (speaker[1:] == speaker[:-1]) & (start[1:] - end[:-1] <= merge_gap)
+    first = np.flatnonzero(~continues)
+    last = np.append(first[1:] - 1, n - 1)
+
+    merged_start = start[first]
+    merged_end = end[last]
+    # Unmerged segments keep their original duration; merged ones span first start to last end
+    merged_duration = np.where(first == last, duration[first], merged_end - merged_start)
+
+    keep = first
+    if min_duration and min_duration > 0:
+        mask = merged_duration >= min_duration
+        keep = first[mask]
+        merged_start, merged_end, merged_duration = merged_start[mask], merged_end[mask], merged_duration[mask]
+
+    return {
+        'file_id': file_ids[keep],
+        'start': merged_start,
+        'duration': merged_duration,
+        'end': merged_end,
+        'speaker': speaker[keep],
+        'speakers': columns['speakers'],
+    }
+
+
+def columns_to_segments(columns):
+    """Convert merged columns into the list-of-dicts form used by the UI"""
+    speakers = columns['speakers']
+    return [
+        {
+            'file_id': file_id,
+            'start_time': start,
+            'duration': duration,
+            'end_time': end,
+            'speaker_id': speakers[code]
+        }
+        for file_id, start, duration, end, code in zip(
+            columns['file_id'].tolist(), columns['start'].tolist(), columns['duration'].tolist(),
+            columns['end'].tolist(), columns['speaker'].tolist())
+    ]
+
+
+def parse_rttm(rttm_path, merge_gap=MERGE_GAP, min_duration=MIN_DURATION):
+    """Parse an RTTM file and return merged segments as a list of dicts"""
+    try:
+        return columns_to_segments(merge_segments(read_rttm(rttm_path), merge_gap, min_duration))
+    except Exception as e:
+        logger.error(f"Error parsing RTTM file: {str(e)}")
+        logger.error(traceback.format_exc())
+        return []
+
+
+def format_rttm(file_id, starts, durations, speaker_ids):
+    """RTTM text for parallel sequences of start times, durations and speaker ids"""
+    return ''.join(
+        f"SPEAKER {file_id} 1 {start:.2f} {duration:.2f} <NA> <NA> {speaker_id} <NA> <NA>\n"
+        for start, duration, speaker_id in zip(starts, durations, speaker_ids))
+
+
+def write_rttm(segments, output_path, file_id):
+    try:
+        text = format_rttm(file_id,
+                           [segment['start_time'] for segment in segments],
+                           [segment['duration'] for segment in segments],
+                           [segment['speaker_id'] for segment in segments])
+        with open(output_path, 'w') as f:
+            f.write(text)
+        return True
+    except Exception as e:
+        logger.error(f"Error writing RTTM file: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
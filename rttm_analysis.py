@@ -0,0 +1,170 @@
+import numpy as np
+
+# Segments shorter than this many seconds are reported as slivers
+SLIVER_DURATION = 0.2
+# Unlabeled stretches longer than this many seconds are reported as gaps
+LONG_GAP = 10.0
+# Segments may end this many seconds past the end of the audio before being reported
+END_TOLERANCE = 0.05
+# Issues listed per type (the counts always cover everything)
+MAX_ISSUES_PER_TYPE = 200
+
+ISSUE_TYPES = ('past_end', 'invalid', 'overlap', 'self_overlap', 'sliver', 'gap')
+
+# Weights of the attention score: per problem segment, and per percent of the file
+# covered by overlapping speech or long gaps
+SCORE_WEIGHTS = {
+    'past_end': 20.0,
+    'invalid': 20.0,
+    'self_overlap': 5.0,
+    'sliver': 1.0,
+    'overlap_percent': 2.0,
+    'gap_percent': 1.0,
+}
+
+
+def _runs(mask):
+    """(first, last) index arrays of the runs of consecutive True values in `mask`"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2] - 1
+
+
+def _speaker_order(start, end, speaker):
+    """
+    Segment order by (speaker, start), and for each position in that order the latest end
+    of the same speaker's earlier segments (-inf for a speaker's first segment).
+    """
+    order = np.lexsort((start, speaker))
+    start, end, speaker = start[order], end[order], speaker[order]
+    # Offsetting each speaker's times past the previous speaker's makes one running max
+    # restart at every speaker boundary
+    span = float(end.max() - min(start.min(), 0.0)) + 1.0
+    running = np.maximum.accumulate(end + speaker * span) - speaker * span
+    previous_end = np.full(len(order), -np.inf)
+    previous_end[1:] = running[:-1]
+    previous_end[1:][speaker[1:] != speaker[:-1]] = -np.inf
+    return order, previous_end
+
+
+def speaker_turns(start, end, speaker):
+    """Union of each speaker's segments: (start, end) arrays of non-overlapping turns per speaker"""
+    order, previous_end = _speaker_order(start, end, speaker)
+    start, end = start[order], end[order]
+    new_turn = start > previous_end
+    firsts = np.flatnonzero(new_turn)
+    lasts = np.append(firsts[1:], len(order))
+    turn_ends = np.maximum.reduceat(end, firsts) if len(firsts) else end[:0]
+    # A turn covering several segments ends at their latest end
+    return start[firsts], np.maximum(turn_ends, end[lasts - 1])
+
+
+def coverage(start, end):
+    """
+    Sweep line over intervals: returns (left, right, count) arrays describing the
+    consecutive non-empty stretches between interval boundaries and how many intervals
+    are active in each.
+    """
+    n = len(start)
+    times = np.concatenate((start, end))
+    deltas = np.concatenate((np.ones(n, dtype=np.int64), -np.ones(n, dtype=np.int64)))
+    # At equal times, ends sort before starts, so touching intervals do not overlap
+    order = np.lexsort((deltas, times))
+    times = times[order]
+    active = np.cumsum(deltas[order])
+    left, right, count = times[:-1], times[1:], active[:-1]
+    keep = right > left
+    return left[keep], right[keep], count[keep]
+
+
+def analyze_segments(start, duration, speaker, audio_duration=None, sliver_duration=SLIVER_DURATION,
+                     long_gap=LONG_GAP, end_tolerance=END_TOLERANCE, max_issues=MAX_ISSUES_PER_TYPE):
+    """
+    Find overlapping speakers, same-speaker overlaps, slivers, long unlabeled gaps,
+    invalid segments and segments running past the end of the audio.
+
+    `start`, `duration` and `speaker` (integer codes) are parallel arrays; issue entries
+    refer to segments by their position in them. Returns a dict with per-type counts,
+    overlap/gap totals, an attention score and the issues (at most `max_issues` per type).
+    """
+    start = np.asarray(start, dtype=np.float64)
+    duration = np.asarray(duration, dtype=np.float64)
+    speaker = np.asarray(speaker, dtype=np.int64)
+    end = start + duration
+    n = len(start)
+    issues = {name: [] for name in ISSUE_TYPES}
+    counts = {name: 0 for name in ISSUE_TYPES}
+
+    def report(name, firsts, lasts, segments=None):
+        counts[name] = len(firsts)
+        for i in range(min(len(firsts), max_issues)):
+            issue = {'type': name, 'start': float(firsts[i]), 'end': float(lasts[i])}
+            if segments is not None:
+                issue['segment'] = int(segments[i])
+            issues[name].append(issue)
+
+    # Per-segment checks
+    invalid = np.flatnonzero((duration <= 0) | (start < 0) | ~np.isfinite(start) | ~np.isfinite(duration))
+    report('invalid', start[invalid], end[invalid], invalid)
+    sliver = np.flatnonzero((duration > 0) & (duration < sliver_duration))
+    report('sliver', start[sliver], end[sliver], sliver)
+    if audio_duration is not None:
+        past_end = np.flatnonzero(end > audio_duration + end_tolerance)
+        report('past_end', start[past_end], end[past_end], past_end)
+
+    # Sweep line over per-speaker turns: overlapping speakers (2+ active) and unlabeled stretches (none active)
+    valid = np.flatnonzero(duration > 0)
+    overlap_seconds = gap_seconds = speech_seconds = 0.0
+    if len(valid):
+        # A segment starting before the same speaker's earlier segments have ended
+        order, previous_end = _speaker_order(start[valid], end[valid], speaker[valid])
+        hits = np.flatnonzero(start[valid][order] < previous_end)
+        segments = valid[order[hits]]
+        report('self_overlap', start[segments], np.minimum(end[segments], previous_end[hits]), segments)
+
+        turn_start, turn_end = speaker_turns(start[valid], end[valid], speaker[valid])
+        left, right, active = coverage(turn_start, turn_end)
+        speech_seconds = float((right - left)[active > 0].sum())
+
+        firsts, lasts = _runs(active >= 2)
+        overlap_seconds = float((right[lasts] - left[firsts]).sum())
+        report('overlap', left[firsts], right[lasts])
+
+        # Gaps between turns, plus before the first one and after the last one
+        firsts, lasts = _runs(active == 0)
+        gap_starts = np.concatenate(([0.0], left[firsts], [right[-1]]))
+        gap_ends = np.concatenate(([left[0]], right[lasts], [audio_duration if audio_duration is not None else right[-1]]))
+        long_gaps = (gap_ends - gap_starts) > long_gap
+        gap_seconds = float((gap_ends - gap_starts)[long_gaps].sum())
+        report('gap', gap_starts[long_gaps], gap_ends[long_gaps])
+    elif audio_duration:
+        gap_seconds = float(audio_duration)
+        report('gap', np.array([0.0]), np.array([audio_duration]))
+
+    total = audio_duration if audio_duration else float(end.max()) if n else 0.0
+    overlap_percent = 100.0 * overlap_seconds / total if total > 0 else 0.0
+    gap_percent = 100.0 * gap_seconds / total if total > 0 else 0.0
+    score = (sum(SCORE_WEIGHTS[name] * counts[name] for name in ('past_end', 'invalid', 'self_overlap', 'sliver')) +
+             SCORE_WEIGHTS['overlap_percent'] * overlap_percent + SCORE_WEIGHTS['gap_percent'] * gap_percent)
+
+    return {
+        'segments': n,
+        'speakers': int(len(np.unique(speaker))),
+        'audio_duration': audio_duration,
+        'speech_seconds': speech_seconds,
+        'overlap_seconds': overlap_seconds,
+        'overlap_percent': overlap_percent,
+        'gap_seconds': gap_seconds,
+        'gap_percent': gap_percent,
+        'counts': counts,
+        'score': round(score, 3),
+        'issues': sorted((issue for name in ISSUE_TYPES for issue in issues[name]), key=lambda issue: issue['start']),
+    }
+
+
+def analyze_segment_dicts(segments, audio_duration=None, **options):
+    """analyze_segments() for the list-of-dicts form used by the UI"""
+    codes = {}
+    speaker = [codes.setdefault(segment['speaker_id'], len(codes)) for segment in segments]
+    return analyze_segments([segment['start_time'] for segment in segments],
+                            [segment['duration'] for segment in segments], speaker, audio_duration, **options)
@@ -4,11 +4,10 @@
 cd "$(dirname "$0")"
 
 # Create necessary directories if they don't exist
-mkdir -p static/temp
 mkdir -p ../combined_dataset/labels_diarization
 
-# Clean up old temporary files
-find static/temp -type f -mtime +1 -name "*.wav" -delete
+# Segment clips used to be cached in static/temp, where they were publicly served; remove them
+rm -rf static/temp
 
 echo "=============================================="
 echo "Starting RTTM Label Tool..."
@@ -25,5 +24,17 @@ echo "- Add new segments functionality"
 echo "=============================================="
 echo "Press Ctrl+C to stop the server"
 
-# Run the Flask application
-python app.py
+# Production mode: ./run.sh --production (N worker processes under gunicorn).
+# Workspace paths live in each annotator's session, so requests can go to any worker;
+# set LABEL_TOOL_SECRET_KEY to keep sessions valid across restarts on other machines.
+if [ "$1" = "--production" ]; then
+    WORKERS=${WORKERS:-$(nproc)}
+    THREADS=${THREADS:-8}
+    PORT=${PORT:-5000}
+    echo "Running with gunicorn: $WORKERS workers x $THREADS threads on port $PORT"
+    exec gunicorn --workers "$WORKERS" --threads "$THREADS" --worker-class gthread \
+        --bind "0.0.0.0:$PORT" --timeout 120 app:app
+fi
+
+# Run the Flask application (development server)
+python serve.py
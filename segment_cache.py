@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from disk_cache import DiskLRU
+
+# Default size bounds for the two cache tiers
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = '.seg.wav'
+
+
+class SegmentCache:
+    """
+    Two-tier LRU cache for extracted segment WAVs.
+
+    Entries are keyed by (audio path, audio mtime, start, duration), so a changed source
+    file never serves stale clips. The memory tier holds the most recently used clips;
+    the disk tier (a DiskLRU, shared with other worker processes using `cache_dir`) keeps a
+    larger working set across restarts. Both tiers are bounded in bytes and evict
+    least-recently-used entries.
+    """
+
+    def __init__(self, cache_dir, max_memory_bytes=DEFAULT_MEMORY_BYTES, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        # Single clips larger than this are streamed instead of cached
+        self.max_item_bytes = max_memory_bytes // 8
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = DiskLRU(cache_dir, CACHE_FILE_SUFFIX, max_disk_bytes, name='segment-cache')
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(audio_path, start_time, duration):
+        """Cache key for a clip; includes the source mtime so edits to the audio invalidate it"""
+        mtime_ns = os.stat(audio_path).st_mtime_ns
+        raw = f"{os.path.abspath(audio_path)}|{mtime_ns}|{start_time:.3f}|{duration:.3f}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _evict_memory(self):
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            self.evictions += 1
+
+    def _put_memory(self, key, data):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        self._evict_memory()
+
+    def get(self, key):
+        """Return cached clip bytes or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        data = self._disk.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, data)
+        return data
+
+    def contains(self, key):
+        """True if the clip is cached in either tier (does not count as a lookup)"""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return key in self._disk
+
+    def put(self, key, data):
+        """Store clip bytes in both tiers"""
+        if len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            self._put_memory(key, data)
+        self._disk.put(key, data)
+
+    def stats(self):
+        """Counters and sizes for monitoring"""
+        disk = self._disk.stats()
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions + disk['evictions'],
+                'hit_ratio': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': disk['entries'],
+                'disk_bytes': disk['bytes'],
+            }
@@ -0,0 +1,385 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from catalog import category_of, open_db
+from metrics import timed
+from rttm import read_rttm, merge_segments
+
+logger = logging.getLogger(__name__)
+
+# Threads used to read RTTMs of new or changed files
+DEFAULT_WORKERS = 8
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Files per block of a snapshot: a changed file only rebuilds its block, and queries skip
+# blocks whose speakers, durations or times can't match
+BLOCK_FILES = 32
+
+# One row per label file; the segments are stored as packed columns (float64 start and
+# duration, int32 speaker codes into the JSON `speakers` list), sorted by start
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segment_files (
+    root TEXT NOT NULL,
+    rttm_file TEXT NOT NULL,
+    source TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    speakers TEXT NOT NULL,
+    start BLOB NOT NULL,
+    duration BLOB NOT NULL,
+    speaker BLOB NOT NULL,
+    PRIMARY KEY (root, rttm_file)
+);
+"""
+
+
+def label_columns(path, is_saved):
+    """
+    Segments of a label file as the editor shows them, sorted by start: saved labels as
+    stored, original RTTMs merged with the default merge policy.
+    """
+    columns = read_rttm(path)
+    if not is_saved:
+        columns = merge_segments(columns)
+    order = np.argsort(columns['start'], kind='stable')
+    return {
+        'start': columns['start'][order].astype(np.float64),
+        'duration': columns['duration'][order].astype(np.float64),
+        'speaker': columns['speaker'][order].astype(np.int32),
+        'speakers': list(columns['speakers']),
+    }
+
+
+class FileSegments:
+    """The indexed segments of one label file"""
+
+    __slots__ = ('rttm_file', 'source', 'path', 'stat', 'columns', 'codes', 'speaker_count', 'speech')
+
+    def __init__(self, rttm_file, source, path, stat, columns, speaker_codes):
+        self.rttm_file = rttm_file
+        self.source = source
+        self.path = path
+        self.stat = tuple(stat)
+        self.columns = columns
+        # Speaker codes into the root's shared speaker list (`speaker_codes`, extended as needed)
+        mapping = np.array([speaker_codes.setdefault(speaker_id, len(speaker_codes))
+                            for speaker_id in columns['speakers']], dtype=np.int32)
+        self.codes = mapping[columns['speaker']] if len(mapping) else columns['speaker']
+        self.speaker_count = len(np.unique(self.codes))
+        self.speech = float(columns['duration'].sum())
+
+
+class Block:
+    """
+    Flat columns of BLOCK_FILES consecutive files (segments by file, then start), with the
+    bounds queries use to skip the block without looking at its segments.
+    """
+
+    def __init__(self, files):
+        counts = [len(item.columns['start']) for item in files]
+        self.file_count = len(files)
+        self.start = np.concatenate([item.columns['start'] for item in files]) if files else np.zeros(0)
+        self.duration = np.concatenate([item.columns['duration'] for item in files]) if files else np.zeros(0)
+        self.end = self.start + self.duration
+        self.speaker = np.concatenate([item.codes for item in files]) if files else np.zeros(0, dtype=np.int32)
+        # Index of each segment's file within the block
+        self.file = np.repeat(np.arange(len(files), dtype=np.int32), counts)
+        self.speakers = frozenset(np.unique(self.speaker).tolist())
+        empty = not len(self.start)
+        self.min_duration = np.inf if empty else float(self.duration.min())
+        self.max_duration = -np.inf if empty else float(self.duration.max())
+        self.min_start = np.inf if empty else float(self.start.min())
+        self.max_end = -np.inf if empty else float(self.end.max())
+
+
+class Snapshot:
+    """
+    Immutable, query-ready view of all segments under one RTTM root: files in path order,
+    split into Blocks of BLOCK_FILES files, each holding one flat NumPy array per field.
+    Segment positions (used as page cursors) count through the blocks in order. A new
+    snapshot reuses the blocks of the previous one that hold no changed file, so a save
+    only rebuilds one block.
+    """
+
+    def __init__(self, files, speaker_codes, previous=None, changed=()):
+        self.files = sorted(files, key=lambda item: item.rttm_file)
+        self.rttm_files = [item.rttm_file for item in self.files]
+        self.speaker_codes = dict(speaker_codes)
+        self.speaker_ids = list(self.speaker_codes)
+
+        category_codes = {}
+        self.file_categories = np.array(
+            [category_codes.setdefault(category_of(name), len(category_codes)) for name in self.rttm_files],
+            dtype=np.int32)
+        self.category_codes = category_codes
+        self.file_speakers = np.array([item.speaker_count for item in self.files], dtype=np.int32)
+        self.file_segments = np.array([len(item.columns['start']) for item in self.files], dtype=np.int64)
+        self.file_speech = np.array([item.speech for item in self.files])
+
+        # Blocks are cut at fixed file indices, so they can only be reused while the file list is unchanged
+        reuse = previous is not None and previous.rttm_files == self.rttm_files
+        dirty = {bisect.bisect_left(self.rttm_files, name) // BLOCK_FILES for name in changed} if reuse else None
+        self.blocks = []
+        for number, first in enumerate(range(0, len(self.files), BLOCK_FILES)):
+            if reuse and number not in dirty:
+                self.blocks.append(previous.blocks[number])
+            else:
+                self.blocks.append(Block(self.files[first:first + BLOCK_FILES]))
+        # Position of the first segment of each block, and the total
+        self.offsets = np.concatenate(([0], np.cumsum([len(block.start) for block in self.blocks]))).astype(np.int64)
+        self.segment_count = int(self.offsets[-1])
+
+    def file_range(self, prefix):
+        """[first, last) file indices whose path starts with `prefix` (files are in path order)"""
+        first = bisect.bisect_left(self.rttm_files, prefix)
+        last = first
+        while last < len(self.rttm_files) and self.rttm_files[last].startswith(prefix):
+            last += 1
+        return first, last
+
+    def segment(self, position):
+        """(file index, start, duration, end, speaker code) of the segment at `position`"""
+        number = int(np.searchsorted(self.offsets, position, side='right')) - 1
+        block = self.blocks[number]
+        local = position - int(self.offsets[number])
+        return (number * BLOCK_FILES + int(block.file[local]), float(block.start[local]),
+                float(block.duration[local]), float(block.end[local]), int(block.speaker[local]))
+
+
+class SegmentDB:
+    """
+    Corpus-wide copy of every file's current segments (saved labels where a file has
+    them, the original RTTM otherwise) for search across files.
+
+    Segments are persisted per file in SQLite and queried from an in-memory columnar
+    Snapshot per RTTM root. sync() re-reads only the files whose label source, size or
+    mtime changed since the last sync (in a thread pool) and then swaps in a new snapshot
+    that rebuilds only the blocks holding those files.
+    """
+
+    def __init__(self, db_path, workers=DEFAULT_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self.lock = threading.Lock()
+
+        self.conn = open_db(db_path, SCHEMA)
+
+        # root -> {rttm_file: FileSegments}, loaded from SQLite on first use of a root
+        self._files = {}
+        # root -> {speaker id: code}, shared by all files of the root and only ever extended
+        self._speaker_codes = {}
+        # root -> (catalog generation, Snapshot)
+        self._snapshots = {}
+
+    def _load_root(self, root):
+        """Per-file segments of a root as last persisted (caller holds the lock)"""
+        files = self._files.get(root)
+        if files is None:
+            files = {}
+            speaker_codes = self._speaker_codes.setdefault(root, {})
+            for rttm_file, source, path, size, mtime_ns, speakers, start, duration, speaker in self.conn.execute(
+                    'SELECT rttm_file, source, path, size, mtime_ns, speakers, start, duration, speaker '
+                    'FROM segment_files WHERE root = ?', (root,)):
+                files[rttm_file] = FileSegments(rttm_file, source, path, (size, mtime_ns), {
+                    'start': np.frombuffer(start, dtype=np.float64),
+                    'duration': np.frombuffer(duration, dtype=np.float64),
+                    'speaker': np.frombuffer(speaker, dtype=np.int32),
+                    'speakers': json.loads(speakers),
+                }, speaker_codes)
+            self._files[root] = files
+        return files
+
+    def sync(self, catalog):
+        """Bring the segments of the catalog's RTTM root up to date; returns its Snapshot"""
+        root = os.path.realpath(catalog.rttm_dir)
+        generation = catalog.generation()
+        with self.lock:
+            cached = self._snapshots.get(root)
+            if cached is not None and cached[0] == generation:
+                return cached[1]
+
+        wanted = {}
+        for rttm_file in catalog.rttm_files():
+            saved_stat = catalog.saved_label_stat(rttm_file)
+            if saved_stat is not None:
+                wanted[rttm_file] = (os.path.join(catalog.labels_dir, catalog.saved_label_rel_path(rttm_file)), saved_stat, True)
+            else:
+                stat = catalog.rttm.stat(rttm_file)
+                if stat is not None:
+                    wanted[rttm_file] = (os.path.join(catalog.rttm_dir, rttm_file), stat, False)
+
+        with self.lock:
+            files = self._load_root(root)
+            stale = []
+            for rttm_file, (path, stat, is_saved) in wanted.items():
+                current = files.get(rttm_file)
+                if current is None or current.path != path or current.stat != tuple(stat):
+                    stale.append((rttm_file, path, stat, is_saved))
+            removed = [rttm_file for rttm_file in files if rttm_file not in wanted]
+            cached = self._snapshots.get(root)
+            if not stale and not removed and cached is not None:
+                self._snapshots[root] = (generation, cached[1])
+                return cached[1]
+
+        started = time.time()
+
+        def read_one(item):
+            rttm_file, path, stat, is_saved = item
+            try:
+                return item, label_columns(path, is_saved)
+            except Exception as e:
+                logger.warning(f"Could not index segments of {path}: {str(e)}")
+                return item, None
+
+        with timed('segment_db_sync'):
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(read_one, stale))
+
+            with self.lock:
+                files = self._load_root(root)
+                speaker_codes = self._speaker_codes[root]
+                for rttm_file in removed:
+                    files.pop(rttm_file, None)
+                self.conn.executemany('DELETE FROM segment_files WHERE root = ? AND rttm_file = ?',
+                                      [(root, rttm_file) for rttm_file in removed])
+                rows = []
+                changed = []
+                for (rttm_file, path, stat, is_saved), columns in results:
+                    if columns is None:
+                        continue
+                    source = 'saved' if is_saved else 'original'
+                    files[rttm_file] = FileSegments(rttm_file, source, path, stat, columns, speaker_codes)
+                    changed.append(rttm_file)
+                    rows.append((root, rttm_file, source, path, stat[0], stat[1], json.dumps(columns['speakers']),
+                                 columns['start'].tobytes(), columns['duration'].tobytes(), columns['speaker'].tobytes()))
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO segment_files '
+                    '(root, rttm_file, source, path, size, mtime_ns, speakers, start, duration, speaker) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self.conn.commit()
+                previous = self._snapshots.get(root)
+                snapshot = Snapshot(files.values(), speaker_codes, previous[1] if previous else None, changed)
+                self._snapshots[root] = (generation, snapshot)
+
+        if stale or removed:
+            logger.info(f"Segment database: indexed {len(stale)} files, removed {len(removed)}, "
+                        f"{snapshot.segment_count} segments in {time.time() - started:.3f}s")
+        return snapshot
+
+    def search_segments(self, catalog, speaker=None, min_duration=None, max_duration=None, t0=None, t1=None,
+                        category=None, file=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Segments matching all given filters, by file and start time. `t0`/`t1` select
+        segments overlapping that time range; `file` matches RTTM paths by prefix. Pages are
+        keyed by `cursor` (the 'next_cursor' of the previous page). Returns a dict with
+        'segments', 'next_cursor' and the 'total' number of matches.
+        """
+        snapshot = self.sync(catalog)
+        with timed('segment_db_query'):
+            file_first, file_last = snapshot.file_range(file) if file else (0, len(snapshot.files))
+            speaker_code = snapshot.speaker_codes.get(speaker, -1) if speaker else None
+            category_code = snapshot.category_codes.get(category, -1) if category else None
+            pieces = []
+            for number, block in enumerate(snapshot.blocks):
+                first = number * BLOCK_FILES
+                last = first + block.file_count
+                # Skip blocks that can't hold a match
+                if (last <= file_first or first >= file_last or
+                        (speaker_code is not None and speaker_code not in block.speakers) or
+                        (min_duration is not None and block.max_duration < min_duration) or
+                        (max_duration is not None and block.min_duration > max_duration) or
+                        (t0 is not None and block.max_end <= t0) or
+                        (t1 is not None and block.min_start >= t1)):
+                    continue
+                block_categories = snapshot.file_categories[first:last]
+                if category_code is not None and not (block_categories == category_code).any():
+                    continue
+
+                conditions = []
+                if first < file_first or last > file_last:
+                    conditions.append((block.file >= file_first - first) & (block.file < file_last - first))
+                if speaker_code is not None:
+                    conditions.append(block.speaker == speaker_code)
+                if min_duration is not None:
+                    conditions.append(block.duration >= min_duration)
+                if max_duration is not None:
+                    conditions.append(block.duration <= max_duration)
+                if t0 is not None:
+                    conditions.append(block.end > t0)
+                if t1 is not None:
+                    conditions.append(block.start < t1)
+                if category_code is not None:
+                    conditions.append((block_categories == category_code)[block.file])
+                if not conditions:
+                    pieces.append(np.arange(snapshot.offsets[number], snapshot.offsets[number + 1]))
+                    continue
+                mask = conditions[0]
+                for condition in conditions[1:]:
+                    mask &= condition
+                pieces.append(np.flatnonzero(mask) + snapshot.offsets[number])
+            matches = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.int64)
+
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            offset = int(np.searchsorted(matches, cursor)) if cursor else 0
+            page = matches[offset:offset + limit]
+            next_cursor = int(matches[offset + limit]) if offset + limit < len(matches) else None
+
+        segments = []
+        for position in page.tolist():
+            file_index, start, duration, end, code = snapshot.segment(position)
+            item = snapshot.files[file_index]
+            segments.append({
+                'rttm_file': item.rttm_file,
+                'category': category_of(item.rttm_file),
+                'source': item.source,
+                'start_time': start,
+                'duration': duration,
+                'end_time': end,
+                'speaker_id': snapshot.speaker_ids[code],
+            })
+        return {'segments': segments, 'next_cursor': next_cursor, 'total': int(len(matches))}
+
+    def search_files(self, catalog, min_speakers=None, max_speakers=None, min_segments=None, max_segments=None,
+                     category=None, file=None, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """Files matching the per-file filters, by RTTM path; returns 'files' and the 'total' count"""
+        snapshot = self.sync(catalog)
+        with timed('segment_db_query'):
+            mask = np.ones(len(snapshot.files), dtype=bool)
+            if min_speakers is not None:
+                mask &= snapshot.file_speakers >= min_speakers
+            if max_speakers is not None:
+                mask &= snapshot.file_speakers <= max_speakers
+            if min_segments is not None:
+                mask &= snapshot.file_segments >= min_segments
+            if max_segments is not None:
+                mask &= snapshot.file_segments <= max_segments
+            if category:
+                mask &= snapshot.file_categories == snapshot.category_codes.get(category, -1)
+            if file:
+                file_first, file_last = snapshot.file_range(file)
+                mask[:file_first] = False
+                mask[file_last:] = False
+            matches = np.flatnonzero(mask)
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(offset, 0)
+        files = []
+        for index in matches[offset:offset + limit].tolist():
+            item = snapshot.files[index]
+            files.append({
+                'rttm_file': item.rttm_file,
+                'category': category_of(item.rttm_file),
+                'source': item.source,
+                'segments': int(snapshot.file_segments[index]),
+                'speakers': int(snapshot.file_speakers[index]),
+                'speech_hours': float(snapshot.file_speech[index]) / 3600.0,
+            })
+        return {'files': files, 'total': int(len(matches))}
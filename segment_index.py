@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import timed
+from rttm import read_rttm, merge_segments, MERGE_GAP, MIN_DURATION
+
+# Number of indexes kept in memory
+INDEX_CACHE_SIZE = 32
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+class SegmentIndex:
+    """
+    Interval index over the merged segments of one RTTM file.
+
+    Segments are stored as sorted NumPy arrays; a running maximum of the end times
+    lets window queries find their first candidate with a binary search, so a query
+    costs O(log n + k) for k results.
+    """
+
+    def __init__(self, columns):
+        self.file_id = columns['file_id']
+        self.start = columns['start']
+        self.duration = columns['duration']
+        self.end = columns['end']
+        self.speaker = columns['speaker']
+        self.speakers = columns['speakers']
+        self.max_end = np.maximum.accumulate(self.end) if len(self.end) else self.end
+
+    def __len__(self):
+        return len(self.start)
+
+    def overlapping(self, t0, t1):
+        """Indices of segments overlapping [t0, t1]"""
+        # Segments before `lo` all end before t0; segments from `hi` on all start after t1
+        lo = int(np.searchsorted(self.max_end, t0, side='left'))
+        hi = int(np.searchsorted(self.start, t1, side='right'))
+        if hi <= lo:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.arange(lo, hi)
+        return candidates[self.end[lo:hi] >= t0]
+
+    def page(self, offset, limit):
+        """Indices of segments [offset, offset + limit)"""
+        offset = min(max(offset, 0), len(self))
+        return np.arange(offset, min(offset + max(limit, 0), len(self)))
+
+    def speaker_counts(self):
+        """Number of segments and total duration per speaker"""
+        counts = np.bincount(self.speaker, minlength=len(self.speakers))
+        durations = np.bincount(self.speaker, weights=self.duration, minlength=len(self.speakers))
+        return {
+            speaker: {'count': int(counts[code]), 'duration': float(durations[code])}
+            for code, speaker in enumerate(self.speakers) if counts[code]
+        }
+
+    def segments(self, indices=None, with_index=True):
+        """
+        Segment dicts for the given indices (all segments if None).
+        With `with_index`, each dict also carries its position in the file as 'index'.
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        segments = [
+            {
+                'file_id': file_id,
+                'start_time': start,
+                'duration': duration,
+                'end_time': end,
+                'speaker_id': self.speakers[code]
+            }
+            for file_id, start, duration, end, code in zip(
+                self.file_id[indices].tolist(), self.start[indices].tolist(),
+                self.duration[indices].tolist(), self.end[indices].tolist(), self.speaker[indices].tolist())
+        ]
+        if with_index:
+            for index, segment in zip(indices.tolist(), segments):
+                segment['index'] = index
+        return segments
+
+    def columns(self):
+        """All segments in the columnar form of columns_from_segments()"""
+        return _columns(self.start.tolist(), self.duration.tolist(), self.speaker.tolist(),
+                        list(self.speakers), self.file_id.tolist())
+
+
+def _columns(starts, durations, codes, speakers, file_ids):
+    distinct_files = set(file_ids)
+    return {
+        'start_time': starts,
+        'duration': durations,
+        'speaker': codes,
+        'speakers': speakers,
+        'file_id': distinct_files.pop() if len(distinct_files) == 1 else file_ids,
+    }
+
+
+def columns_from_segments(segments):
+    """
+    Segment dicts as parallel arrays: 'start_time', 'duration' and 'speaker' (codes into the
+    'speakers' list), plus 'file_id' (one id if every segment has the same, else one per segment).
+    end_time is left out; it is start_time + duration.
+    """
+    speaker_codes = {}
+    codes = [speaker_codes.setdefault(segment['speaker_id'], len(speaker_codes)) for segment in segments]
+    return _columns([segment['start_time'] for segment in segments], [segment['duration'] for segment in segments],
+                    codes, list(speaker_codes), [segment.get('file_id') for segment in segments])
+
+
+def get_segment_index(rttm_path, merge_gap=MERGE_GAP, min_duration=MIN_DURATION):
+    """SegmentIndex for an RTTM file, rebuilt only when the file or the merge policy changes"""
+    st = os.stat(rttm_path)
+    key = (os.path.abspath(rttm_path), st.st_mtime_ns, st.st_size, merge_gap, min_duration)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    with timed('rttm_parse'):
+        columns = read_rttm(rttm_path)
+    with timed('rttm_merge'):
+        index = SegmentIndex(merge_segments(columns, merge_gap, min_duration))
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,12 @@
+"""
+Development server: python serve.py (what `python app.py` and run.sh start).
+
+The app is only imported under the __main__ guard. Spawned pool workers (previews,
+agreement, corpus stats) re-run the main script as __mp_main__ before their first task;
+with this script as main that imports nothing, where app.py would build a second copy of
+the whole app, its caches and its databases in every worker.
+"""
+
+if __name__ == '__main__':
+    from app import app
+    app.run(debug=True, host='0.0.0.0', port=5000)
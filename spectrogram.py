@@ -0,0 +1,258 @@
+import functools
+import hashlib
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+import soundfile as sf
+
+from audio_io import read_wav_header
+from disk_cache import DiskLRU
+from metrics import timed
+from waveform import pcm_dtype
+
+# Tile geometry: TILE_COLUMNS columns of N_MELS mel bands. At zoom z a column covers
+# BASE_COLUMN_SECONDS * 2**z seconds, so each zoom level out halves the detail
+TILE_COLUMNS = 256
+N_MELS = 128
+BASE_COLUMN_SECONDS = 0.01
+MAX_ZOOM = 10
+# Fewest STFT frames averaged per column. Wider columns get more frames, so that frames
+# overlapping by half a window cover every sample and short events can't fall between them
+FRAMES_PER_COLUMN = 4
+# Analysis window length in seconds (rounded up to a power of two in samples)
+WINDOW_SECONDS = 0.025
+# Longest analysis window in samples: coarse zoom levels use longer windows (time detail
+# is lost in the column anyway), so covering a column takes fewer, larger FFTs
+MAX_WINDOW_LENGTH = 16384
+# Frame samples transformed per batch, bounding memory for coarse tiles
+FRAME_BATCH_SAMPLES = 1 << 22
+# Zero-padding factor of the FFT, so the narrow low-frequency mel bands still cover a bin
+FFT_PADDING = 4
+# Power range (dB relative to full scale) mapped onto the 256 palette entries
+DB_FLOOR = -90.0
+DB_CEIL = -10.0
+
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = '.tile.png'
+
+# Anchor colors of the tile palette (dark = quiet, bright = loud), interpolated to 256 entries
+PALETTE_ANCHORS = ((0, 0, 4), (59, 15, 112), (140, 41, 129), (222, 73, 104), (254, 159, 109), (252, 253, 191))
+
+
+def column_seconds(zoom):
+    """Seconds covered by one column at a zoom level"""
+    return BASE_COLUMN_SECONDS * (2 ** zoom)
+
+
+def tile_seconds(zoom):
+    """Seconds covered by one tile at a zoom level"""
+    return TILE_COLUMNS * column_seconds(zoom)
+
+
+@functools.lru_cache(maxsize=16)
+def mel_filterbank(sample_rate, n_fft, n_mels=N_MELS):
+    """Triangular mel filters (HTK mel scale, 0 Hz to Nyquist) as an (n_mels, n_fft // 2 + 1) array"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    bin_hz = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    edges = mel_to_hz(np.linspace(0.0, hz_to_mel(sample_rate / 2.0), n_mels + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bin_hz[None, :] - lower) / (center - lower)
+    falling = (upper - bin_hz[None, :]) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling))
+
+
+@functools.lru_cache(maxsize=1)
+def _palette():
+    """PLTE chunk payload: 256 RGB entries interpolated between PALETTE_ANCHORS"""
+    anchors = np.array(PALETTE_ANCHORS, dtype=np.float64)
+    positions = np.linspace(0.0, 1.0, len(anchors))
+    levels = np.linspace(0.0, 1.0, 256)
+    rgb = np.stack([np.interp(levels, positions, anchors[:, channel]) for channel in range(3)], axis=1)
+    return np.round(rgb).astype(np.uint8).tobytes()
+
+
+def _png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload) & 0xffffffff)
+
+
+def encode_png(pixels):
+    """8-bit palette PNG of a 2-D uint8 array (row 0 at the top)"""
+    height, width = pixels.shape
+    # Filter type 0 (none) in front of every row
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        _png_chunk(b'PLTE', _palette()),
+        _png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def _read_frames(audio_path, starts, length):
+    """
+    Mono float frames of `length` samples starting at each frame offset in `starts` (zero outside
+    the file), with the sample rate. The span the frames cover is read once (memory-mapped for
+    PCM/float WAVs, decoded otherwise) and the frames are cut from it as strided views.
+    """
+    lo = int(starts.min())
+    hi = int(starts.max()) + length
+    info = read_wav_header(audio_path)
+    dtype, full_scale = pcm_dtype(info) if info is not None else (None, None)
+
+    if dtype is not None:
+        sample_rate = info.sample_rate
+        frames = info.data_size // info.block_align
+        first = min(max(lo, 0), frames)
+        last = max(min(hi, frames), first)
+        if last > first:
+            data = np.memmap(audio_path, dtype=dtype, mode='r', offset=info.data_offset,
+                             shape=(frames, info.channels))
+            span = np.asarray(data[first:last]).astype(np.float32).mean(axis=1)
+            del data
+            if dtype == np.dtype('u1'):
+                span -= 128.0
+            span /= full_scale
+        else:
+            span = np.zeros(0, dtype=np.float32)
+    else:
+        with sf.SoundFile(audio_path) as src:
+            sample_rate = src.samplerate
+            first = min(max(lo, 0), src.frames)
+            last = max(min(hi, src.frames), first)
+            src.seek(first)
+            span = src.read(last - first, dtype='float32', always_2d=True).mean(axis=1)
+
+    padded = np.zeros(hi - lo, dtype=np.float32)
+    padded[first - lo:first - lo + len(span)] = span
+    return np.lib.stride_tricks.sliding_window_view(padded, length)[starts - lo], sample_rate
+
+
+def analysis_window(sample_rate, zoom):
+    """
+    (window length, frames per column) at a zoom level: the window grows with the column
+    up to MAX_WINDOW_LENGTH, and frames are added until they overlap by at least half a window.
+    """
+    window_length = 1 << int(np.ceil(np.log2(max(WINDOW_SECONDS * sample_rate, 16))))
+    column_samples = column_seconds(zoom) * sample_rate
+    while window_length * 2 <= min(column_samples / 2, MAX_WINDOW_LENGTH):
+        window_length *= 2
+    frames = max(FRAMES_PER_COLUMN, int(np.ceil(2 * column_samples / window_length)))
+    return window_length, frames
+
+
+def audio_sample_rate(audio_path):
+    """Sample rate from the WAV header (or soundfile for other formats)"""
+    info = read_wav_header(audio_path)
+    return info.sample_rate if info is not None else sf.info(audio_path).samplerate
+
+
+def compute_tile(audio_path, zoom, tile):
+    """
+    Mel spectrogram tile `tile` at zoom level `zoom` as a (N_MELS, TILE_COLUMNS) uint8 array,
+    highest band in row 0. Each column averages the power of frames that together cover all
+    of its samples (see analysis_window), transformed in batches of columns. Fine zoom levels
+    cost the same per tile; coarse ones read and transform all the audio under the tile.
+    """
+    sample_rate = audio_sample_rate(audio_path)
+    window_length, frames_per_column = analysis_window(sample_rate, zoom)
+    base_length = 1 << int(np.ceil(np.log2(max(WINDOW_SECONDS * sample_rate, 16))))
+    # Long windows resolve the low mel bands on their own; short ones are zero-padded
+    n_fft = max(base_length * FFT_PADDING, window_length)
+    seconds = column_seconds(zoom)
+    window = np.hanning(window_length).astype(np.float32)
+    # Zero-padding spreads each component over n_fft / window_length times as many bins
+    scale = float(window.sum() ** 2 * n_fft / window_length)
+    filters = mel_filterbank(sample_rate, n_fft).T
+
+    # Frame centers, evenly spaced within each column of the tile
+    offsets = (np.arange(frames_per_column) + 0.5) / frames_per_column
+    batch_columns = max(1, FRAME_BATCH_SAMPLES // (frames_per_column * n_fft))
+    power = np.empty((TILE_COLUMNS, n_fft // 2 + 1))
+    for first in range(0, TILE_COLUMNS, batch_columns):
+        columns = np.arange(first, min(first + batch_columns, TILE_COLUMNS))
+        centers = ((tile * TILE_COLUMNS + columns)[:, None] + offsets[None, :]).ravel() * seconds
+        starts = np.round(centers * sample_rate).astype(np.int64) - window_length // 2
+        with timed('spectrogram_read'):
+            samples, sample_rate = _read_frames(audio_path, starts, window_length)
+        with timed('spectrogram_stft'):
+            spectrum = np.fft.rfft(samples * window, n=n_fft, axis=1)
+            frame_power = spectrum.real ** 2 + spectrum.imag ** 2
+            power[columns] = frame_power.reshape(len(columns), frames_per_column, -1).mean(axis=1)
+
+    with timed('spectrogram_stft'):
+        # Mel filtering is linear, so it is applied once to the column averages
+        mel = (power / scale) @ filters
+        db = 10.0 * np.log10(mel + 1e-12)
+        scaled = np.clip((db - DB_FLOOR) / (DB_CEIL - DB_FLOOR), 0.0, 1.0)
+    return np.round(scaled.T[::-1] * 255.0).astype(np.uint8)
+
+
+class SpectrogramTiles:
+    """
+    Disk cache of spectrogram tiles as palette PNGs, keyed by (audio path, audio mtime,
+    zoom, tile index) and bounded in bytes with least-recently-used eviction (a DiskLRU).
+    Only requested tiles are computed, and each is computed once.
+    """
+
+    def __init__(self, cache_dir, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._disk = DiskLRU(cache_dir, CACHE_FILE_SUFFIX, max_disk_bytes, name='spectrogram-cache')
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(audio_path, zoom, tile):
+        """Cache key for a tile; includes the source mtime so edits to the audio invalidate it"""
+        mtime_ns = os.stat(audio_path).st_mtime_ns
+        raw = f"{os.path.abspath(audio_path)}|{mtime_ns}|{zoom}|{tile}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Cached tile PNG bytes or None"""
+        data = self._disk.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store tile PNG bytes"""
+        self._disk.put(key, data)
+
+    def render(self, key, audio_path, zoom, tile):
+        """Tile PNG bytes from the cache, computing and storing the tile on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = encode_png(compute_tile(audio_path, zoom, tile))
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        """Counters and size for monitoring"""
+        disk = self._disk.stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': disk['evictions'],
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': disk['entries'],
+                'bytes': disk['bytes'],
+            }
@@ -218,6 +218,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 document.getElementById('add-segment-btn').disabled = true;
                 document.getElementById('no-segments-msg').style.display = 'block';
                 document.getElementById('segments-list').innerHTML = '';
+                document.getElementById('segments-pager').style.display = 'none';
                 document.getElementById('edit-panel').style.display = 'none';
                 
                 // Clear variables
@@ -0,0 +1,323 @@
+// Waveform view with segment overlays
+document.addEventListener('DOMContentLoaded', function() {
+    console.log('Waveform script loaded');
+
+    // Make sure all necessary elements exist
+    if (!document.getElementById('waveform-card') ||
+        !document.getElementById('waveform-canvas') ||
+        !document.getElementById('full-audio')) {
+        console.error('Some waveform elements are missing');
+        return;
+    }
+
+    const waveformCard = document.getElementById('waveform-card');
+    const canvas = document.getElementById('waveform-canvas');
+    const viewLabel = document.getElementById('waveform-view');
+    const fullAudio = document.getElementById('full-audio');
+    const ctx = canvas.getContext('2d');
+    const spectrogramCanvas = document.getElementById('spectrogram-canvas');
+    const spectrogramToggle = document.getElementById('spectrogram-toggle');
+    const spectrogramCtx = spectrogramCanvas ? spectrogramCanvas.getContext('2d') : null;
+
+    // Spectrogram tile images kept in the browser (oldest dropped first)
+    const MAX_TILE_IMAGES = 256;
+
+    // Colors used for speaker overlays (assigned in order of appearance)
+    const speakerColors = ['#0d6efd', '#dc3545', '#198754', '#fd7e14', '#6f42c1', '#20c997', '#d63384', '#ffc107'];
+
+    let fileId = null;
+    let rttmPath = null;
+    let duration = 0;
+    let viewStart = 0;
+    let viewEnd = 0;
+    let peaks = null;
+    let fetchTimer = null;
+    let requestCounter = 0;
+    let spectrogramInfo = null;
+    let tileImages = new Map();
+
+    function resizeCanvas() {
+        canvas.width = canvas.clientWidth * (window.devicePixelRatio || 1);
+        canvas.height = canvas.clientHeight * (window.devicePixelRatio || 1);
+        if (spectrogramVisible()) {
+            spectrogramCanvas.width = spectrogramCanvas.clientWidth * (window.devicePixelRatio || 1);
+            spectrogramCanvas.height = spectrogramCanvas.clientHeight * (window.devicePixelRatio || 1);
+        }
+    }
+
+    function spectrogramVisible() {
+        return spectrogramCanvas && spectrogramToggle && spectrogramToggle.checked;
+    }
+
+    // Tile geometry for the current file (tiles themselves are fetched as they come into view)
+    function loadSpectrogramInfo() {
+        const params = new URLSearchParams({ file_id: fileId, rttm_path: rttmPath || '' });
+        const forFile = fileId;
+        fetch(`/spectrogram?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (forFile !== fileId) return;
+                if (data.error) {
+                    console.error('Error loading spectrogram:', data.error);
+                    return;
+                }
+                spectrogramInfo = data;
+                drawSpectrogram();
+            })
+            .catch(error => {
+                console.error('Error loading spectrogram:', error);
+            });
+    }
+
+    // Image for one tile, requested on first use; failed tiles (e.g. a busy server) are retried later
+    function tileImage(zoom, tile) {
+        const key = `${zoom}/${tile}`;
+        let image = tileImages.get(key);
+        if (image) return image;
+
+        image = new Image();
+        image.onload = drawSpectrogram;
+        image.onerror = function() {
+            setTimeout(function() {
+                if (tileImages.get(key) === image) {
+                    tileImages.delete(key);
+                    drawSpectrogram();
+                }
+            }, 1000);
+        };
+        image.src = `${spectrogramInfo.tile_url}&zoom=${zoom}&tile=${tile}`;
+        tileImages.set(key, image);
+        while (tileImages.size > MAX_TILE_IMAGES) {
+            tileImages.delete(tileImages.keys().next().value);
+        }
+        return image;
+    }
+
+    // Draw the visible tiles of the zoom level whose columns are closest to one pixel wide
+    function drawSpectrogram() {
+        if (!spectrogramVisible()) return;
+        spectrogramCtx.clearRect(0, 0, spectrogramCanvas.width, spectrogramCanvas.height);
+        if (!duration || !spectrogramInfo) return;
+
+        const secondsPerPixel = (viewEnd - viewStart) / spectrogramCanvas.width;
+        const zoom = Math.min(Math.max(Math.ceil(Math.log2(secondsPerPixel / spectrogramInfo.base_column_seconds)), 0),
+            spectrogramInfo.max_zoom);
+        const tileSpan = spectrogramInfo.tile_columns * spectrogramInfo.base_column_seconds * Math.pow(2, zoom);
+        const first = Math.floor(viewStart / tileSpan);
+        const last = Math.floor((Math.min(viewEnd, duration) - 1e-9) / tileSpan);
+
+        spectrogramCtx.imageSmoothingEnabled = true;
+        for (let tile = first; tile <= last; tile++) {
+            const image = tileImage(zoom, tile);
+            if (!image.complete || !image.naturalWidth) continue;
+            const x0 = timeToX(tile * tileSpan);
+            const x1 = timeToX((tile + 1) * tileSpan);
+            spectrogramCtx.drawImage(image, x0, 0, x1 - x0, spectrogramCanvas.height);
+        }
+
+        const playheadX = timeToX(fullAudio.currentTime || 0);
+        if (playheadX >= 0 && playheadX <= spectrogramCanvas.width) {
+            spectrogramCtx.strokeStyle = '#ffffff';
+            spectrogramCtx.beginPath();
+            spectrogramCtx.moveTo(playheadX, 0);
+            spectrogramCtx.lineTo(playheadX, spectrogramCanvas.height);
+            spectrogramCtx.stroke();
+        }
+    }
+
+    function timeToX(time) {
+        return (time - viewStart) / (viewEnd - viewStart) * canvas.width;
+    }
+
+    function xToTime(x) {
+        return viewStart + x / canvas.width * (viewEnd - viewStart);
+    }
+
+    // Fetch peaks for the visible window (debounced so zooming doesn't flood the server)
+    function fetchPeaks() {
+        clearTimeout(fetchTimer);
+        fetchTimer = setTimeout(function() {
+            const requestId = ++requestCounter;
+            const params = new URLSearchParams({
+                file_id: fileId,
+                rttm_path: rttmPath || '',
+                t0: viewStart.toFixed(3),
+                t1: viewEnd.toFixed(3),
+                width: canvas.width
+            });
+
+            fetch(`/waveform?${params.toString()}`)
+                .then(response => {
+                    // Server is busy with other audio work: try again when it says to
+                    if (response.status === 503) {
+                        const retryAfter = parseFloat(response.headers.get('Retry-After')) || 1;
+                        setTimeout(function() {
+                            if (requestId === requestCounter) fetchPeaks();
+                        }, retryAfter * 1000);
+                        return null;
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    if (!data || requestId !== requestCounter) return;
+                    if (data.error) {
+                        console.error('Error loading waveform:', data.error);
+                        return;
+                    }
+
+                    peaks = data;
+                    if (!duration) {
+                        duration = data.duration;
+                        viewEnd = duration;
+                    }
+                    draw();
+                })
+                .catch(error => {
+                    console.error('Error loading waveform:', error);
+                });
+        }, 100);
+    }
+
+    function draw() {
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        if (!duration) return;
+
+        const mid = canvas.height / 2;
+
+        // Segment overlays
+        const segmentList = window.segments || [];
+        const speakerIndex = {};
+        segmentList.forEach(segment => {
+            if (!(segment.speaker_id in speakerIndex)) {
+                speakerIndex[segment.speaker_id] = Object.keys(speakerIndex).length;
+            }
+            if (segment.end_time < viewStart || segment.start_time > viewEnd) return;
+
+            const x0 = timeToX(segment.start_time);
+            const x1 = timeToX(segment.end_time);
+            ctx.fillStyle = speakerColors[speakerIndex[segment.speaker_id] % speakerColors.length];
+            ctx.globalAlpha = 0.2;
+            ctx.fillRect(x0, 0, Math.max(x1 - x0, 1), canvas.height);
+            ctx.globalAlpha = 1.0;
+        });
+
+        // Min/max envelope
+        if (peaks) {
+            ctx.strokeStyle = '#495057';
+            ctx.beginPath();
+            for (let i = 0; i < peaks.min.length; i++) {
+                const time = peaks.start_time + i * peaks.seconds_per_peak;
+                const x = Math.round(timeToX(time));
+                ctx.moveTo(x, mid - peaks.max[i] * mid);
+                ctx.lineTo(x, mid - peaks.min[i] * mid + 1);
+            }
+            ctx.stroke();
+        }
+
+        // Playhead
+        const playheadX = timeToX(fullAudio.currentTime || 0);
+        if (playheadX >= 0 && playheadX <= canvas.width) {
+            ctx.strokeStyle = '#dc3545';
+            ctx.beginPath();
+            ctx.moveTo(playheadX, 0);
+            ctx.lineTo(playheadX, canvas.height);
+            ctx.stroke();
+        }
+
+        if (viewLabel) {
+            viewLabel.textContent = `${viewStart.toFixed(2)}s - ${viewEnd.toFixed(2)}s`;
+        }
+
+        drawSpectrogram();
+    }
+
+    // Load the waveform for a newly loaded file
+    function loadWaveform(newFileId, newRttmPath) {
+        fileId = newFileId;
+        rttmPath = newRttmPath;
+        duration = 0;
+        viewStart = 0;
+        viewEnd = 1;
+        peaks = null;
+        spectrogramInfo = null;
+        tileImages = new Map();
+
+        waveformCard.style.display = 'block';
+        resizeCanvas();
+        draw();
+        fetchPeaks();
+        if (spectrogramVisible()) {
+            loadSpectrogramInfo();
+        }
+    }
+
+    // Click to seek the full audio
+    function seekAt(e) {
+        if (!duration) return;
+        const rect = e.currentTarget.getBoundingClientRect();
+        const x = (e.clientX - rect.left) * (canvas.width / rect.width);
+        fullAudio.currentTime = Math.min(Math.max(xToTime(x), 0), duration);
+        draw();
+    }
+
+    // Mouse wheel zooms around the cursor
+    function zoomAt(e) {
+        if (!duration) return;
+        e.preventDefault();
+
+        const rect = e.currentTarget.getBoundingClientRect();
+        const x = (e.clientX - rect.left) * (canvas.width / rect.width);
+        const anchor = xToTime(x);
+        const scale = e.deltaY > 0 ? 1.25 : 0.8;
+        const span = Math.min(Math.max((viewEnd - viewStart) * scale, 0.5), duration);
+
+        viewStart = Math.max(anchor - (anchor - viewStart) * span / (viewEnd - viewStart), 0);
+        viewEnd = Math.min(viewStart + span, duration);
+        viewStart = Math.max(viewEnd - span, 0);
+
+        draw();
+        fetchPeaks();
+    }
+
+    // Reset zoom on double click
+    function resetZoom() {
+        if (!duration) return;
+        viewStart = 0;
+        viewEnd = duration;
+        fetchPeaks();
+    }
+
+    [canvas, spectrogramCanvas].forEach(target => {
+        if (!target) return;
+        target.addEventListener('click', seekAt);
+        target.addEventListener('wheel', zoomAt, { passive: false });
+        target.addEventListener('dblclick', resetZoom);
+    });
+
+    // Show or hide the spectrogram under the waveform
+    if (spectrogramToggle) {
+        spectrogramToggle.addEventListener('change', function() {
+            spectrogramCanvas.style.display = this.checked ? 'block' : 'none';
+            if (!fileId) return;
+            resizeCanvas();
+            if (this.checked && !spectrogramInfo) {
+                loadSpectrogramInfo();
+            }
+            draw();
+        });
+    }
+
+    fullAudio.addEventListener('timeupdate', draw);
+    fullAudio.addEventListener('seeked', draw);
+
+    window.addEventListener('resize', function() {
+        if (!fileId) return;
+        resizeCanvas();
+        draw();
+        fetchPeaks();
+    });
+
+    // Make the functions globally accessible
+    window.loadWaveform = loadWaveform;
+    window.redrawWaveform = draw;
+});
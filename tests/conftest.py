@@ -0,0 +1,46 @@
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sample rate and length of the audio in the app fixture's corpus
+CORPUS_SAMPLE_RATE = 8000
+CORPUS_SECONDS = 4.0
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """
+    The Flask app pointed at a one-file corpus (combined_dataset/rttm/cat/a.rttm and
+    preprocessed/cat/a.wav, 16-bit stereo). The app reads LABEL_TOOL_BASE_DIR at import,
+    so it is imported here, once, and its background pools are stopped at the end.
+    """
+    base_dir = tmp_path_factory.mktemp('base')
+    dataset = base_dir / 'combined_dataset'
+    (dataset / 'rttm' / 'cat').mkdir(parents=True)
+    (dataset / 'preprocessed' / 'cat').mkdir(parents=True)
+    (dataset / 'rttm' / 'cat' / 'a.rttm').write_text("SPEAKER a 1 0.00 1.50 <NA> <NA> A <NA> <NA>\n"
+                                                      "SPEAKER a 1 2.00 1.25 <NA> <NA> B <NA> <NA>\n")
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.9, 0.9, (int(CORPUS_SAMPLE_RATE * CORPUS_SECONDS), 2))
+    sf.write(str(dataset / 'preprocessed' / 'cat' / 'a.wav'), samples, CORPUS_SAMPLE_RATE, subtype='PCM_16')
+
+    os.environ['LABEL_TOOL_BASE_DIR'] = str(base_dir)
+    app = importlib.import_module('app')
+    app.app.config['TESTING'] = True
+    yield app
+    app.warmup.shutdown()
+    app.preview_store.shutdown()
+    app.agreement_store.shutdown()
+    app.corpus_stats.shutdown()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
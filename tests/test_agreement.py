@@ -0,0 +1,54 @@
+import numpy as np
+
+from agreement import compare_columns, finish_totals, score_file
+from rttm import MERGE_GAP, MIN_DURATION, columns_to_segments, merge_segments, read_rttm, write_rttm
+
+
+def write_random_rttm(path, file_id, count=400, seed=0):
+    """RTTM of overlapping segments of a few speakers, with times in hundredths of a second"""
+    rng = np.random.default_rng(seed)
+    starts = np.round(np.sort(rng.uniform(0, 600, count)), 2)
+    durations = np.round(rng.uniform(0.05, 8, count), 2)
+    speakers = rng.integers(0, 5, count)
+    with open(path, 'w') as f:
+        for start, duration, speaker in zip(starts, durations, speakers):
+            f.write(f"SPEAKER {file_id} 1 {start:.2f} {duration:.2f} <NA> <NA> S{speaker:02d} <NA> <NA>\n")
+
+
+def test_identical_labels_score_exactly_zero(tmp_path):
+    original_path = tmp_path / 'original.rttm'
+    write_random_rttm(original_path, 'f')
+    columns = read_rttm(str(original_path))
+
+    result = finish_totals(compare_columns(columns, columns))
+    assert result['missed'] == 0.0
+    assert result['false_alarm'] == 0.0
+    assert result['confusion'] == 0.0
+    assert result['der'] == 0.0
+
+
+def test_unedited_saved_labels_score_exactly_zero(tmp_path):
+    # Saving without edits writes back the merged segments the editor loaded
+    original_path = tmp_path / 'original.rttm'
+    saved_path = tmp_path / 'saved.rttm'
+    write_random_rttm(original_path, 'f', seed=1)
+    merged = merge_segments(read_rttm(str(original_path)), MERGE_GAP, MIN_DURATION)
+    assert write_rttm(columns_to_segments(merged), str(saved_path), 'f')
+
+    result = finish_totals(score_file((str(original_path), str(saved_path), MERGE_GAP, MIN_DURATION)))
+    assert result['der'] == 0.0
+    assert result['unchanged'] == result['original_segments'] == result['edited_segments']
+
+
+def test_relabeled_segment_counts_as_confusion(tmp_path):
+    original_path = tmp_path / 'original.rttm'
+    original_path.write_text("SPEAKER f 1 0.00 2.00 <NA> <NA> A <NA> <NA>\n"
+                             "SPEAKER f 1 3.00 1.50 <NA> <NA> B <NA> <NA>\n")
+    edited_path = tmp_path / 'edited.rttm'
+    edited_path.write_text("SPEAKER f 1 0.00 2.00 <NA> <NA> A <NA> <NA>\n"
+                           "SPEAKER f 1 3.00 1.50 <NA> <NA> A <NA> <NA>\n")
+
+    result = finish_totals(compare_columns(read_rttm(str(original_path)), read_rttm(str(edited_path))))
+    assert result['confusion'] == 1.5
+    assert result['missed'] == result['false_alarm'] == 0.0
+    assert result['der'] == 100.0 * 1.5 / 3.5
@@ -0,0 +1,145 @@
+import io
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_io import read_wav_segment
+from conftest import CORPUS_SAMPLE_RATE
+
+
+@pytest.fixture
+def wav_path(app_module):
+    return os.path.join(app_module.DEFAULT_AUDIO_DIR, 'cat', 'a.wav')
+
+
+@pytest.fixture
+def wav_bytes(wav_path):
+    with open(wav_path, 'rb') as f:
+        return f.read()
+
+
+def segment_args(start, duration):
+    return {'file_id': 'a', 'rttm_path': 'cat/a.rttm', 'start': f"{start:.3f}", 'duration': f"{duration:.3f}"}
+
+
+# /audio
+
+def test_audio_full_file(client, wav_bytes):
+    response = client.get('/audio/cat/a.wav')
+    assert response.status_code == 200
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Length'] == str(len(wav_bytes))
+    assert response.data == wav_bytes
+
+
+@pytest.mark.parametrize('header,start,stop', [('bytes=0-0', 0, 1), ('bytes=100-4195', 100, 4196),
+                                               ('bytes=-50', -50, None), ('bytes=60000-', 60000, None)])
+def test_audio_ranges(client, wav_bytes, header, start, stop):
+    response = client.get('/audio/cat/a.wav', headers={'Range': header})
+    expected = wav_bytes[start:stop]
+    first = start % len(wav_bytes)
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes {first}-{first + len(expected) - 1}/{len(wav_bytes)}"
+    assert response.headers['Content-Length'] == str(len(expected))
+    assert response.data == expected
+
+
+def test_audio_unsatisfiable_range(client, wav_bytes):
+    response = client.get('/audio/cat/a.wav', headers={'Range': f"bytes={len(wav_bytes)}-"})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(wav_bytes)}"
+
+
+def test_audio_validators(client, wav_bytes):
+    etag = client.get('/audio/cat/a.wav').headers['ETag']
+    assert client.get('/audio/cat/a.wav', headers={'If-None-Match': etag}).status_code == 304
+
+    # If-Range: the range only applies while the file is still the one the client has
+    response = client.get('/audio/cat/a.wav', headers={'Range': 'bytes=10-19', 'If-Range': etag})
+    assert response.status_code == 206 and response.data == wav_bytes[10:20]
+    response = client.get('/audio/cat/a.wav', headers={'Range': 'bytes=10-19', 'If-Range': '"stale"'})
+    assert response.status_code == 200 and response.data == wav_bytes
+
+
+def test_audio_head(client, wav_bytes):
+    response = client.head('/audio/cat/a.wav', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.headers['Content-Length'] == '100'
+
+
+def test_audio_time_window(client, wav_path):
+    response = client.get('/audio/cat/a.wav?t0=1.25&t1=2.5')
+    assert response.status_code == 200
+    samples, sample_rate = sf.read(io.BytesIO(response.data))
+    assert sample_rate == CORPUS_SAMPLE_RATE
+    expected, _ = sf.read(wav_path, start=int(1.25 * CORPUS_SAMPLE_RATE), frames=int(1.25 * CORPUS_SAMPLE_RATE))
+    np.testing.assert_array_equal(samples, expected)
+
+    # Ranges apply to the standalone WAV of the window, header included
+    response = client.get('/audio/cat/a.wav?t0=1.25&t1=2.5', headers={'Range': 'bytes=40-139'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 40-139/{44 + 4 * int(1.25 * CORPUS_SAMPLE_RATE)}"
+    assert response.data == read_wav_segment(wav_path, 1.25, 1.25)[40:140]
+
+
+def test_audio_outside_root(client):
+    assert client.get('/audio/../rttm/cat/a.rttm').status_code == 404
+    assert client.get('/audio/cat/missing.wav').status_code == 404
+
+
+# /stream_segment
+
+def test_stream_segment(client, wav_path):
+    response = client.get('/stream_segment', query_string=segment_args(0.5, 1.0))
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/wav'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.data == read_wav_segment(wav_path, 0.5, 1.0)
+    samples, _ = sf.read(io.BytesIO(response.data))
+    assert len(samples) == CORPUS_SAMPLE_RATE
+
+
+@pytest.mark.parametrize('header,start,stop', [('bytes=0-', 0, None), ('bytes=0-1', 0, 2),
+                                               ('bytes=44-1043', 44, 1044), ('bytes=-100', -100, None)])
+def test_stream_segment_ranges(client, wav_path, header, start, stop):
+    clip = read_wav_segment(wav_path, 1.0, 0.75)
+    # Once extracted and from the cache
+    for _ in range(2):
+        response = client.get('/stream_segment', query_string=segment_args(1.0, 0.75), headers={'Range': header})
+        expected = clip[start:stop]
+        first = start % len(clip)
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == f"bytes {first}-{first + len(expected) - 1}/{len(clip)}"
+        assert response.data == expected
+
+
+def test_stream_segment_unsatisfiable_range(client, wav_path):
+    clip = read_wav_segment(wav_path, 0.0, 0.25)
+    response = client.get('/stream_segment', query_string=segment_args(0.0, 0.25),
+                          headers={'Range': f"bytes={len(clip)}-"})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(clip)}"
+
+
+def test_stream_segment_too_large_to_cache(client, app_module, wav_path, monkeypatch):
+    # Clips over the cache's item limit are served straight from the source file
+    monkeypatch.setattr(app_module.segment_cache, 'max_item_bytes', 1000)
+    clip = read_wav_segment(wav_path, 2.125, 1.5)
+
+    response = client.get('/stream_segment', query_string=segment_args(2.125, 1.5))
+    assert response.status_code == 200
+    assert response.data == clip
+    assert not app_module.segment_cache.contains(app_module.segment_cache.make_key(wav_path, 2.125, 1.5))
+
+    response = client.get('/stream_segment', query_string=segment_args(2.125, 1.5), headers={'Range': 'bytes=30-99'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 30-99/{len(clip)}"
+    assert response.data == clip[30:100]
+
+
+def test_stream_segment_errors(client):
+    assert client.get('/stream_segment', query_string={'file_id': 'a', 'start': '1.0'}).status_code == 400
+    response = client.get('/stream_segment', query_string={'file_id': 'missing', 'start': '0', 'duration': '1'})
+    assert response.status_code == 404
@@ -0,0 +1,154 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_io import (make_wav_header, read_wav_header, read_wav_segment, read_wav_segments, segment_byte_range,
+                      stream_wav_segment, wav_duration)
+
+SAMPLE_RATE = 8000
+
+
+def write_wav(path, frames=SAMPLE_RATE * 3, channels=1, subtype='PCM_16', sample_rate=SAMPLE_RATE, seed=0):
+    """Random audio written by soundfile; returns the samples as soundfile reads them back"""
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(-0.9, 0.9, (frames, channels))
+    sf.write(str(path), data, sample_rate, subtype=subtype, format='WAV')
+    return sf.read(str(path), always_2d=True)[0]
+
+
+def build_wav(samples, channels=1, sample_rate=SAMPLE_RATE, data_size=None, extra_chunk=None, trailing=b''):
+    """
+    16-bit PCM WAV assembled by hand: an optional chunk before 'data' (odd sizes get a pad
+    byte), the data chunk size field set to `data_size` (the true size if None) and
+    `trailing` bytes after the samples.
+    """
+    payload = np.asarray(samples, dtype='<i2').tobytes()
+    fmt = struct.pack('<HHIIHH', 1, channels, sample_rate, sample_rate * 2 * channels, 2 * channels, 16)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+    if extra_chunk is not None:
+        chunk_id, chunk_data = extra_chunk
+        body += chunk_id + struct.pack('<I', len(chunk_data)) + chunk_data + (b'\0' if len(chunk_data) % 2 else b'')
+    body += b'data' + struct.pack('<I', len(payload) if data_size is None else data_size) + payload + trailing
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def reference_clip(path, start_time, duration):
+    """Samples of a window read with soundfile, frames rounded the way segment_byte_range does"""
+    info = sf.info(str(path))
+    start = min(max(int(start_time * info.samplerate), 0), info.frames)
+    frames = max(int(duration * info.samplerate), 0)
+    return sf.read(str(path), start=start, frames=frames, always_2d=True)[0]
+
+
+def decode(clip):
+    return sf.read(io.BytesIO(clip), always_2d=True)
+
+
+WINDOWS = [(0.0, 0.5), (0.1234, 0.0101), (1.0, 0.0), (2.9, 1.0), (2.99999, 0.3), (5.0, 1.0), (-1.0, 0.25), (0.7, 2.0)]
+
+
+@pytest.mark.parametrize('subtype,channels', [('PCM_16', 1), ('PCM_16', 2), ('PCM_24', 1), ('PCM_32', 2),
+                                              ('FLOAT', 1), ('PCM_U8', 1)])
+def test_segments_match_soundfile(tmp_path, subtype, channels):
+    path = tmp_path / 'a.wav'
+    write_wav(path, channels=channels, subtype=subtype)
+    info = read_wav_header(str(path))
+    assert info is not None
+    assert wav_duration(info) == sf.info(str(path)).duration
+
+    for start_time, duration in WINDOWS:
+        clip = read_wav_segment(str(path), start_time, duration)
+        samples, sample_rate = decode(clip)
+        assert sample_rate == SAMPLE_RATE
+        np.testing.assert_array_equal(samples, reference_clip(path, start_time, duration))
+        # The clip's header describes exactly the bytes that follow it
+        assert len(clip) == 44 + segment_byte_range(info, start_time, duration)[1]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1001, 4096])
+def test_streaming_in_odd_chunk_sizes(tmp_path, chunk_size):
+    path = tmp_path / 'a.wav'
+    write_wav(path, channels=2, subtype='PCM_24')
+    info = read_wav_header(str(path))
+    expected = read_wav_segment(str(path), 0.3, 0.77)
+    chunks = list(stream_wav_segment(str(path), info, 0.3, 0.77, chunk_size=chunk_size))
+    assert all(len(chunk) <= chunk_size for chunk in chunks[1:])
+    assert b''.join(chunks) == expected
+
+
+def test_chunk_before_data_with_pad_byte(tmp_path):
+    samples = np.arange(-500, 500, dtype=np.int16)
+    path = tmp_path / 'a.wav'
+    path.write_bytes(build_wav(samples, extra_chunk=(b'LIST', b'odd'), trailing=b'junk'))
+    info = read_wav_header(str(path))
+    # 12 (RIFF) + 24 (fmt) + 12 (LIST, padded) + 8 (data header)
+    assert info.data_offset == 56
+    assert info.data_size == 2 * len(samples)
+
+    clip, _ = decode(read_wav_segment(str(path), 0.01, 0.02))
+    np.testing.assert_array_equal(clip[:, 0], samples[80:240] / 32768.0)
+
+
+@pytest.mark.parametrize('data_size', [0, 0xFFFFFFFF])
+def test_unset_data_size(tmp_path, data_size):
+    # Streaming writers leave the size unset; the data runs to the end of the file, minus a partial frame
+    samples = np.arange(2 * 1000, dtype=np.int16).reshape(-1, 2)
+    path = tmp_path / 'a.wav'
+    path.write_bytes(build_wav(samples, channels=2, data_size=data_size, trailing=b'\x01'))
+    info = read_wav_header(str(path))
+    assert info.data_size == samples.nbytes
+
+    clip, _ = decode(read_wav_segment(str(path), 0.05, 10.0))
+    np.testing.assert_array_equal(clip, samples[400:] / 32768.0)
+    assert segment_byte_range(info, 0.0, None) == (info.data_offset, samples.nbytes)
+
+
+def test_byte_range_clamps_to_data(tmp_path):
+    path = tmp_path / 'a.wav'
+    write_wav(path, frames=1000, channels=2)
+    info = read_wav_header(str(path))
+    assert segment_byte_range(info, -1.0, 0.01) == (info.data_offset, 80 * 4)
+    assert segment_byte_range(info, 10.0, 1.0) == (info.data_offset + 1000 * 4, 0)
+    assert segment_byte_range(info, 0.1, 1.0) == (info.data_offset + 800 * 4, 200 * 4)
+    assert segment_byte_range(info, 0.0, -1.0)[1] == 0
+
+
+def test_make_wav_header_round_trips(tmp_path):
+    path = tmp_path / 'a.wav'
+    write_wav(path, channels=2, subtype='PCM_24')
+    info = read_wav_header(str(path))
+    header = make_wav_header(info, 6 * 10)
+    assert len(header) == 44
+    fake = tmp_path / 'b.wav'
+    fake.write_bytes(header + bytes(60))
+    assert read_wav_header(str(fake))._replace(data_offset=0) == info._replace(data_offset=0, data_size=60)
+
+
+@pytest.mark.parametrize('max_gap_bytes,max_span_bytes', [(0, 1), (1, 100), (256 * 1024, 16 * 1024 * 1024),
+                                                          (10 ** 9, 3000)])
+def test_batch_matches_single_reads(tmp_path, max_gap_bytes, max_span_bytes):
+    path = tmp_path / 'a.wav'
+    write_wav(path, channels=2)
+    rng = np.random.default_rng(1)
+    # Overlapping, nested, repeated, out-of-order, empty and out-of-range windows
+    windows = [(round(float(start), 3), round(float(duration), 3))
+               for start, duration in zip(rng.uniform(-0.5, 3.5, 300), rng.uniform(0, 0.6, 300))]
+    windows += [(1.0, 0.5), (1.1, 0.1), (1.0, 0.5), (0.0, 0.0), (2.5, 5.0)] + WINDOWS
+
+    clips = read_wav_segments(str(path), windows, max_gap_bytes=max_gap_bytes, max_span_bytes=max_span_bytes)
+    assert clips == [read_wav_segment(str(path), start_time, duration) for start_time, duration in windows]
+
+
+def test_non_pcm_falls_back_to_soundfile(tmp_path):
+    path = tmp_path / 'a.flac'
+    data = np.random.default_rng(2).uniform(-0.5, 0.5, SAMPLE_RATE * 2)
+    sf.write(str(path), data, SAMPLE_RATE, subtype='PCM_16', format='FLAC')
+    assert read_wav_header(str(path)) is None
+
+    windows = [(0.25, 0.5), (1.9, 1.0)]
+    for clip, (start_time, duration) in zip(read_wav_segments(str(path), windows), windows):
+        samples, _ = decode(clip)
+        np.testing.assert_array_equal(samples, reference_clip(path, start_time, duration))
@@ -0,0 +1,142 @@
+import json
+import os
+
+import pytest
+
+import label_store
+from label_store import LabelStore, VersionConflict, apply_ops
+
+
+def segment(start_time, duration, speaker_id='A'):
+    return {'start_time': start_time, 'duration': duration, 'speaker_id': speaker_id}
+
+
+def spans(segments):
+    return [(s['start_time'], s['duration'], s['speaker_id']) for s in segments]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LabelStore(str(tmp_path / 'f'), 'f')
+
+
+def test_save_and_reload(store):
+    version, segments = store.save([{'op': 'replace', 'segments': [segment(2.0, 1.0), segment(0.0, 1.0, 'B')]}])
+    assert version == 1
+    assert spans(segments) == [(0.0, 1.0, 'B'), (2.0, 1.0, 'A')]
+
+    version, segments = store.save([{'op': 'update', 'index': 0, 'segment': segment(0.5, 1.0, 'B')},
+                                    {'op': 'insert', 'segment': segment(5.0, 0.5)}], base_version=1)
+    assert version == 2
+    assert spans(segments) == [(0.5, 1.0, 'B'), (2.0, 1.0, 'A'), (5.0, 0.5, 'A')]
+
+    reopened = LabelStore(store.output_dir, 'f')
+    assert reopened.current_version() == 2
+    assert reopened.current_segments() == segments
+    assert spans(reopened.load_version(1)) == [(0.0, 1.0, 'B'), (2.0, 1.0, 'A')]
+    with open(store.rttm_path) as f:
+        assert len(f.read().splitlines()) == 3
+
+
+def test_version_conflict(store):
+    store.save([{'op': 'insert', 'segment': segment(0.0, 1.0)}])
+    store.save([{'op': 'insert', 'segment': segment(2.0, 1.0)}], base_version=1)
+    with pytest.raises(VersionConflict) as excinfo:
+        store.save([{'op': 'delete', 'index': 0}], base_version=1)
+    assert excinfo.value.current_version == 2
+    # The rejected save left nothing behind
+    assert store.current_version() == 2
+    assert len(store.current_segments()) == 2
+    assert len(store.journal()) == 2
+
+
+def test_out_of_range_index_is_rejected(store):
+    store.save([{'op': 'insert', 'segment': segment(0.0, 1.0)}])
+    with pytest.raises(ValueError):
+        store.save([{'op': 'delete', 'index': 5}], base_version=1)
+    with pytest.raises(ValueError):
+        apply_ops([], [{'op': 'update', 'index': -1, 'segment': segment(0.0, 1.0)}], 'f')
+    assert store.current_version() == 1
+
+
+def test_torn_journal_line_is_dropped(store):
+    store.save([{'op': 'insert', 'segment': segment(0.0, 1.0)}])
+    store.save([{'op': 'insert', 'segment': segment(2.0, 1.0)}])
+    intact_size = os.path.getsize(store.journal_path)
+    # A crash in the middle of appending version 3
+    with open(store.journal_path, 'a') as f:
+        f.write('{"version": 3, "base_version": 2, "ops": [{"op": "ins')
+
+    reopened = LabelStore(store.output_dir, 'f')
+    assert reopened.current_version() == 2
+    assert spans(reopened.load_version()) == [(0.0, 1.0, 'A'), (2.0, 1.0, 'A')]
+
+    # The next save truncates the torn line instead of gluing its entry onto it
+    version, segments = reopened.save([{'op': 'insert', 'segment': segment(4.0, 1.0)}], base_version=2)
+    assert version == 3
+    entries, good_size = LabelStore._read_journal(reopened.journal_path)
+    assert [entry['version'] for entry in entries] == [1, 2, 3]
+    assert good_size == os.path.getsize(reopened.journal_path) > intact_size
+    assert spans(LabelStore(store.output_dir, 'f').load_version()) == spans(segments)
+
+
+def test_complete_line_without_newline_counts_as_torn(store):
+    store.save([{'op': 'insert', 'segment': segment(0.0, 1.0)}])
+    with open(store.journal_path, 'a') as f:
+        f.write(json.dumps({'version': 2, 'base_version': 1, 'timestamp': 0, 'ops': []}))
+    assert [entry['version'] for entry in store.journal()] == [1]
+
+
+def test_snapshot_rotation(store, monkeypatch):
+    monkeypatch.setattr(label_store, 'SNAPSHOT_INTERVAL', 3)
+    for i in range(7):
+        store.save([{'op': 'insert', 'segment': segment(float(i), 0.5)}])
+
+    # Snapshots at 3 and 6 (plus version 0), each rotating the journal out
+    assert store._snapshot_versions() == [0, 3, 6]
+    assert store._archive_versions() == [3, 6]
+    assert [entry['version'] for entry in store.journal()] == [7]
+    assert store.current_version() == 7
+
+    # Every version replays from the nearest snapshot and the rotated journals
+    reopened = LabelStore(store.output_dir, 'f')
+    for version in range(8):
+        assert [s['start_time'] for s in reopened.load_version(version)] == [float(i) for i in range(version)]
+    assert [v['version'] for v in reopened.versions()] == list(range(1, 8))
+
+
+def test_rotation_right_after_snapshot(store, monkeypatch):
+    monkeypatch.setattr(label_store, 'SNAPSHOT_INTERVAL', 2)
+    store.save([{'op': 'insert', 'segment': segment(0.0, 0.5)}])
+    store.save([{'op': 'insert', 'segment': segment(1.0, 0.5)}])
+    # The live journal is gone until the next save; the version comes from the snapshot
+    assert not os.path.exists(store.journal_path)
+    reopened = LabelStore(store.output_dir, 'f')
+    assert reopened.current_version() == 2
+    assert reopened.save([], base_version=2)[0] == 2
+
+
+def test_legacy_labels_become_version_zero(tmp_path):
+    output_dir = tmp_path / 'f'
+    output_dir.mkdir()
+    (output_dir / 'f.rttm').write_text("SPEAKER f 1 1.00 2.00 <NA> <NA> A <NA> <NA>\n")
+    store = LabelStore(str(output_dir), 'f')
+
+    version, segments = store.save([{'op': 'insert', 'segment': segment(4.0, 1.0, 'B')}], base_version=0)
+    assert version == 1
+    assert spans(segments) == [(1.0, 2.0, 'A'), (4.0, 1.0, 'B')]
+    assert spans(store.load_version(0)) == [(1.0, 2.0, 'A')]
+
+
+def test_materialized_files_rebuilt_after_crash(store):
+    store.save([{'op': 'insert', 'segment': segment(0.0, 1.0)}])
+    # Crash after the journal append but before the materialized files were written
+    entry = {'version': 2, 'base_version': 1, 'timestamp': 0, 'ops': [{'op': 'insert', 'segment': segment(3.0, 1.0)}]}
+    with open(store.journal_path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+    assert store.current_version() == 2
+    assert spans(store.current_segments()) == [(0.0, 1.0, 'A'), (3.0, 1.0, 'A')]
+    store.save([])
+    with open(store.json_path) as f:
+        assert spans(json.load(f)) == [(0.0, 1.0, 'A'), (3.0, 1.0, 'A')]
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from rttm import RttmParseError, columns_to_segments, format_rttm, merge_segments, parse_rttm, read_rttm
+
+
+def baseline_parse_rttm(rttm_path):
+    """The line-by-line parser and merge the columnar engine replaced, kept as the reference"""
+    raw_segments = []
+    with open(rttm_path, 'r') as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) >= 8 and parts[0] == "SPEAKER":
+                start_time = float(parts[3])
+                duration = float(parts[4])
+                raw_segments.append({
+                    'file_id': parts[1],
+                    'start_time': start_time,
+                    'duration': duration,
+                    'end_time': start_time + duration,
+                    'speaker_id': parts[7]
+                })
+    raw_segments.sort(key=lambda x: x['start_time'])
+
+    merged_segments = []
+    if not raw_segments:
+        return merged_segments
+    current_segment = raw_segments[0].copy()
+    for next_segment in raw_segments[1:]:
+        if (next_segment['speaker_id'] == current_segment['speaker_id'] and
+                next_segment['start_time'] - current_segment['end_time'] <= 0.5):
+            current_segment['end_time'] = next_segment['end_time']
+            current_segment['duration'] = current_segment['end_time'] - current_segment['start_time']
+        else:
+            merged_segments.append(current_segment)
+            current_segment = next_segment.copy()
+    merged_segments.append(current_segment)
+    return merged_segments
+
+
+def random_rttm_text(file_id, count, seed, speakers=4):
+    """SPEAKER lines with overlaps, repeated start times and gaps on both sides of the merge threshold"""
+    rng = np.random.default_rng(seed)
+    starts = np.round(rng.uniform(0, 120, count), 2)
+    # Some segments share a start time, so the merge depends on a stable sort
+    starts[rng.integers(0, count, count // 10)] = starts[0]
+    durations = np.round(rng.uniform(0.01, 3, count), 2)
+    speaker_ids = [f"spk{code}" for code in rng.integers(0, speakers, count)]
+    return format_rttm(file_id, starts, durations, speaker_ids)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_parse_matches_baseline(tmp_path, seed):
+    path = tmp_path / 'file.rttm'
+    path.write_text(random_rttm_text('file', 2000, seed))
+    assert parse_rttm(str(path)) == baseline_parse_rttm(str(path))
+
+
+def test_irregular_lines_match_baseline(tmp_path):
+    # Comments, blank lines, other record types, short lines, extra fields, tabs and no trailing newline
+    # all take the line-by-line path
+    path = tmp_path / 'file.rttm'
+    path.write_text(";; comment\n"
+                    "\n"
+                    "SPEAKER f 1 1.00 2.00 <NA> <NA> A <NA> <NA>\n"
+                    "SPKR-INFO f 1 <NA> <NA> <NA> unknown A <NA> <NA>\n"
+                    "SPEAKER f 1 0.50 0.25 <NA> <NA>\n"
+                    "SPEAKER\tf\t1\t3.40\t1.00\t<NA>\t<NA>\tA\t<NA>\t<NA>\textra\n"
+                    "SPEAKER f 1 0.00 0.30 <NA> <NA> B\n"
+                    "SPEAKER f 1 9.00 1.00 <NA> <NA> B <NA> <NA>")
+    segments = parse_rttm(str(path))
+    assert segments == baseline_parse_rttm(str(path))
+    assert [(s['speaker_id'], s['start_time'], s['end_time']) for s in segments] == [
+        ('B', 0.0, 0.3), ('A', 1.0, 4.4), ('B', 9.0, 10.0)]
+
+
+def test_gap_equal_to_threshold_merges(tmp_path):
+    path = tmp_path / 'file.rttm'
+    path.write_text("SPEAKER f 1 0.00 1.00 <NA> <NA> A <NA> <NA>\n"
+                    "SPEAKER f 1 1.50 1.00 <NA> <NA> A <NA> <NA>\n"
+                    "SPEAKER f 1 3.01 1.00 <NA> <NA> A <NA> <NA>\n")
+    merged = merge_segments(read_rttm(str(path)))
+    assert merged['start'].tolist() == [0.0, 3.01]
+    assert merged['duration'].tolist() == [2.5, 1.0]
+    assert parse_rttm(str(path)) == baseline_parse_rttm(str(path))
+
+
+def test_merge_policy(tmp_path):
+    path = tmp_path / 'file.rttm'
+    path.write_text("SPEAKER f 1 0.00 1.00 <NA> <NA> A <NA> <NA>\n"
+                    "SPEAKER f 1 1.20 0.05 <NA> <NA> A <NA> <NA>\n"
+                    "SPEAKER f 1 2.00 0.10 <NA> <NA> B <NA> <NA>\n")
+    columns = read_rttm(str(path))
+
+    # No merging: every segment stays, slivers included
+    unmerged = columns_to_segments(merge_segments(columns, merge_gap=-1))
+    assert [s['duration'] for s in unmerged] == [1.0, 0.05, 0.1]
+
+    # Merging joins the A segments; the B sliver is dropped by min_duration
+    merged = columns_to_segments(merge_segments(columns, merge_gap=0.5, min_duration=0.2))
+    assert [(s['speaker_id'], s['start_time'], s['end_time']) for s in merged] == [('A', 0.0, 1.25)]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'file.rttm'
+    path.write_text("")
+    columns = read_rttm(str(path))
+    assert len(columns['start']) == 0 and columns['speakers'] == []
+    assert parse_rttm(str(path)) == baseline_parse_rttm(str(path)) == []
+
+
+def test_malformed_times_raise(tmp_path):
+    path = tmp_path / 'file.rttm'
+    path.write_text("SPEAKER f 1 zero 1.00 <NA> <NA> A <NA> <NA>\n")
+    with pytest.raises(RttmParseError):
+        read_rttm(str(path))
+    # parse_rttm keeps the old contract of logging and returning no segments
+    assert parse_rttm(str(path)) == []
+
+
+def test_invalid_text_raises(tmp_path):
+    path = tmp_path / 'file.rttm'
+    path.write_bytes(b"SPEAKER f 1 0.00 1.00 <NA> <NA> \xff\xfe <NA> <NA>\n")
+    with pytest.raises(RttmParseError):
+        read_rttm(str(path))
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from work_queue import QueueFull, WorkQueue
+
+
+@pytest.fixture
+def gate():
+    """Event that blocked jobs wait on; set at teardown so no worker thread is left hanging"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def test_saturation_raises_queue_full(gate):
+    queue = WorkQueue('test', workers=1, max_pending=2, retry_after=3)
+    first = queue.submit('a', gate.wait)
+    queue.submit('b', gate.wait)
+    with pytest.raises(QueueFull) as excinfo:
+        queue.submit('c', gate.wait)
+    assert excinfo.value.retry_after == 3
+    assert queue.stats()['rejected'] == 1
+    assert queue.stats()['pending'] == 2
+
+    # Identical work joins the in-flight job even when the queue is full
+    assert queue.submit('a', gate.wait) is first
+    assert queue.stats()['coalesced'] == 1
+
+    gate.set()
+    assert queue.wait(first, timeout=5) is True
+    assert queue.run('c', lambda: 'done', timeout=5) == 'done'
+
+
+def test_slow_job_counts_as_saturation(gate):
+    queue = WorkQueue('test', workers=1, max_pending=4)
+    queue.submit('blocker', gate.wait)
+    with pytest.raises(QueueFull):
+        queue.run('behind', lambda: 'late', timeout=0.05)
+
+
+def test_failed_job_frees_its_slot():
+    queue = WorkQueue('test', workers=1, max_pending=1)
+
+    def fail():
+        raise ValueError('broken file')
+
+    with pytest.raises(ValueError):
+        queue.run('x', fail, timeout=5)
+    assert queue.run('x', lambda: 'ok', timeout=5) == 'ok'
+    stats = queue.stats()
+    assert stats['failed'] == 1 and stats['pending'] == 0
+
+
+@pytest.fixture
+def saturated(app_module, monkeypatch, gate):
+    """The app's audio queue replaced by one whose only slot is taken by a blocked job"""
+    queue = WorkQueue('audio', workers=1, max_pending=1, retry_after=2)
+    queue.submit('blocker', gate.wait)
+    monkeypatch.setattr(app_module, 'audio_work', queue)
+    return queue
+
+
+@pytest.mark.parametrize('method,url,body', [
+    ('get', '/stream_segment?file_id=a&rttm_path=cat/a.rttm&start=0.333&duration=0.5', None),
+    ('get', '/audio/cat/a.wav?t0=0.5&t1=1', None),
+    ('get', '/spectrogram?file_id=a&rttm_path=cat/a.rttm', None),
+    ('get', '/analyze_rttm?rttm_file=cat/a.rttm', None),
+    ('post', '/get_segments_batch', {'files': [{'file_id': 'a', 'rttm_path': 'cat/a.rttm', 'segments': [[0.1, 0.2]]}]}),
+])
+def test_saturated_audio_queue_answers_503(client, saturated, gate, method, url, body):
+    response = getattr(client, method)(url, json=body)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    assert 'queue is full' in response.get_json()['error']
+
+    gate.set()
+    response = getattr(client, method)(url, json=body)
+    assert response.status_code == 200
+
+
+def test_audio_job_timeout_answers_503(client, app_module, monkeypatch, gate):
+    # Room in the queue, but the only worker is stuck: the request gives up after AUDIO_JOB_TIMEOUT
+    queue = WorkQueue('audio', workers=1, max_pending=4)
+    queue.submit('blocker', gate.wait)
+    monkeypatch.setattr(app_module, 'audio_work', queue)
+    monkeypatch.setattr(app_module, 'AUDIO_JOB_TIMEOUT', 0.05)
+    response = client.get('/stream_segment?file_id=a&rttm_path=cat/a.rttm&start=1.777&duration=0.5')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+from audio_io import read_wav_header, WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT
+
+logger = logging.getLogger(__name__)
+
+# Samples per peak at the finest level, and the reduction factor between levels
+BASE_BLOCK = 256
+LEVEL_FACTOR = 4
+# Stop adding coarser levels once a level has at most this many peaks
+MIN_LEVEL_PEAKS = 256
+# Number of blocks reduced per memory-mapped chunk
+BLOCKS_PER_CHUNK = 4096
+# Number of pyramids kept in memory
+MEMORY_CACHE_SIZE = 8
+
+PEAKS_FILE_SUFFIX = '.peaks.npz'
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def pcm_dtype(info):
+    """NumPy dtype and full-scale value for samples we can memory-map, or (None, None)"""
+    if info.format_tag == WAVE_FORMAT_PCM:
+        if info.bits_per_sample == 8:
+            return np.dtype('u1'), 128.0
+        if info.bits_per_sample == 16:
+            return np.dtype('<i2'), 32768.0
+        if info.bits_per_sample == 32:
+            return np.dtype('<i4'), 2147483648.0
+    elif info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if info.bits_per_sample == 32:
+            return np.dtype('<f4'), 1.0
+        if info.bits_per_sample == 64:
+            return np.dtype('<f8'), 1.0
+    return None, None
+
+
+def _reduce_blocks(samples, block):
+    """Min/max of each `block` consecutive frames (all channels), padding the tail with edge values"""
+    frames = samples.shape[0]
+    n_blocks = -(-frames // block)
+    pad = n_blocks * block - frames
+    if pad:
+        samples = np.concatenate([samples, np.repeat(samples[-1:], pad, axis=0)])
+    blocks = samples.reshape(n_blocks, block * samples.shape[1])
+    return blocks.min(axis=1), blocks.max(axis=1)
+
+
+def compute_peak_pyramid(audio_path):
+    """
+    Compute min/max peak envelopes at several resolutions.
+    Returns a dict with 'sample_rate', 'frames', 'base_block', 'factor', 'mins' and 'maxs' (lists per level,
+    finest first, values normalised to [-1, 1] as float32).
+    """
+    info = read_wav_header(audio_path)
+    dtype, full_scale = pcm_dtype(info) if info is not None else (None, None)
+
+    mins, maxs = [], []
+    frames = 0
+    if dtype is not None:
+        frames = info.data_size // info.block_align
+        sample_rate = info.sample_rate
+        data = np.memmap(audio_path, dtype=dtype, mode='r', offset=info.data_offset,
+                         shape=(frames, info.channels))
+        chunk_frames = BASE_BLOCK * BLOCKS_PER_CHUNK
+        for start in range(0, frames, chunk_frames):
+            chunk = np.asarray(data[start:start + chunk_frames])
+            lo, hi = _reduce_blocks(chunk, BASE_BLOCK)
+            mins.append(lo)
+            maxs.append(hi)
+        del data
+    else:
+        # Formats we cannot map directly are decoded block by block
+        with sf.SoundFile(audio_path) as src:
+            sample_rate = src.samplerate
+            frames = src.frames
+            for chunk in src.blocks(blocksize=BASE_BLOCK * BLOCKS_PER_CHUNK, dtype='float32', always_2d=True):
+                lo, hi = _reduce_blocks(chunk, BASE_BLOCK)
+                mins.append(lo)
+                maxs.append(hi)
+        dtype, full_scale = np.dtype('float32'), 1.0
+
+    if mins:
+        level_min = np.concatenate(mins).astype(np.float32)
+        level_max = np.concatenate(maxs).astype(np.float32)
+    else:
+        level_min = level_max = np.zeros(0, dtype=np.float32)
+    if dtype == np.dtype('u1'):
+        level_min -= 128.0
+        level_max -= 128.0
+    level_min /= full_scale
+    level_max /= full_scale
+
+    pyramid_mins, pyramid_maxs = [level_min], [level_max]
+    while len(pyramid_mins[-1]) > MIN_LEVEL_PEAKS:
+        lo, _ = _reduce_blocks(pyramid_mins[-1][:, None], LEVEL_FACTOR)
+        _, hi = _reduce_blocks(pyramid_maxs[-1][:, None], LEVEL_FACTOR)
+        pyramid_mins.append(lo)
+        pyramid_maxs.append(hi)
+
+    return {
+        'sample_rate': sample_rate,
+        'frames': frames,
+        'base_block': BASE_BLOCK,
+        'factor': LEVEL_FACTOR,
+        'mins': pyramid_mins,
+        'maxs': pyramid_maxs,
+    }
+
+
+def _save_pyramid(cache_path, pyramid, audio_mtime_ns):
+    arrays = {
+        'meta': np.array([audio_mtime_ns, pyramid['sample_rate'], pyramid['frames'],
+                          pyramid['base_block'], pyramid['factor']],
+                         dtype=np.int64),
+    }
+    for level, (lo, hi) in enumerate(zip(pyramid['mins'], pyramid['maxs'])):
+        arrays[f'min_{level}'] = lo
+        arrays[f'max_{level}'] = hi
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, cache_path)
+
+
+def _load_pyramid(cache_path, audio_mtime_ns):
+    """Load a cached pyramid, or None if missing or built from a different version of the audio"""
+    try:
+        with np.load(cache_path) as cached:
+            meta = cached['meta']
+            if int(meta[0]) != audio_mtime_ns:
+                return None
+            levels = sum(1 for name in cached.files if name.startswith('min_'))
+            return {
+                'sample_rate': int(meta[1]),
+                'frames': int(meta[2]),
+                'base_block': int(meta[3]),
+                'factor': int(meta[4]),
+                'mins': [cached[f'min_{level}'] for level in range(levels)],
+                'maxs': [cached[f'max_{level}'] for level in range(levels)],
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def peak_cache_path(cache_dir, audio_path):
+    """Where the on-disk pyramid for `audio_path` lives under `cache_dir` (one file per source path)"""
+    key = hashlib.sha1(os.path.abspath(audio_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}{PEAKS_FILE_SUFFIX}")
+
+
+def peek_peak_pyramid(audio_path):
+    """Peak pyramid for an audio file if it is already in memory, else None (no disk access beyond a stat)"""
+    key = (os.path.abspath(audio_path), os.stat(audio_path).st_mtime_ns)
+    with _memory_lock:
+        pyramid = _memory_cache.get(key)
+        if pyramid is not None:
+            _memory_cache.move_to_end(key)
+        return pyramid
+
+
+def get_peak_pyramid(audio_path, cache_path):
+    """Peak pyramid for an audio file, from memory, the on-disk cache, or freshly computed"""
+    audio_mtime_ns = os.stat(audio_path).st_mtime_ns
+    key = (os.path.abspath(audio_path), audio_mtime_ns)
+    with _memory_lock:
+        pyramid = _memory_cache.get(key)
+        if pyramid is not None:
+            _memory_cache.move_to_end(key)
+            return pyramid
+
+    pyramid = _load_pyramid(cache_path, audio_mtime_ns)
+    if pyramid is None:
+        pyramid = compute_peak_pyramid(audio_path)
+        try:
+            _save_pyramid(cache_path, pyramid, audio_mtime_ns)
+        except OSError as e:
+            logger.error(f"Error writing peak cache {cache_path}: {str(e)}")
+
+    with _memory_lock:
+        _memory_cache[key] = pyramid
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return pyramid
+
+
+def select_level(pyramid, t0, t1, width):
+    """Coarsest level that still gives at least `width` peaks for the window [t0, t1]"""
+    samples_per_pixel = max((t1 - t0) * pyramid['sample_rate'] / max(width, 1), 1)
+    level = 0
+    block = pyramid['base_block']
+    while level + 1 < len(pyramid['mins']) and block * pyramid['factor'] <= samples_per_pixel:
+        block *= pyramid['factor']
+        level += 1
+    return level
+
+
+def peaks_window(pyramid, level, t0=0.0, t1=None):
+    """Min/max peaks of one level covering [t0, t1] seconds"""
+    level = min(max(level, 0), len(pyramid['mins']) - 1)
+    block = pyramid['base_block'] * pyramid['factor'] ** level
+    seconds_per_peak = block / float(pyramid['sample_rate'])
+    lo = pyramid['mins'][level]
+    hi = pyramid['maxs'][level]
+
+    first = max(int(t0 / seconds_per_peak), 0)
+    last = len(lo) if t1 is None else min(int(np.ceil(t1 / seconds_per_peak)), len(lo))
+    last = max(last, first)
+    return {
+        'level': level,
+        'levels': len(pyramid['mins']),
+        'sample_rate': pyramid['sample_rate'],
+        'samples_per_peak': block,
+        'seconds_per_peak': seconds_per_peak,
+        'start_time': first * seconds_per_peak,
+        'duration': pyramid['frames'] / float(pyramid['sample_rate']),
+        'min': np.round(lo[first:last], 4).tolist(),
+        'max': np.round(hi[first:last], 4).tolist(),
+    }
@@ -0,0 +1,92 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the shared audio work queue
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 64
+DEFAULT_RETRY_AFTER = 1
+
+
+class QueueFull(Exception):
+    """Raised when the queue is saturated; callers should answer 503 with Retry-After"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WorkQueue:
+    """
+    Bounded executor for heavy I/O work (audio extraction, header probing, peak building).
+
+    At most `workers` jobs run at once and at most `max_pending` are queued or running;
+    beyond that, submit() raises QueueFull instead of letting requests pile up. Jobs are
+    keyed, and a job submitted while an identical one is in flight shares its future
+    instead of running again.
+    """
+
+    def __init__(self, name, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 retry_after=DEFAULT_RETRY_AFTER):
+        self.name = name
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+        self.workers = workers
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, key, fn, *args):
+        """Future for fn(*args), shared with an in-flight job of the same key if there is one"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(self.name, self.retry_after)
+            future = self._executor.submit(fn, *args)
+            self._in_flight[key] = future
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._finished(key, f))
+        return future
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if future.exception() is not None:
+                self.failed += 1
+
+    def wait(self, future, timeout=None):
+        """Result of a future from submit(); waiting longer than `timeout` seconds counts as saturation (QueueFull)"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            logger.warning(f"{self.name} job did not finish within {timeout}s")
+            raise QueueFull(self.name, self.retry_after)
+
+    def run(self, key, fn, *args, timeout=None):
+        """Run fn(*args) on the queue and wait for its result"""
+        return self.wait(self.submit(key, fn, *args), timeout)
+
+    def stats(self):
+        """Counters and current depth for monitoring"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._in_flight),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }
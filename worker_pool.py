@@ -0,0 +1,21 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Chunks handed to each worker: a few per worker balances load without paying per-task IPC
+CHUNKS_PER_WORKER = 8
+
+# Upper bound on tasks per chunk, so a slow chunk doesn't hold up the end of a run
+MAX_CHUNKSIZE = 64
+
+
+def chunk_size(task_count, workers):
+    """Tasks to hand a pool worker at a time for `task_count` tasks spread over `workers`"""
+    return max(1, min(MAX_CHUNKSIZE, task_count // (max(1, workers) * CHUNKS_PER_WORKER)))
+
+
+def spawn_executor(workers):
+    """
+    Process pool for the web app's background work. Workers are spawned, so they start
+    clean instead of inheriting the web server's threads and locks.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))